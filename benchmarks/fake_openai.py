@@ -0,0 +1,103 @@
+"""
+Fake OpenAI API for trying the AI texts of the BreakTools Deadline Web App backend.
+
+It answers streaming chat completion requests with a fixed text, sent word by
+word after a configurable delay, and counts how many requests it got. Point the
+backend at it by setting OPENAI_API_BASE to http://127.0.0.1:<port>/v1 and
+OPENAI_API_KEY to anything.
+
+Run it on its own with: python benchmarks/fake_openai.py --delay 2
+"""
+
+import argparse
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from time import sleep
+
+FAKE_TEXT = "This job looks like it ran into a missing texture on a few frames."
+
+
+class fake_openai:
+    """Class for keeping track of the requests the fake OpenAI API got."""
+
+    def __init__(self, delay: float = 1.0) -> None:
+        self.delay = delay
+        self.request_count = 0
+        self.lock = threading.Lock()
+
+    def count_request(self) -> None:
+        """This function counts a chat completion request."""
+        with self.lock:
+            self.request_count += 1
+
+
+def get_chunk(content: str | None) -> bytes:
+    """This function returns a single server-sent event with a completion chunk."""
+    delta = {} if content is None else {"content": content}
+    chunk = {
+        "id": "chatcmpl-fake",
+        "object": "chat.completion.chunk",
+        "model": "fake",
+        "choices": [
+            {
+                "index": 0,
+                "delta": delta,
+                "finish_reason": None if content is not None else "stop",
+            }
+        ],
+    }
+    return f"data: {json.dumps(chunk)}\n\n".encode()
+
+
+def get_request_handler(openai: fake_openai):
+    """This function returns a request handler class for the given fake API."""
+
+    class fake_openai_handler(BaseHTTPRequestHandler):
+        """Class for answering chat completion requests."""
+
+        def log_message(self, *arguments) -> None:
+            pass
+
+        def do_POST(self) -> None:
+            self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+            if not self.path.endswith("/chat/completions"):
+                self.send_response(404)
+                self.end_headers()
+                return
+
+            openai.count_request()
+            sleep(openai.delay)
+
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.end_headers()
+
+            for word in FAKE_TEXT.split():
+                self.wfile.write(get_chunk(f" {word}"))
+            self.wfile.write(get_chunk(None))
+            self.wfile.write(b"data: [DONE]\n\n")
+
+    return fake_openai_handler
+
+
+def start_fake_openai(openai: fake_openai, port: int) -> ThreadingHTTPServer:
+    """This function starts the fake OpenAI API in a background thread."""
+    server = ThreadingHTTPServer(("127.0.0.1", port), get_request_handler(openai))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--port", type=int, default=8082)
+    parser.add_argument("--delay", type=float, default=1.0)
+    arguments = parser.parse_args()
+
+    start_fake_openai(fake_openai(arguments.delay), arguments.port)
+    print(f"Fake OpenAI API running on port {arguments.port}.")
+
+    while True:
+        sleep(3600)
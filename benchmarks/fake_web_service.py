@@ -0,0 +1,265 @@
+"""
+Fake Deadline Web Service for benchmarking the BreakTools Deadline Web App backend.
+
+It serves the REST endpoints used by DeadlineConnect.py with generated jobs and
+tasks. Job progress changes every churn interval, and the completed chunk count
+of every active job equals the number of churn ticks since the service started.
+That way a client can tell exactly how old the data it receives is. Every tick a
+new job is submitted and some inactive jobs are requeued for a tick, so the
+incremental polling of inactive jobs has something to do.
+
+Run it on its own with: python benchmarks/fake_web_service.py --jobs 500 --tasks 200
+"""
+
+import argparse
+import json
+import threading
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from time import monotonic, sleep
+from urllib.parse import parse_qs, urlparse
+
+INACTIVE_STATES = ("Suspended", "Completed", "Failed", "Pending")
+STATUS_CODES = {"Active": 1, "Suspended": 2, "Completed": 3, "Failed": 4, "Pending": 6}
+REQUEUE_PERIOD = 50
+
+
+class fake_farm:
+    """Class for generating a render farm's worth of jobs and tasks."""
+
+    def __init__(
+        self, job_count: int, task_count: int, churn_interval: float = 1.0
+    ) -> None:
+        self.job_count = job_count
+        self.task_count = task_count
+        self.churn_interval = churn_interval
+        self.started = monotonic()
+        self.request_counts = {}
+        self.lock = threading.Lock()
+
+    def get_tick(self) -> int:
+        """This function returns how many churn ticks have passed."""
+        return int((monotonic() - self.started) / self.churn_interval)
+
+    def get_tick_time(self, tick: int) -> float:
+        """This function returns the monotonic time at which a tick started."""
+        return self.started + tick * self.churn_interval
+
+    def count_request(self, endpoint: str) -> None:
+        """This function keeps track of how often each endpoint is requested."""
+        with self.lock:
+            self.request_counts[endpoint] = self.request_counts.get(endpoint, 0) + 1
+
+    def get_job_numbers(self) -> range:
+        """This function returns the numbers of all jobs on the farm,
+        which grows by one submitted job every tick."""
+        return range(self.job_count + self.get_tick())
+
+    def get_state(self, job_number: int) -> str:
+        """This function returns the state of a job. A quarter of the jobs is
+        always active, the rest is spread over the inactive states. Every tick
+        one in REQUEUE_PERIOD of the inactive jobs is requeued, and goes back
+        to its old state the tick after."""
+        if job_number % 4 == 0 or (job_number + self.get_tick()) % REQUEUE_PERIOD == 0:
+            return "Active"
+
+        return INACTIVE_STATES[(job_number + job_number // 4) % len(INACTIVE_STATES)]
+
+    def get_chunk_counts(self, state: str) -> dict:
+        """This function returns the chunk counts of a job in the given state."""
+        if state == "Active":
+            tick = self.get_tick()
+            return {
+                "CompletedChunks": tick,
+                "QueuedChunks": max(0, self.task_count - tick - 4),
+                "RenderingChunks": 4,
+                "Errs": (tick // 10) % 3,
+            }
+
+        half = self.task_count // 2
+        return {
+            "Suspended": {"CompletedChunks": half, "SuspendedChunks": half},
+            "Completed": {"CompletedChunks": self.task_count},
+            "Failed": {"CompletedChunks": half, "FailedChunks": half, "Errs": 5},
+            "Pending": {"PendingChunks": self.task_count},
+        }[state]
+
+    def get_start_date(self, job_number: int) -> str:
+        """This function returns a start date spread over the last two weeks."""
+        start_date = datetime.now(timezone.utc) - timedelta(
+            minutes=(job_number * 37) % 20000
+        )
+        return start_date.strftime("%Y-%m-%dT%H:%M:%S.000Z")
+
+    def get_job(self, job_number: int) -> dict:
+        """This function returns a job like GetJobsInState does, including
+        a bunch of properties the backend doesn't use."""
+        state = self.get_state(job_number)
+
+        return {
+            "_id": f"job{job_number:06d}",
+            "Props": {
+                "Name": f"shot_{job_number % 250:03d}_lighting_v{job_number % 7}",
+                "User": f"artist{job_number % 40}",
+                "Pool": "none",
+                "Group": "render",
+                "Plug": "Arnold",
+                "Frames": f"1-{self.task_count}",
+                "Ex": {"EnvironmentVariables": "x" * 200},
+            },
+            "Stat": STATUS_CODES[state],
+            "DateStart": self.get_start_date(job_number),
+            "CompletedChunks": 0,
+            "QueuedChunks": 0,
+            "SuspendedChunks": 0,
+            "RenderingChunks": 0,
+            "FailedChunks": 0,
+            "PendingChunks": 0,
+            "Errs": 0,
+            **self.get_chunk_counts(state),
+        }
+
+    def get_job_details(self, job_id: str) -> dict:
+        """This function returns job details like GetJobDetails does."""
+        tick = self.get_tick()
+
+        return {
+            "Job": {
+                "Name": f"{job_id}_lighting",
+                "User": "artist1",
+                "Submit Date": "2023/11/01 10:00:00",
+                "Errors": (tick // 10) % 3,
+            },
+            "Task States": {
+                "Completed": min(tick, self.task_count),
+                "Failed": 0,
+                "Pending": 0,
+                "Queued": max(0, self.task_count - tick - 4),
+                "Rendering": 4,
+                "Suspended": 0,
+            },
+            "Statistics": {
+                "Estimated Time Remaining": f"{self.task_count - tick}m",
+                "Average Task Time": "1m",
+            },
+            "Output Directories": {"Output Path 1": "/tmp/renders"},
+            "Output Filenames": {"Output File 1": "beauty.####.exr"},
+        }
+
+    def get_task(self, task_id: int) -> dict:
+        """This function returns a task like GetJobTasks does. A few tasks
+        make progress every tick."""
+        tick = self.get_tick()
+        progress = 100 if task_id < tick else (tick * 7 + task_id) % 100
+
+        return {
+            "TaskID": task_id,
+            "Frames": f"{task_id + 1}-{task_id + 1}",
+            "Errs": 1 if task_id % 97 == 0 else 0,
+            "Prog": f"{progress} %",
+            "Stat": 5 if task_id < tick else 2,
+        }
+
+    def get_response(self, path: str, query: dict):
+        """This function returns the response body for a request."""
+        if path == "/api/jobs":
+            return self.get_jobs_response(query)
+
+        if path == "/api/tasks":
+            return self.get_tasks_response(query)
+
+        if path == "/api/taskreports":
+            self.count_request("TaskReports")
+            report = "2023-11-01 10:00:00: 0: ERROR: Could not find texture.\n" * 50
+            return [report] * 5
+
+        return None
+
+    def get_jobs_response(self, query: dict):
+        """This function answers the requests for jobs and their details."""
+        if "IdOnly" in query:
+            self.count_request("GetJobIds")
+            return [f"job{number:06d}" for number in self.get_job_numbers()]
+
+        if "JobID" in query:
+            job_ids = query["JobID"][0].split(",")
+
+            if "Details" in query:
+                self.count_request("GetJobDetails")
+                return {job_id: self.get_job_details(job_id) for job_id in job_ids}
+
+            self.count_request("GetJobs")
+            return [self.get_job(int(job_id[3:])) for job_id in job_ids]
+
+        self.count_request("GetJobsInStates")
+        states = query.get("States", [""])[0].split(",")
+        return [
+            self.get_job(number)
+            for number in self.get_job_numbers()
+            if self.get_state(number) in states
+        ]
+
+    def get_tasks_response(self, query: dict):
+        """This function answers the requests for the tasks of a job."""
+        tasks = [self.get_task(task_id) for task_id in range(self.task_count)]
+
+        if "TaskID" in query:
+            self.count_request("GetJobTask")
+            return [tasks[int(query["TaskID"][0])]]
+
+        self.count_request("GetJobTasks")
+        return {"Tasks": tasks}
+
+
+def get_request_handler(farm: fake_farm):
+    """This function returns a request handler class that serves the given farm."""
+
+    class fake_web_service_handler(BaseHTTPRequestHandler):
+        """Class for answering Web Service requests."""
+
+        def log_message(self, *arguments) -> None:
+            pass
+
+        def do_GET(self) -> None:
+            url = urlparse(self.path)
+            body = farm.get_response(url.path, parse_qs(url.query))
+
+            if body is None:
+                self.send_response(404)
+                self.end_headers()
+                return
+
+            encoded_body = json.dumps(body).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(encoded_body)))
+            self.end_headers()
+            self.wfile.write(encoded_body)
+
+    return fake_web_service_handler
+
+
+def start_fake_web_service(farm: fake_farm, port: int) -> ThreadingHTTPServer:
+    """This function starts the fake Web Service in a background thread."""
+    server = ThreadingHTTPServer(("127.0.0.1", port), get_request_handler(farm))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--jobs", type=int, default=500)
+    parser.add_argument("--tasks", type=int, default=200)
+    parser.add_argument("--churn-interval", type=float, default=1.0)
+    arguments = parser.parse_args()
+
+    start_fake_web_service(
+        fake_farm(arguments.jobs, arguments.tasks, arguments.churn_interval),
+        arguments.port,
+    )
+    print(f"Fake Deadline Web Service running on port {arguments.port}.")
+
+    while True:
+        sleep(3600)
@@ -0,0 +1,234 @@
+"""
+Load test for the BreakTools Deadline Web App backend.
+
+This starts the fake Deadline Web Service, runs the real backend in a separate
+process against it and connects a bunch of synthetic clients that use the same
+protocol as the Web App. Some clients look at the job lists, others at a job.
+At the end it reports messages per second, update latency, upstream requests
+per second and the CPU time and peak memory of the backend process.
+
+Example: python benchmarks/load_test.py --clients 100 --job-viewers 20 --jobs 2000
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+from pathlib import Path
+from time import monotonic
+
+import websockets
+from fake_web_service import fake_farm, start_fake_web_service
+
+SOURCE_FOLDER = Path(__file__).resolve().parent.parent / "src"
+
+
+class load_test_results:
+    """Class for collecting what the synthetic clients received."""
+
+    def __init__(self) -> None:
+        self.messages = 0
+        self.received_bytes = 0
+        self.latencies = []
+        self.errors = 0
+
+
+def get_free_port() -> int:
+    """This function asks the OS for a port nobody is using."""
+    with socket.socket() as free_socket:
+        free_socket.bind(("127.0.0.1", 0))
+        return free_socket.getsockname()[1]
+
+
+def get_percentile(values: list, percentile: float) -> float:
+    """This function returns a percentile of a list of numbers."""
+    if not values:
+        return float("nan")
+
+    sorted_values = sorted(values)
+    index = min(len(sorted_values) - 1, int(len(sorted_values) * percentile / 100))
+    return sorted_values[index]
+
+
+def record_message(
+    farm: fake_farm, results: load_test_results, message: dict, received: float
+) -> None:
+    """This function records a message. Completed chunk counts equal the churn
+    tick they were generated in, so we know how stale each update is."""
+    if message["type"] == "batch":
+        for batched_message in message["messages"]:
+            record_message(farm, results, batched_message, received)
+        return
+
+    results.messages += 1
+
+    if not message.get("update"):
+        return
+
+    if message["type"] == "active_jobs":
+        for job in message["data"].values():
+            if "CompletedChunks" in job:
+                tick = job["CompletedChunks"]
+                results.latencies.append(received - farm.get_tick_time(tick))
+
+    elif message["type"] == "job_details":
+        completed = message["data"].get("job", {}).get("Completed")
+        if completed is not None and completed < farm.task_count:
+            results.latencies.append(received - farm.get_tick_time(completed))
+
+
+async def run_client(
+    farm: fake_farm,
+    results: load_test_results,
+    port: int,
+    requests: list,
+    duration: float,
+) -> None:
+    """This function connects a single synthetic client and listens
+    for the given amount of seconds."""
+    stop_time = monotonic() + duration
+
+    try:
+        async with websockets.connect(f"ws://127.0.0.1:{port}", max_size=None) as ws:
+            for request in requests:
+                await ws.send(json.dumps(request))
+
+            while monotonic() < stop_time:
+                try:
+                    raw_message = await asyncio.wait_for(
+                        ws.recv(), stop_time - monotonic()
+                    )
+                except asyncio.TimeoutError:
+                    break
+
+                results.received_bytes += len(raw_message)
+                record_message(farm, results, json.loads(raw_message), monotonic())
+
+    except (OSError, websockets.exceptions.WebSocketException):
+        results.errors += 1
+
+
+async def wait_for_port(port: int, timeout: float) -> None:
+    """This function waits until the backend accepts connections."""
+    give_up_time = monotonic() + timeout
+
+    while monotonic() < give_up_time:
+        try:
+            _, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.close()
+            return
+        except OSError:
+            await asyncio.sleep(0.1)
+
+    error_message = f"The backend did not start listening on port {port}."
+    raise TimeoutError(error_message)
+
+
+async def run_load_test(arguments) -> dict:
+    """This function runs the whole load test and returns the results."""
+    farm = fake_farm(arguments.jobs, arguments.tasks, arguments.churn_interval)
+    web_service_port = get_free_port()
+    websocket_port = get_free_port()
+    start_fake_web_service(farm, web_service_port)
+
+    backend_environment = dict(
+        os.environ,
+        WEB_SERVICE_IP="127.0.0.1",
+        WEB_SERVICE_PORT=str(web_service_port),
+        WEBSOCKET_PORT=str(websocket_port),
+        OPENAI_API_KEY=os.environ.get("OPENAI_API_KEY", "benchmark"),
+        # Every run starts cold, without reading or writing a job snapshot.
+        SNAPSHOT_PATH="",
+    )
+    backend = subprocess.Popen(
+        [sys.executable, "launcher.py"],
+        cwd=SOURCE_FOLDER,
+        env=backend_environment,
+        stdout=subprocess.DEVNULL if arguments.quiet else None,
+    )
+
+    try:
+        await wait_for_port(websocket_port, arguments.startup_timeout)
+
+        active_job_ids = [
+            f"job{number:06d}" for number in range(0, arguments.jobs, 4)
+        ] or ["job000000"]
+        client_requests = [
+            [{"body": "get_active_jobs"}, {"body": "get_recent_jobs"}]
+        ] * (arguments.clients - arguments.job_viewers) + [
+            [
+                {
+                    "body": "get_job_details",
+                    "jobId": active_job_ids[viewer % len(active_job_ids)],
+                }
+            ]
+            for viewer in range(arguments.job_viewers)
+        ]
+
+        results = load_test_results()
+        requests_before = dict(farm.request_counts)
+        started = monotonic()
+
+        await asyncio.gather(
+            *(
+                run_client(farm, results, websocket_port, requests, arguments.duration)
+                for requests in client_requests
+            )
+        )
+
+        elapsed = monotonic() - started
+        upstream_requests = {
+            endpoint: count - requests_before.get(endpoint, 0)
+            for endpoint, count in farm.request_counts.items()
+        }
+
+    finally:
+        backend.terminate()
+        _, _, resource_usage = os.wait4(backend.pid, 0)
+
+    return {
+        "clients": arguments.clients,
+        "job_viewers": arguments.job_viewers,
+        "jobs": arguments.jobs,
+        "tasks_per_job": arguments.tasks,
+        "duration_seconds": round(elapsed, 2),
+        "client_errors": results.errors,
+        "messages_per_second": round(results.messages / elapsed, 1),
+        "received_megabytes_per_second": round(
+            results.received_bytes / elapsed / 1e6, 3
+        ),
+        "update_latency_p50_seconds": round(get_percentile(results.latencies, 50), 3),
+        "update_latency_p99_seconds": round(get_percentile(results.latencies, 99), 3),
+        "upstream_requests_per_second": round(
+            sum(upstream_requests.values()) / elapsed, 2
+        ),
+        "upstream_requests": upstream_requests,
+        "backend_cpu_seconds": round(
+            resource_usage.ru_utime + resource_usage.ru_stime, 2
+        ),
+        "backend_peak_rss_megabytes": round(resource_usage.ru_maxrss / 1024, 1),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--clients", type=int, default=50)
+    parser.add_argument("--job-viewers", type=int, default=10)
+    parser.add_argument("--jobs", type=int, default=500)
+    parser.add_argument("--tasks", type=int, default=200)
+    parser.add_argument("--churn-interval", type=float, default=1.0)
+    parser.add_argument("--duration", type=float, default=30.0)
+    parser.add_argument("--startup-timeout", type=float, default=60.0)
+    parser.add_argument("--output", help="Also write the results to this JSON file.")
+    parser.add_argument("--quiet", action="store_true", help="Hide backend output.")
+    arguments = parser.parse_args()
+    arguments.job_viewers = min(arguments.job_viewers, arguments.clients)
+
+    load_test_report = asyncio.run(run_load_test(arguments))
+    print(json.dumps(load_test_report, indent=4))
+
+    if arguments.output:
+        Path(arguments.output).write_text(json.dumps(load_test_report, indent=4))
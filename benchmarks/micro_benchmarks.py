@@ -0,0 +1,148 @@
+"""
+Micro benchmarks for the hot functions of the BreakTools Deadline Web App backend.
+
+Every function is run on generated data of a few sizes, so it's easy to see how
+they scale with farm size. EXR conversion needs OpenEXR, which it writes test
+images with, so that benchmark is skipped if OpenEXR can't be imported.
+
+Example: python benchmarks/micro_benchmarks.py --sizes 100 1000 10000
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+import tempfile
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from fake_web_service import fake_farm
+from numpy import float32, linspace, tile
+
+from utility_functions import (
+    get_clean_date,
+    get_clean_job_data,
+    get_clean_task_data,
+    get_dict_differences,
+    get_job_details_differences,
+)
+
+try:
+    from Imath import Channel, PixelType
+    from OpenEXR import Header, OutputFile
+
+    from image_handling import convert_exr_to_jpeg
+except ImportError as error:
+    OPENEXR_IMPORT_ERROR = error
+else:
+    OPENEXR_IMPORT_ERROR = None
+
+
+def get_best_time(function, repeats: int) -> float:
+    """This function returns the fastest time of a few runs, in seconds."""
+    runs = max(1, repeats)
+    return min(timeit.repeat(function, number=1, repeat=runs))
+
+
+def benchmark_job_data(size: int, repeats: int) -> dict:
+    """This function benchmarks cleaning and comparing job lists of the given size."""
+    farm = fake_farm(size, 10)
+    raw_jobs = [farm.get_job(number) for number in range(size)]
+
+    def clean_jobs() -> dict:
+        return {
+            job["_id"]: get_clean_job_data(job, get_clean_date(job["DateStart"]))
+            for job in raw_jobs
+        }
+
+    old_jobs = clean_jobs()
+    new_jobs = clean_jobs()
+    for job_id in list(new_jobs)[::10]:
+        new_jobs[job_id] = dict(new_jobs[job_id], CompletedChunks=-1)
+
+    return {
+        "get_clean_job_data_seconds": get_best_time(clean_jobs, repeats),
+        "get_dict_differences_seconds": get_best_time(
+            lambda: get_dict_differences(old_jobs, new_jobs), repeats
+        ),
+    }
+
+
+def benchmark_task_data(size: int, repeats: int) -> dict:
+    """This function benchmarks building and comparing task tables of the given size."""
+    farm = fake_farm(1, size)
+    raw_tasks = {"Tasks": [farm.get_task(task_id) for task_id in range(size)]}
+    old_tasks = get_clean_task_data(raw_tasks)
+
+    for task in raw_tasks["Tasks"][::50]:
+        task["Prog"] = "99 %"
+    new_tasks = get_clean_task_data(raw_tasks)
+
+    return {
+        "get_clean_task_data_seconds": get_best_time(
+            lambda: get_clean_task_data(raw_tasks), repeats
+        ),
+        "get_job_details_differences_seconds": get_best_time(
+            lambda: get_job_details_differences(
+                {"job": {}, "tasks": old_tasks}, {"job": {}, "tasks": new_tasks}
+            ),
+            repeats,
+        ),
+    }
+
+
+def write_test_exr(path: str, width: int, height: int) -> None:
+    """This function writes an EXR with a simple gradient."""
+    header = Header(width, height)
+    header["channels"] = dict.fromkeys("RGB", Channel(PixelType(PixelType.FLOAT)))
+    gradient = tile(linspace(0, 1, width, dtype=float32), height).tobytes()
+
+    exr_file = OutputFile(path, header)
+    exr_file.writePixels(dict.fromkeys("RGB", gradient))
+    exr_file.close()
+
+
+def benchmark_exr_conversion(size: int, repeats: int) -> dict:
+    """This function benchmarks converting a square EXR of the given size."""
+    if OPENEXR_IMPORT_ERROR is not None:
+        return {"skipped": f"OpenEXR is not available: {OPENEXR_IMPORT_ERROR}"}
+
+    with tempfile.TemporaryDirectory() as folder:
+        path_to_exr = str(Path(folder) / "benchmark.exr")
+        write_test_exr(path_to_exr, size, size)
+
+        return {
+            "convert_exr_to_jpeg_seconds": get_best_time(
+                lambda: asyncio.run(convert_exr_to_jpeg(path_to_exr)), repeats
+            )
+        }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 20000])
+    parser.add_argument("--image-sizes", type=int, nargs="+", default=[512, 2048])
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--output", help="Also write the results to this JSON file.")
+    arguments = parser.parse_args()
+
+    micro_benchmark_report = {
+        "job_data": {
+            size: benchmark_job_data(size, arguments.repeats)
+            for size in arguments.sizes
+        },
+        "task_data": {
+            size: benchmark_task_data(size, arguments.repeats)
+            for size in arguments.sizes
+        },
+        "exr_conversion": {
+            size: benchmark_exr_conversion(size, arguments.repeats)
+            for size in arguments.image_sizes
+        },
+    }
+    print(json.dumps(micro_benchmark_report, indent=4))
+
+    if arguments.output:
+        Path(arguments.output).write_text(json.dumps(micro_benchmark_report, indent=4))
@@ -5,20 +5,51 @@ in this file so this backend can be easily installed. It's a bit messy though, I
 """
 
 from __future__ import absolute_import
-import json
+
 import base64
+import codecs
+import json
+import re
 import ssl
-import traceback
-
-from urllib.request import urlopen, Request
 from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+
+HTTP_UNAUTHORIZED = 401
+HTTP_SERVER_ERROR = 500
+ARRAY_SEPARATOR = re.compile(r"[ \t\r]*[,\]]")
+
+
+class WebServiceError(Exception):
+    """Something went wrong talking to the Web Service. Retrying might help."""
+
+    retryable = True
+
+
+class WebServiceConnectionError(WebServiceError):
+    """The Web Service could not be reached, or it took too long to answer."""
+
+
+class WebServiceResponseError(WebServiceError):
+    """The Web Service had an internal error or sent an invalid response."""
+
+
+class WebServiceRequestError(WebServiceError):
+    """The Web Service refused the request, so retrying won't help."""
+
+    retryable = False
+
+
+class WebServiceAuthenticationError(WebServiceRequestError):
+    """The Web Service did not accept our credentials."""
 
 
 class DeadlineCon:
-    def __init__(self, host, port, useTls=False, caCert=None, insecure=False):
+    def __init__(
+        self, host, port, useTls=False, caCert=None, insecure=False, timeout=None
+    ):
         address = host + ":" + str(port)
         self.connectionProperties = ConnectionProperty(
-            address, False, useTls, caCert, insecure
+            address, False, useTls, caCert, insecure, timeout
         )
 
         self.Jobs = Jobs(self.connectionProperties)
@@ -28,7 +59,13 @@ class DeadlineCon:
 
 class ConnectionProperty:
     def __init__(
-        self, address, useAuth=False, useTls=True, caCert=None, insecure=False
+        self,
+        address,
+        useAuth=False,
+        useTls=True,
+        caCert=None,
+        insecure=False,
+        timeout=None,
     ):
         self.address = address
         self.useAuth = useAuth
@@ -37,6 +74,48 @@ class ConnectionProperty:
         self.useTls = useTls
         self.caCert = caCert
         self.insecure = insecure
+        self.timeout = timeout
+
+    def __stream__(self, commandString):
+        try:
+            yield from streamJsonArray(
+                openUrl(
+                    self.address,
+                    commandString,
+                    "GET",
+                    None,
+                    self.useAuth,
+                    self.user,
+                    self.password,
+                    self.useTls,
+                    self.caCert,
+                    self.insecure,
+                    self.timeout,
+                )
+            )
+        except Exception as error:
+            raise GetWebServiceError(error) from error
+
+    def __get_first_string__(self, commandString, maxLength):
+        try:
+            return readFirstJsonArrayString(
+                openUrl(
+                    self.address,
+                    commandString,
+                    "GET",
+                    None,
+                    self.useAuth,
+                    self.user,
+                    self.password,
+                    self.useTls,
+                    self.caCert,
+                    self.insecure,
+                    self.timeout,
+                ),
+                maxLength,
+            )
+        except Exception as error:
+            raise GetWebServiceError(error) from error
 
     def __get__(self, commandString):
         return send(
@@ -50,6 +129,7 @@ class ConnectionProperty:
             self.useTls,
             self.caCert,
             self.insecure,
+            self.timeout,
         )
 
 
@@ -57,12 +137,29 @@ class Jobs:
     def __init__(self, connectionProperties):
         self.connectionProperties = connectionProperties
 
+    def GetJobIds(self):
+        return self.connectionProperties.__get__("/api/jobs?IdOnly=true")
+
+    def GetJobs(self, ids):
+        script = "/api/jobs"
+
+        script = script + "?JobID=" + ArrayToCommaSeparatedString(ids)
+        return self.connectionProperties.__get__(script)
+
     def GetJobsInStates(self, states):
         return self.connectionProperties.__get__("/api/jobs?States=" + ",".join(states))
 
     def GetJobsInState(self, state):
         return self.connectionProperties.__get__("/api/jobs?States=" + state)
 
+    def StreamJobsInStates(self, states):
+        return self.connectionProperties.__stream__(
+            "/api/jobs?States=" + ",".join(states)
+        )
+
+    def StreamJobsInState(self, state):
+        return self.connectionProperties.__stream__("/api/jobs?States=" + state)
+
     def GetJobDetails(self, ids):
         script = "/api/jobs"
 
@@ -110,6 +207,26 @@ class TaskReports:
             + "&Data=allerrorcontents"
         )
 
+    def GetFirstTaskReportContents(self, jobId, taskId, maxLength):
+        return self.connectionProperties.__get_first_string__(
+            "/api/taskreports?JobID="
+            + jobId
+            + "&TaskID="
+            + str(taskId)
+            + "&Data=allcontents",
+            maxLength,
+        )
+
+    def GetFirstTaskErrorReportContents(self, jobId, taskId, maxLength):
+        return self.connectionProperties.__get_first_string__(
+            "/api/taskreports?JobID="
+            + jobId
+            + "&TaskID="
+            + str(taskId)
+            + "&Data=allerrorcontents",
+            maxLength,
+        )
+
 
 def ArrayToCommaSeparatedString(iterable):
     if isinstance(iterable, str):
@@ -121,6 +238,183 @@ def ArrayToCommaSeparatedString(iterable):
     return ",".join(str(x) for x in iterable)
 
 
+def GetWebServiceError(error):
+    if isinstance(error, WebServiceError):
+        return error
+
+    if isinstance(error, HTTPError):
+        if error.code == HTTP_UNAUTHORIZED:
+            return WebServiceAuthenticationError(
+                "HTTP Status Code 401. Authentication with the Web Service failed. Please ensure that the authentication credentials are set, are correct, and that authentication mode is enabled."
+            )
+        if error.code < HTTP_SERVER_ERROR:
+            return WebServiceRequestError(f"HTTP Status Code {error.code}.")
+        return WebServiceResponseError(f"HTTP Status Code {error.code}.")
+
+    if isinstance(error, OSError):
+        return WebServiceConnectionError(str(error))
+
+    return WebServiceResponseError(str(error))
+
+
+def openUrl(
+    address,
+    message,
+    requestType,
+    body=None,
+    useAuth=False,
+    username="",
+    password="",
+    useTls=True,
+    caCert=None,
+    insecure=False,
+    timeout=None,
+):
+    httpString = "https://" if useTls else "http://"
+    if not address.startswith(httpString):
+        address = httpString + address
+    url = address + message
+
+    if body is not None:
+        request = Request(url, data=body.encode("utf-8"))
+        request.add_header("Content-Type", "application/json; charset=utf-8")
+    else:
+        request = Request(url)
+
+    request.get_method = lambda: requestType
+
+    if useAuth:
+        userPassword = "%s:%s" % (username, password)
+        userPasswordEncoded = base64.b64encode(userPassword.encode("utf-8")).decode()
+        request.add_header("Authorization", "Basic %s" % userPasswordEncoded)
+
+    context = None
+    if useTls:
+        context = ssl.create_default_context(cafile=caCert)
+        context.check_hostname = not insecure
+        context.verify_mode = ssl.CERT_NONE if insecure else ssl.CERT_REQUIRED
+
+    return urlopen(request, context=context, timeout=timeout)
+
+
+def streamJsonArray(response, chunkSize=65536):
+    """Yields the items of a JSON array response one at a time while it's
+    being downloaded, so the whole response never has to be in memory.
+    Like send, newlines are replaced with spaces, one chunk at a time."""
+    decoder = json.JSONDecoder()
+    textDecoder = codecs.getincrementaldecoder("utf-8")()
+    buffer = ""
+    index = 0
+    startedArray = False
+    finished = False
+
+    with response:
+        while True:
+            chunk = response.read(chunkSize)
+            finished = not chunk
+            buffer = buffer[index:] + textDecoder.decode(chunk, final=finished)
+            buffer = buffer.replace("\n", " ")
+            index = 0
+
+            while True:
+                while index < len(buffer) and buffer[index] in " \t\r,":
+                    index += 1
+
+                if index == len(buffer):
+                    break
+
+                if not startedArray:
+                    if buffer[index] != "[":
+                        errorMessage = "The response is not a JSON array."
+                        raise ValueError(errorMessage)
+                    startedArray = True
+                    index += 1
+                    continue
+
+                if buffer[index] == "]":
+                    return
+
+                try:
+                    item, itemEnd = decoder.raw_decode(buffer, index)
+                except json.JSONDecodeError:
+                    if finished:
+                        raise
+                    break
+
+                # Items are followed by a comma or the end of the array. If they
+                # aren't, a number was cut off and continues in the next chunk.
+                if not isFollowedByArraySeparator(buffer, itemEnd):
+                    if finished:
+                        errorMessage = "The JSON array in the response is invalid."
+                        raise ValueError(errorMessage)
+                    break
+
+                index = itemEnd
+                yield item
+
+            if finished:
+                errorMessage = "The JSON array in the response was cut off."
+                raise ValueError(errorMessage)
+
+
+def isFollowedByArraySeparator(buffer, index):
+    """Returns whether the next character after the whitespace at index
+    is a comma or the end of the array."""
+    return ARRAY_SEPARATOR.match(buffer, index) is not None
+
+
+FIRST_ARRAY_STRING = re.compile(r'\s*\[\s*("(?:[^"\\]|\\.)*")\s*[,\]]', re.DOTALL)
+
+
+def readFirstJsonArrayString(response, maxLength, chunkSize=65536):
+    """Returns the first string of a JSON array response and stops downloading
+    right after it, so the other items are never read. Strings longer than
+    maxLength characters are cut off, which is returned as the second value.
+    Returns (None, False) if the array is empty."""
+    textDecoder = codecs.getincrementaldecoder("utf-8")()
+    buffer = ""
+
+    with response:
+        while True:
+            chunk = response.read(chunkSize)
+            finished = not chunk
+            buffer += textDecoder.decode(chunk, final=finished)
+            start = buffer.lstrip(" \t\r\n")
+
+            if start.startswith("[") and start[1:].lstrip(" \t\r\n").startswith("]"):
+                return None, False
+
+            match = FIRST_ARRAY_STRING.match(buffer)
+            if match is not None:
+                firstString = json.loads(match.group(1))
+                return firstString[:maxLength], len(firstString) > maxLength
+
+            if len(buffer) > maxLength + 64:
+                opening = buffer.index('"')
+                return (
+                    decodeCutOffJsonString(
+                        buffer[opening + 1 : opening + 1 + maxLength]
+                    ),
+                    True,
+                )
+
+            if finished:
+                errorMessage = "The response doesn't start with a JSON string array."
+                raise ValueError(errorMessage)
+
+
+def decodeCutOffJsonString(text):
+    """Decodes the inside of a JSON string that was cut off, possibly in the
+    middle of an escape sequence, which is then left out."""
+    for end in range(len(text), max(len(text) - 6, 0) - 1, -1):
+        try:
+            return json.loads('"' + text[:end] + '"')
+        except ValueError:
+            continue
+
+    return ""
+
+
 def send(
     address,
     message,
@@ -132,49 +426,32 @@ def send(
     useTls=True,
     caCert=None,
     insecure=False,
+    timeout=None,
 ):
     try:
-        httpString = "https://" if useTls else "http://"
-        if not address.startswith(httpString):
-            address = httpString + address
-        url = address + message
-
-        if body is not None:
-            request = Request(url, data=body.encode("utf-8"))
-            request.add_header("Content-Type", "application/json; charset=utf-8")
-        else:
-            request = Request(url)
-
-        request.get_method = lambda: requestType
-
-        if useAuth:
-            userPassword = "%s:%s" % (username, password)
-            userPasswordEncoded = base64.b64encode(
-                userPassword.encode("utf-8")
-            ).decode()
-            request.add_header("Authorization", "Basic %s" % userPasswordEncoded)
-
-        context = None
-        if useTls:
-            context = ssl.create_default_context(cafile=caCert)
-            context.check_hostname = not insecure
-            context.verify_mode = ssl.CERT_NONE if insecure else ssl.CERT_REQUIRED
-
-        response = urlopen(request, context=context)
-
-        data = response.read().decode()
+        response = openUrl(
+            address,
+            message,
+            requestType,
+            body,
+            useAuth,
+            username,
+            password,
+            useTls,
+            caCert,
+            insecure,
+            timeout,
+        )
+
+        with response:
+            data = response.read().decode()
         data = data.replace("\n", " ")
 
-        try:
-            data = json.loads(data)
-        except:
-            pass
-        return data
-
-    except HTTPError as e:
-        if e.code == 401:
-            return "Error: HTTP Status Code 401. Authentication with the Web Service failed. Please ensure that the authentication credentials are set, are correct, and that authentication mode is enabled."
-        else:
-            return traceback.print_exc()
-    except Exception as e:
-        return traceback.print_exc()
+    except Exception as error:
+        raise GetWebServiceError(error) from error
+
+    try:
+        data = json.loads(data)
+    except:
+        pass
+    return data
@@ -0,0 +1,162 @@
+"""
+AI text pregeneration for the BreakTools Deadline Web App by Mervin van Brakel (2023)
+
+Writing an AI text takes a few seconds, and the first person to open a job used to
+wait for it. So every time the job lists are refreshed, which also happens every
+BACKGROUND_POLL_INTERVAL seconds without clients, each job gets the prompt type
+it would get on the job details page. When a job starts having warnings or failed
+tasks, its AI text is written in the background, so it's usually done before
+anyone opens the job. Background texts are written one at a time with
+AI_PREGENERATE_INTERVAL seconds in between, so a farm-wide failure doesn't send
+hundreds of requests to OpenAI at once.
+"""
+
+import asyncio
+from os import getenv
+
+from dotenv import load_dotenv
+
+from optional_features import AI_TEXT, get_optional_module
+
+load_dotenv()
+
+AI_PREGENERATE = getenv("AI_PREGENERATE", "true").lower() == "true"
+AI_PREGENERATE_INTERVAL = float(getenv("AI_PREGENERATE_INTERVAL", "5"))
+AI_PREGENERATE_QUEUE_SIZE = int(getenv("AI_PREGENERATE_QUEUE_SIZE", "50"))
+
+AI_TEXTS = {}
+PROMPT_TYPES = {}
+QUEUED_JOB_IDS = set()
+PREGENERATE_QUEUE = asyncio.Queue(AI_PREGENERATE_QUEUE_SIZE)
+
+
+def get_prompt_information(job: dict) -> dict | None:
+    """This function figures out which prompt fits the state of a job, and which
+    log the prompt needs. It returns None if no prompt fits."""
+    try:
+        completed = int(job["Completed"])
+        failed = int(job["Failed"])
+        pending = int(job["Pending"])
+        suspended = int(job["Suspended"])
+        errors = int(job["Errors"])
+        total_chunks = (
+            completed
+            + failed
+            + pending
+            + int(job["Queued"])
+            + int(job["Rendering"])
+            + suspended
+        )
+    except (KeyError, TypeError, ValueError):
+        return None
+
+    running = total_chunks != completed
+    prompts = (
+        # Job finished without issues
+        (not running and errors == 0, "finished_successfully", None),
+        # Job finished but with warnings
+        (
+            not running and errors != 0 and failed == 0 and pending == 0,
+            "finished_warnings",
+            "warning",
+        ),
+        # Job partially failed
+        (total_chunks == completed + failed + suspended, "finished_partially", "error"),
+        # Job failed completely
+        (total_chunks == failed, "finished_failed", "error"),
+        # Job running without issues
+        (running and errors == 0 and failed == 0, "running_successfully", None),
+        # Job running, hasn't finished anything and has only warnings
+        (
+            running and completed == 0 and errors != 0 and failed == 0,
+            "running_only_warnings",
+            "warning",
+        ),
+        # Job running but with warnings
+        (running and errors != 0 and failed == 0, "running_warnings", "warning"),
+        # Job running but with fails
+        (running and errors != 0 and failed != 0, "running_fails", "error"),
+    )
+
+    for fits, prompt_type, log_type_to_retrieve in prompts:
+        if fits:
+            return {"type": prompt_type, "log_type_to_retrieve": log_type_to_retrieve}
+
+    return None
+
+
+def get_list_job_counts(job: dict) -> dict:
+    """This function renames the task counts of a job from the job lists
+    to the names used on the job details page."""
+    return {
+        "Completed": job.get("CompletedChunks"),
+        "Failed": job.get("FailedChunks"),
+        "Pending": job.get("PendingChunks"),
+        "Queued": job.get("QueuedChunks"),
+        "Rendering": job.get("RenderingChunks"),
+        "Suspended": job.get("SuspendedChunks"),
+        "Errors": job.get("Errs"),
+    }
+
+
+def queue_ai_texts_for_new_problems(job_lists: list) -> None:
+    """This function gives every job its prompt type and queues an AI text for
+    the jobs that just started having problems. The first time we see a job we
+    only remember its prompt type, otherwise a restart would queue every broken
+    job on the farm."""
+    if not (AI_TEXT and AI_PREGENERATE):
+        return
+
+    prompt_types = {}
+
+    for jobs in job_lists:
+        for job_id, job in jobs.items():
+            prompt_information = get_prompt_information(get_list_job_counts(job))
+            if prompt_information is None:
+                continue
+
+            prompt_types[job_id] = prompt_information["type"]
+
+            if (
+                prompt_information["log_type_to_retrieve"] is not None
+                and job_id in PROMPT_TYPES
+                and PROMPT_TYPES[job_id] != prompt_information["type"]
+                and job_id not in QUEUED_JOB_IDS
+            ):
+                try:
+                    PREGENERATE_QUEUE.put_nowait(job_id)
+                    QUEUED_JOB_IDS.add(job_id)
+                except asyncio.QueueFull:
+                    print(
+                        f"[BreakTools] Too many AI texts waiting, skipping job {job_id}."
+                    )
+
+    PROMPT_TYPES.clear()
+    PROMPT_TYPES.update(prompt_types)
+
+
+async def pregenerate_ai_texts_forever(DEADLINE_CONNECTION) -> None:
+    """This function writes the queued AI texts one at a time."""
+    if not (AI_TEXT and AI_PREGENERATE):
+        return
+
+    while True:
+        job_id = await PREGENERATE_QUEUE.get()
+        QUEUED_JOB_IDS.discard(job_id)
+
+        try:
+            job_details = await DEADLINE_CONNECTION.get_job_details_and_tasks(job_id)
+            openai_interfacing = await get_optional_module("openai_interfacing")
+
+            if "error" not in job_details and openai_interfacing is not None:
+                await openai_interfacing.create_ai_text(
+                    job_details, job_id, DEADLINE_CONNECTION, None
+                )
+
+        except Exception as error:  # noqa: BLE001
+            # One job that can't get an AI text shouldn't stop the others.
+            print(
+                f"[BreakTools] Could not write AI text for job {job_id}. Error: {error}"
+            )
+
+        await asyncio.sleep(AI_PREGENERATE_INTERVAL)
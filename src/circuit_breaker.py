@@ -0,0 +1,93 @@
+"""
+Circuit breaker for the BreakTools Deadline Web App by Mervin van Brakel (2023)
+
+When the Deadline Web Service is having a hard time, sending it even more requests
+only makes things worse. After CIRCUIT_BREAKER_THRESHOLD failed requests in a row the
+breaker opens and we stop sending requests for CIRCUIT_BREAKER_COOLDOWN seconds.
+After that a single request is let through to see if the Web Service is back.
+Meanwhile clients get the last data we have, flagged as stale.
+"""
+
+from os import getenv
+from time import monotonic
+
+from dotenv import load_dotenv
+
+from DeadlineConnect import WebServiceError
+
+load_dotenv()
+
+CIRCUIT_BREAKER_THRESHOLD = int(getenv("CIRCUIT_BREAKER_THRESHOLD", "5"))
+CIRCUIT_BREAKER_COOLDOWN = float(getenv("CIRCUIT_BREAKER_COOLDOWN", "30"))
+
+CLOSED = 0
+OPEN = 1
+HALF_OPEN = 2
+
+
+class WebServiceUnavailableError(WebServiceError):
+    """The circuit breaker is open, so the request wasn't sent."""
+
+
+class circuit_breaker:
+    """Class for keeping track of failed requests and refusing
+    new ones while the Web Service is down."""
+
+    def __init__(
+        self,
+        failure_threshold: int = CIRCUIT_BREAKER_THRESHOLD,
+        cooldown: float = CIRCUIT_BREAKER_COOLDOWN,
+    ) -> None:
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.state = CLOSED
+        self.failures = 0
+        self.opened = 0.0
+
+    def check(self) -> bool:
+        """This function raises WebServiceUnavailableError if no request
+        may be sent right now. It returns True for the single request that
+        tests if the Web Service is back."""
+        if self.state == CLOSED:
+            return False
+
+        if self.state == OPEN and monotonic() - self.opened > self.cooldown:
+            # Let a single request through to test the water.
+            self.state = HALF_OPEN
+            return True
+
+        error_message = (
+            "The Deadline Web Service is not responding, trying again in a bit."
+        )
+        raise WebServiceUnavailableError(error_message)
+
+    def record_success(self) -> None:
+        """This function closes the breaker after a successful request."""
+        if self.state != CLOSED:
+            print("[BreakTools] The Deadline Web Service is responding again.")
+
+        self.state = CLOSED
+        self.failures = 0
+
+    def record_failure(self) -> None:
+        """This function counts a failed request and opens the breaker
+        if there were too many of them."""
+        self.failures += 1
+
+        if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state == CLOSED:
+                print(
+                    "[BreakTools] The Deadline Web Service failed "
+                    f"{self.failures} times in a row, pausing requests for "
+                    f"{self.cooldown} seconds."
+                )
+
+            self.state = OPEN
+            self.opened = monotonic()
+
+    def end_probe(self) -> None:
+        """This function runs when the test request is done. If it was cancelled
+        or crashed before telling us anything about the Web Service, the breaker
+        opens again, so the next request can test the water instead."""
+        if self.state == HALF_OPEN:
+            self.state = OPEN
@@ -0,0 +1,279 @@
+"""
+Contact sheets for the BreakTools Deadline Web App by Mervin van Brakel (2023)
+
+Checking a sequence one image preview at a time is slow, so clients can ask for
+a contact sheet: a single JPEG with a thumbnail of every frame of a job, plus
+which tile belongs to which task. Thumbnails are decoded in parallel at a reduced
+resolution. Contact sheets are cached per job, and only the tiles of frames that
+were (re)rendered since the last request are decoded and pasted in again. Pasting
+and encoding the mosaic happens in the image threads too, so big sheets don't
+keep the event loop busy.
+"""
+
+import asyncio
+import json
+from base64 import b64encode
+from collections import OrderedDict
+from io import BytesIO
+from math import ceil
+from os import getenv
+from pathlib import Path
+
+from dotenv import load_dotenv
+from PIL import Image
+
+from DeadlineConnect import WebServiceError
+from image_handling import read_exr_image
+from image_threads import run_image_work
+from metrics import time_block
+
+load_dotenv()
+
+CONTACT_SHEET_TILE_WIDTH = int(getenv("CONTACT_SHEET_TILE_WIDTH", "160"))
+CONTACT_SHEET_COLUMNS = int(getenv("CONTACT_SHEET_COLUMNS", "10"))
+CONTACT_SHEET_WORKERS = int(getenv("CONTACT_SHEET_WORKERS", "4"))
+CONTACT_SHEET_CACHE_SIZE = int(getenv("CONTACT_SHEET_CACHE_SIZE", "8"))
+
+CONTACT_SHEETS = OrderedDict()
+DECODE_SEMAPHORE = asyncio.Semaphore(CONTACT_SHEET_WORKERS)
+
+
+class contact_sheet:
+    """Class for storing the thumbnails and mosaic of a single job."""
+
+    def __init__(self) -> None:
+        self.lock = asyncio.Lock()
+        self.reset([])
+
+    def reset(self, task_ids: list) -> None:
+        """This function forgets all thumbnails, for when the tasks changed."""
+        self.task_ids = task_ids
+        self.file_versions = {}
+        self.tile_size = None
+        self.mosaic = None
+        self.encoded_mosaic = None
+
+    def get_message(self, job_id: str) -> dict:
+        """This function returns the message with the mosaic and the tile
+        of every task that has an image."""
+        return {
+            "type": "contact_sheet",
+            "job_id": job_id,
+            "error": False,
+            "image": self.encoded_mosaic,
+            "columns": CONTACT_SHEET_COLUMNS,
+            "tile_width": self.tile_size[0],
+            "tile_height": self.tile_size[1],
+            "tiles": {
+                str(task_id): tile_index
+                for tile_index, task_id in enumerate(self.task_ids)
+                if self.file_versions.get(task_id) is not None
+            },
+        }
+
+    def create_mosaic(self, first_thumbnail: Image.Image | None) -> None:
+        """This function creates an empty mosaic with room for every task. The
+        tiles get the aspect ratio of the first thumbnail, or are square."""
+        if first_thumbnail is None:
+            self.tile_size = (CONTACT_SHEET_TILE_WIDTH, CONTACT_SHEET_TILE_WIDTH)
+        else:
+            self.tile_size = (
+                CONTACT_SHEET_TILE_WIDTH,
+                max(
+                    1,
+                    round(
+                        CONTACT_SHEET_TILE_WIDTH
+                        * first_thumbnail.height
+                        / first_thumbnail.width
+                    ),
+                ),
+            )
+
+        rows = max(1, ceil(len(self.task_ids) / CONTACT_SHEET_COLUMNS))
+        self.mosaic = Image.new(
+            "RGB",
+            (CONTACT_SHEET_COLUMNS * self.tile_size[0], rows * self.tile_size[1]),
+        )
+
+    def paste_thumbnails(self, thumbnails: dict, file_versions: dict) -> None:
+        """This function pastes the thumbnails of the changed tasks into the
+        mosaic. It runs in an image thread while the lock of the sheet is held."""
+        if self.mosaic is None:
+            self.create_mosaic(
+                next(
+                    (
+                        thumbnail
+                        for thumbnail in thumbnails.values()
+                        if thumbnail is not None
+                    ),
+                    None,
+                )
+            )
+
+        # The old JPEG is outdated now, even if encoding the new one gets cancelled.
+        self.encoded_mosaic = None
+        tile_indices = {
+            task_id: tile_index for tile_index, task_id in enumerate(self.task_ids)
+        }
+
+        for task_id, thumbnail in thumbnails.items():
+            self.paste_tile(tile_indices[task_id], thumbnail)
+            # Frames that couldn't be read are tried again next time.
+            self.file_versions[task_id] = (
+                file_versions[task_id] if thumbnail is not None else None
+            )
+
+    def encode_mosaic(self) -> None:
+        """This function encodes the mosaic as a base64 JPEG for the messages."""
+        bytes_buffer = BytesIO()
+        self.mosaic.save(bytes_buffer, "JPEG", quality=70)
+        self.encoded_mosaic = b64encode(bytes_buffer.getvalue()).decode()
+
+    def paste_tile(self, tile_index: int, thumbnail: Image.Image | None) -> None:
+        """This function puts a thumbnail in its spot in the mosaic,
+        or clears the spot if the image is gone."""
+        tile_width, tile_height = self.tile_size
+        position = (
+            (tile_index % CONTACT_SHEET_COLUMNS) * tile_width,
+            (tile_index // CONTACT_SHEET_COLUMNS) * tile_height,
+        )
+
+        if thumbnail is None:
+            self.mosaic.paste((0, 0, 0), (*position, tile_width, tile_height))
+        else:
+            self.mosaic.paste(thumbnail.resize(self.tile_size), position)
+
+
+def get_file_version(path_to_exr: str) -> tuple | None:
+    """This function returns the modification time and size of a file,
+    which change when a frame gets rendered again. It returns None if
+    the frame isn't there (yet)."""
+    try:
+        file_stats = Path(path_to_exr).stat()
+    except OSError:
+        return None
+
+    return (file_stats.st_mtime_ns, file_stats.st_size)
+
+
+async def get_thumbnail(path_to_exr: str) -> Image.Image | None:
+    """This function decodes a reduced resolution thumbnail in an image thread.
+    It returns None for frames that can't be read, like half written ones."""
+    async with DECODE_SEMAPHORE:
+        try:
+            return await run_image_work(
+                read_exr_image, path_to_exr, CONTACT_SHEET_TILE_WIDTH
+            )
+        except (OSError, TypeError):
+            return None
+
+
+async def get_updated_contact_sheet(image_paths: dict, sheet: contact_sheet) -> bool:
+    """This function decodes the frames that changed since the contact sheet was
+    last made and pastes them into the mosaic. It returns True if anything changed."""
+    task_ids = sorted(image_paths)
+    file_versions = await asyncio.to_thread(
+        lambda: {
+            task_id: get_file_version(image_paths[task_id]) for task_id in task_ids
+        }
+    )
+
+    if task_ids != sheet.task_ids:
+        # The job was resubmitted with different tasks, start over.
+        sheet.reset(task_ids)
+
+    changed_task_ids = [
+        task_id
+        for task_id in task_ids
+        if file_versions[task_id] != sheet.file_versions.get(task_id)
+    ]
+
+    if not changed_task_ids and sheet.encoded_mosaic is not None:
+        return False
+
+    with time_block("contact_sheet_decode_seconds"):
+        thumbnails = await asyncio.gather(
+            *(
+                (
+                    get_thumbnail(image_paths[task_id])
+                    if file_versions[task_id] is not None
+                    else asyncio.sleep(0)
+                )
+                for task_id in changed_task_ids
+            )
+        )
+
+    await run_image_work(
+        sheet.paste_thumbnails,
+        dict(zip(changed_task_ids, thumbnails, strict=True)),
+        file_versions,
+    )
+
+    with time_block("jpeg_encode_seconds"):
+        await run_image_work(sheet.encode_mosaic)
+
+    return True
+
+
+def get_cached_contact_sheet(job_id: str) -> contact_sheet:
+    """This function returns the cached contact sheet of a job. Only the
+    sheets of the last few jobs are kept."""
+    sheet = CONTACT_SHEETS.pop(job_id, None) or contact_sheet()
+    CONTACT_SHEETS[job_id] = sheet
+
+    while len(CONTACT_SHEETS) > CONTACT_SHEET_CACHE_SIZE:
+        CONTACT_SHEETS.popitem(last=False)
+
+    return sheet
+
+
+async def send_contact_sheet(websocket, DEADLINE_CONNECTION, job_id: str) -> None:
+    """This function sends a contact sheet of all frames of a job to a client."""
+    if not await DEADLINE_CONNECTION.check_if_job_exists(job_id):
+        return
+
+    try:
+        image_paths = await DEADLINE_CONNECTION.get_task_image_paths(job_id)
+    except KeyError:
+        await send_contact_sheet_error(
+            websocket, job_id, "Error: Could not find the output folder on deadline."
+        )
+        return
+    except WebServiceError:
+        await send_contact_sheet_error(
+            websocket, job_id, "Error: Could not reach the Deadline Web Service."
+        )
+        return
+
+    sheet = get_cached_contact_sheet(job_id)
+
+    async with sheet.lock:
+        await get_updated_contact_sheet(image_paths, sheet)
+        message = json.dumps(sheet.get_message(job_id))
+
+    await websocket.send(message)
+
+
+async def prewarm_contact_sheet(job_id: str, image_paths: dict) -> None:
+    """This function decodes new frames into the cached contact sheet of a job.
+    Jobs nobody made a contact sheet for are skipped."""
+    sheet = CONTACT_SHEETS.get(job_id)
+    if sheet is None:
+        return
+
+    async with sheet.lock:
+        await get_updated_contact_sheet(image_paths, sheet)
+
+
+async def send_contact_sheet_error(websocket, job_id: str, error_message: str) -> None:
+    """This function tells a client its contact sheet couldn't be made."""
+    await websocket.send(
+        json.dumps(
+            {
+                "type": "contact_sheet",
+                "job_id": job_id,
+                "error": True,
+                "message": error_message,
+            }
+        )
+    )
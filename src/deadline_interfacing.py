@@ -7,27 +7,189 @@ information from the Deadline Web Service every x amount of seconds,
 depending on which type of information is fetched. If not enough
 time has passed, the backend will send the information that was
 stored in memory. 
+
+Every change to the stored information gets a version number, and the last
+few changes are kept around. Clients that reconnect tell us which version
+they have, so we only have to send them what changed since then.
+
+The job lists are also saved to a snapshot file, so a restarted backend can
+start sending them right away. See job_snapshots.py.
 """
 
-from dataclasses import dataclass
+import asyncio
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
 from datetime import datetime
 from os import getenv
+from random import uniform
+from time import time
 
-from DeadlineConnect import DeadlineCon
 from dotenv import load_dotenv
 
+from ai_pregeneration import (
+    AI_TEXTS,
+    pregenerate_ai_texts_forever,
+    queue_ai_texts_for_new_problems,
+)
+from circuit_breaker import circuit_breaker
+from DeadlineConnect import DeadlineCon, WebServiceError, WebServiceResponseError
+from error_signatures import get_signature_ai_text
+from farm_summary import job_list_summary
+from job_index import job_list_index
+from job_snapshots import load_snapshot, save_snapshots_forever
+from metrics import increment, time_block
+from progress_history import get_progress_history, record_job_progress
+from request_batcher import request_batcher
 from utility_functions import (
     get_clean_date,
     get_clean_job_data,
     get_clean_job_detail_data,
+    get_clean_jobs,
     get_clean_task_data,
     get_constructed_image_path,
+    get_dict_differences,
+    get_job_details_differences,
+    merge_dict_differences,
+    merge_job_details_differences,
 )
 
 load_dotenv()
 
 WEB_SERVICE_IP_ADDRESS = getenv("WEB_SERVICE_IP")
 WEB_SERVICE_PORT = getenv("WEB_SERVICE_PORT")
+VERSION_HISTORY_SIZE = int(getenv("VERSION_HISTORY_SIZE", "100"))
+INACTIVE_RESYNC_INTERVAL = float(getenv("INACTIVE_RESYNC_INTERVAL", "3600"))
+JOB_REQUEST_BATCH_SIZE = 100
+UNFINISHED_CHUNK_TYPES = (
+    "QueuedChunks",
+    "SuspendedChunks",
+    "RenderingChunks",
+    "FailedChunks",
+    "PendingChunks",
+)
+DETAILS_BATCH_WINDOW = float(getenv("DETAILS_BATCH_WINDOW", "0.05"))
+WEB_SERVICE_TIMEOUT = float(getenv("WEB_SERVICE_TIMEOUT", "30"))
+WEB_SERVICE_RETRIES = int(getenv("WEB_SERVICE_RETRIES", "2"))
+WEB_SERVICE_RETRY_DELAY = float(getenv("WEB_SERVICE_RETRY_DELAY", "0.5"))
+TASK_REPORT_MAX_LENGTH = int(getenv("TASK_REPORT_MAX_LENGTH", "262144"))
+TASK_REPORT_CACHE_SIZE = int(getenv("TASK_REPORT_CACHE_SIZE", "100"))
+BACKGROUND_POLL_INTERVAL = float(getenv("BACKGROUND_POLL_INTERVAL", "10"))
+
+# Jobs nobody asked about for this many seconds are no longer kept up to date.
+WATCHED_JOB_TIMEOUT = 60
+# Details of watched jobs older than this are fetched along with other jobs,
+# as long as someone asked for them in the last few seconds.
+PREFETCH_DETAILS_AGE = 0.5
+PREFETCH_REQUESTED_WITHIN = 5
+
+# These are the job states shown in the recent and older job lists. Deadline
+# calls them Suspended, Completed, Failed and Pending, with these status numbers.
+INACTIVE_STATES = ["Suspended", "Completed", "Failed", "Pending"]
+INACTIVE_STATUSES = (2, 3, 4, 6)
+ACTIVE_STATUS = 1
+
+
+def get_initial_version() -> int:
+    """This function returns the first version number for stored data. Versions
+    start at the current time in milliseconds, so a version a client got before
+    a restart is never mistaken for one of ours."""
+    return int(time() * 1000)
+
+
+def get_cleaned_response(function, *arguments):
+    """This function calls a Web Service function that also cleans its response.
+    A response the cleaners can't make sense of is just as useless as one that
+    isn't valid JSON, so it's raised as an invalid response."""
+    try:
+        return function(*arguments)
+    except (KeyError, IndexError, TypeError, ValueError) as error:
+        error_message = f"The Web Service sent a response we can't use: {error!r}"
+        raise WebServiceResponseError(error_message) from error
+
+
+def get_sorted_inactive_jobs(jobs: list) -> tuple[dict, set] | None:
+    """This function cleans the inactive jobs in a list of jobs and returns the
+    IDs of the jobs we never show. It returns None if the Web Service didn't
+    send a list."""
+    if not isinstance(jobs, list):
+        return None
+
+    inactive_jobs = {}
+    ignored_job_ids = set()
+
+    for job in jobs:
+        if job["Stat"] in INACTIVE_STATUSES:
+            inactive_jobs[job["_id"]] = get_clean_job_data(
+                job, get_clean_date(job["DateStart"])
+            )
+        elif job["Stat"] != ACTIVE_STATUS:
+            # Jobs in other states (like archived jobs) are never shown.
+            ignored_job_ids.add(job["_id"])
+
+    return inactive_jobs, ignored_job_ids
+
+
+@dataclass
+class version_history:
+    """Class for storing the version of some data and the changes
+    that led up to it."""
+
+    version: int = field(default_factory=get_initial_version)
+    changes: deque = field(default_factory=lambda: deque(maxlen=VERSION_HISTORY_SIZE))
+    merged_changes: dict = field(default_factory=dict)
+
+    def add_version(self, differences: dict) -> None:
+        """This function stores the differences as a new version."""
+        self.version += 1
+        self.changes.append((self.version, differences))
+        self.merged_changes = {}
+
+    def get_differences_since(self, version: int | None, merge_function) -> dict | None:
+        """This function returns everything that changed since the given version,
+        or None if that version is too old or not ours. Merged changes are cached,
+        so a whole bunch of clients reconnecting at once only costs one merge."""
+        if version == self.version:
+            return {}
+
+        if (
+            not isinstance(version, int)
+            or version > self.version
+            or not self.changes
+            or self.changes[0][0] > version + 1
+        ):
+            return None
+
+        if version not in self.merged_changes:
+            merged_differences = {}
+            for changed_version, differences in self.changes:
+                if changed_version > version:
+                    merged_differences = merge_function(merged_differences, differences)
+
+            self.merged_changes[version] = merged_differences
+
+        return self.merged_changes[version]
+
+    def get_changes_since(self, version: int | None) -> list:
+        """This function returns the stored changes newer than the given version."""
+        return [
+            (changed_version, differences)
+            for changed_version, differences in self.changes
+            if version is None or changed_version > version
+        ]
+
+    def copy_changes(self, version: int, changes: list) -> None:
+        """This function copies the changes of another process, so worker
+        processes hand out the same version numbers as the leader."""
+        new_changes = [change for change in changes if change[0] > self.version]
+
+        if version != self.version and (
+            not new_changes or new_changes[0][0] != self.version + 1
+        ):
+            self.changes.clear()
+
+        self.changes.extend(new_changes)
+        self.version = version
+        self.merged_changes = {}
 
 
 @dataclass
@@ -36,86 +198,530 @@ class jobs_data:
 
     last_refresh: datetime
     jobs: dict
+    history: version_history = field(default_factory=version_history)
+    index: job_list_index | None = None
+    stale: bool = False
+    summary: job_list_summary = field(init=False)
+
+    def __post_init__(self) -> None:
+        self.summary = job_list_summary(self.jobs)
+
+    def set_jobs(self, jobs: dict) -> None:
+        """This function stores fresh jobs and creates a new version if
+        anything changed. The totals are updated for the changed jobs only."""
+        differences = get_dict_differences(self.jobs, jobs)
+        self.summary.apply_differences(self.jobs, jobs, differences)
+        if differences:
+            self.history.add_version(differences)
+            self.index = None
+
+        self.jobs = jobs
+
+    def get_index(self) -> job_list_index:
+        """This function returns the sorted orders of the jobs, which are
+        only rebuilt after the jobs changed."""
+        if self.index is None:
+            self.index = job_list_index(self.jobs)
+
+        return self.index
+
+
+@dataclass
+class job_details_data:
+    """Class for storing the details and tasks of a job people are looking at."""
+
+    last_refresh: datetime
+    last_requested: datetime
+    job_details: dict
+    history: version_history = field(default_factory=version_history)
+    stale: bool = False
+
+    def set_job_details(self, job_details: dict) -> None:
+        """This function stores fresh job details and creates a new version
+        if anything changed."""
+        differences = get_job_details_differences(self.job_details, job_details)
+        if differences:
+            self.history.add_version(differences)
+
+        self.job_details = job_details
 
 
 class deadline_connection:
     """This class handles everything related to the deadline web service.
     It stores job data in memory and has functions for requesting information."""
 
-    deadline_connection = DeadlineCon(WEB_SERVICE_IP_ADDRESS, WEB_SERVICE_PORT)
+    deadline_connection = DeadlineCon(
+        WEB_SERVICE_IP_ADDRESS, WEB_SERVICE_PORT, timeout=WEB_SERVICE_TIMEOUT
+    )
+    circuit_breaker = circuit_breaker()
+
+    def __init__(self) -> None:
+        self.task_reports = OrderedDict()
+        self.task_report_requests = {}
+        self.background_tasks = []
 
     async def set_initial_data(self) -> None:
-        """This function sets the initial data when the class is initialized."""
-        self.active_jobs = jobs_data(datetime.now(), await self.get_fresh_active_jobs())
-        self.recent_jobs = jobs_data(datetime.now(), await self.get_fresh_recent_jobs())
-        self.older_jobs = jobs_data(datetime.now(), await self.get_fresh_older_jobs())
+        """This function sets the initial data when the class is initialized.
+        If there is a snapshot we start with that and fetch fresh data in the
+        background, so clients can connect right away."""
+        self.watched_jobs = {}
+        self.job_details_batcher = request_batcher(
+            self.get_fresh_job_details_batch,
+            DETAILS_BATCH_WINDOW,
+            self.get_upcoming_job_ids,
+        )
+        snapshot = load_snapshot()
+
+        if snapshot is None:
+            await self.set_fresh_initial_data()
+        else:
+            self.active_jobs = jobs_data(
+                datetime.now(), snapshot["active_jobs"], stale=True
+            )
+            self.recent_jobs = jobs_data(
+                datetime.now(), snapshot["recent_jobs"], stale=True
+            )
+            self.older_jobs = jobs_data(
+                datetime.now(), snapshot["older_jobs"], stale=True
+            )
+            queue_ai_texts_for_new_problems(
+                [self.active_jobs.jobs, self.recent_jobs.jobs]
+            )
+            self.background_tasks.append(
+                asyncio.create_task(self.refresh_initial_data())
+            )
+
+        self.background_tasks += [
+            asyncio.create_task(save_snapshots_forever(self.get_job_lists)),
+            asyncio.create_task(pregenerate_ai_texts_forever(self)),
+        ]
+
+    async def set_fresh_initial_data(self) -> None:
+        """This function fetches all job lists from the Deadline Web Service.
+        The recent and older jobs come from the same request."""
+        active_jobs = await self.get_fresh_active_jobs()
+        recent_jobs, older_jobs = await self.get_fresh_inactive_jobs()
+
+        if hasattr(self, "active_jobs"):
+            self.active_jobs.set_jobs(active_jobs)
+            self.recent_jobs.set_jobs(recent_jobs)
+            self.older_jobs.set_jobs(older_jobs)
+
+            for job_list in (self.active_jobs, self.recent_jobs, self.older_jobs):
+                job_list.stale = False
+        else:
+            self.active_jobs = jobs_data(datetime.now(), active_jobs)
+            self.recent_jobs = jobs_data(datetime.now(), recent_jobs)
+            self.older_jobs = jobs_data(datetime.now(), older_jobs)
+
+        queue_ai_texts_for_new_problems([self.active_jobs.jobs, self.recent_jobs.jobs])
         print("[BreakTools] Successfully fetched initial data")
 
+    async def refresh_initial_data(self) -> None:
+        """This function replaces the job lists from the snapshot with fresh ones."""
+        try:
+            await self.set_fresh_initial_data()
+        except Exception as error:  # noqa: BLE001
+            # Nobody awaits this task, so whatever went wrong ends here.
+            print(
+                "[BreakTools] Could not refresh the job snapshot, it will be "
+                f"refreshed on the next request. Error: {error}"
+            )
+            for job_list in (self.active_jobs, self.recent_jobs, self.older_jobs):
+                job_list.last_refresh = datetime.min
+
+    async def poll_job_lists_forever(self) -> None:
+        """This function refreshes the active and recent jobs every
+        BACKGROUND_POLL_INTERVAL seconds, so progress samples are taken and AI
+        texts are written even when no client is connected. Job lists that
+        clients just refreshed aren't fetched again."""
+        if BACKGROUND_POLL_INTERVAL <= 0:
+            return
+
+        while True:
+            await asyncio.sleep(BACKGROUND_POLL_INTERVAL)
+
+            try:
+                await self.get_active_jobs()
+                await self.get_recent_jobs()
+            except Exception as error:  # noqa: BLE001
+                # Nobody awaits this task, so it has to survive on its own.
+                print(f"[BreakTools] Background refresh failed. Error: {error}")
+
+    def get_job_lists(self) -> dict:
+        """This function returns all job lists, for saving them in a snapshot."""
+        return {
+            "active_jobs": self.active_jobs.jobs,
+            "recent_jobs": self.recent_jobs.jobs,
+            "older_jobs": self.older_jobs.jobs,
+        }
+
+    def get_version(self, data_type: str, job_id: str = "") -> int | None:
+        """This function returns the current version of the given type of data."""
+        stored_data = self.get_stored_data(data_type, job_id)
+
+        if stored_data is None:
+            return None
+
+        return stored_data.history.version
+
+    def get_differences_since_version(
+        self, data_type: str, version: int | None, job_id: str = ""
+    ) -> dict | None:
+        """This function returns what changed in the given type of data since
+        the given version. It returns None if the client needs all data instead."""
+        stored_data = self.get_stored_data(data_type, job_id)
+
+        if stored_data is None:
+            return None
+
+        if data_type == "job_details":
+            return stored_data.history.get_differences_since(
+                version, merge_job_details_differences
+            )
+
+        return stored_data.history.get_differences_since(
+            version, merge_dict_differences
+        )
+
+    def get_stored_data(
+        self, data_type: str, job_id: str = ""
+    ) -> jobs_data | job_details_data | None:
+        """This function returns the stored data for the given type of data."""
+        match data_type:
+            case "active_jobs":
+                return self.active_jobs
+            case "recent_jobs":
+                return self.recent_jobs
+            case "older_jobs":
+                return self.older_jobs
+            case "job_details":
+                return self.watched_jobs.get(job_id)
+
+        return None
+
     async def get_job_details_and_tasks(self, job_id: str) -> dict:
-        """This function returns cleaned data from a single job."""
+        """This function returns cleaned data from a single job. The data is
+        shared between everyone looking at the job and refreshed at most once
+        every second. Jobs nobody looked at for a minute are forgotten."""
         if not await self.check_if_job_exists(job_id):
             return {"type": "error", "error": "invalid_jobId"}
 
+        watched_job = self.watched_jobs.get(job_id)
+        cache_result = "miss"
+
+        if watched_job is None:
+            try:
+                watched_job = job_details_data(
+                    datetime.now(),
+                    datetime.now(),
+                    await self.get_fresh_job_details_and_tasks(job_id),
+                )
+            except WebServiceError:
+                return {"type": "error", "error": "web_service_unavailable"}
+
+            self.watched_jobs[job_id] = watched_job
+
+        elif (datetime.now() - watched_job.last_refresh).total_seconds() > 1:
+            await self.refresh_stored_data(
+                watched_job,
+                watched_job.set_job_details,
+                lambda: self.get_fresh_job_details_and_tasks(job_id),
+            )
+
+        else:
+            cache_result = "hit"
+
+        increment(
+            "cache_requests_total", {"cache": "job_details", "result": cache_result}
+        )
+
+        watched_job.last_requested = datetime.now()
+        self.remove_unwatched_jobs()
+
+        return watched_job.job_details
+
+    async def call_web_service(self, endpoint: str, function, *arguments):
+        """This function calls the Deadline Web Service in a thread, so a slow
+        Web Service doesn't block our clients, and keeps track of how long that
+        took. Failed calls are retried a few times with a random backoff, so
+        multiple callers don't all retry at the same moment."""
+        is_probe = self.circuit_breaker.check()
+
+        try:
+            for attempt in range(WEB_SERVICE_RETRIES + 1):
+                try:
+                    with time_block(
+                        "web_service_request_seconds", {"endpoint": endpoint}
+                    ):
+                        result = await asyncio.to_thread(
+                            get_cleaned_response, function, *arguments
+                        )
+
+                except WebServiceError as error:
+                    increment("web_service_errors_total", {"endpoint": endpoint})
+
+                    if not error.retryable:
+                        # The Web Service answered, so it's alive.
+                        self.circuit_breaker.record_success()
+                        raise
+
+                    if attempt == WEB_SERVICE_RETRIES:
+                        self.circuit_breaker.record_failure()
+                        raise
+
+                    await asyncio.sleep(
+                        WEB_SERVICE_RETRY_DELAY * 2**attempt * uniform(0.5, 1.5)
+                    )
+
+                else:
+                    self.circuit_breaker.record_success()
+                    return result
+
+        finally:
+            # A cancelled or crashed test request must not keep the breaker half open.
+            if is_probe:
+                self.circuit_breaker.end_probe()
+
+    async def refresh_stored_data(self, stored_data, set_data, get_fresh_data) -> None:
+        """This function replaces stored data with fresh data. If the Web Service
+        is having trouble we keep the old data and flag it as stale."""
+        stored_data.last_refresh = datetime.now()
+
+        try:
+            fresh_data = await get_fresh_data()
+        except WebServiceError as error:
+            if not stored_data.stale:
+                print(f"[BreakTools] Serving stale data. Error: {error}")
+
+            stored_data.stale = True
+            return
+
+        set_data(fresh_data)
+        stored_data.stale = False
+
+    def is_stale(self, data_type: str, job_id: str = "") -> bool:
+        """This function checks if the stored data for the given type of data
+        could not be refreshed the last time we tried."""
+        stored_data = self.get_stored_data(data_type, job_id)
+
+        return stored_data is not None and stored_data.stale
+
+    def remove_unwatched_jobs(self) -> None:
+        """This function forgets the jobs nobody has looked at for a minute."""
+        for job_id, watched_job in list(self.watched_jobs.items()):
+            seconds_ago = (datetime.now() - watched_job.last_requested).total_seconds()
+            if seconds_ago > WATCHED_JOB_TIMEOUT:
+                del self.watched_jobs[job_id]
+
+    async def get_fresh_job_details_and_tasks(self, job_id: str) -> dict:
+        """This function retrieves the details and tasks of a single job
+        from the Deadline Web Service."""
+        # The details come from a batch shared with other jobs, so only
+        # cleaning them is left to do here.
+        job_details = await self.job_details_batcher.get(job_id)
+
         job_details_and_tasks = {
-            "job": get_clean_job_detail_data(
-                job_id,
-                self.deadline_connection.Jobs.GetJobDetails(job_id),
+            "job": get_cleaned_response(
+                get_clean_job_detail_data, job_id, {job_id: job_details}
             ),
-            "tasks": get_clean_task_data(
-                self.deadline_connection.Tasks.GetJobTasks(job_id)
+            "tasks": await self.call_web_service(
+                "GetJobTasks",
+                lambda: get_clean_task_data(
+                    self.deadline_connection.Tasks.GetJobTasks(job_id)
+                ),
             ),
         }
 
         return job_details_and_tasks
 
-    async def get_job_error(self, job_id: str, task_id: int) -> dict:
-        """This function retrieves the error task report for the given job and task."""
+    async def get_fresh_job_details_batch(self, job_ids: list) -> dict:
+        """This function retrieves the details of multiple jobs with a single
+        call to the Deadline Web Service."""
+        job_details = await self.call_web_service(
+            "GetJobDetails", self.deadline_connection.Jobs.GetJobDetails, job_ids
+        )
 
-        try:
-            return self.deadline_connection.TaskReports.GetAllTaskErrorReportsContents(
-                job_id, task_id
-            )[0]
-        except IndexError:
-            return "Error: Could not find any crash reports."
+        if not isinstance(job_details, dict):
+            return {}
+
+        return job_details
+
+    def get_upcoming_job_ids(self) -> list:
+        """This function returns the watched jobs that will need fresh details
+        within the next second, so they can be fetched in the same call."""
+        return [
+            job_id
+            for job_id, watched_job in self.watched_jobs.items()
+            if (datetime.now() - watched_job.last_refresh).total_seconds()
+            > PREFETCH_DETAILS_AGE
+            and (datetime.now() - watched_job.last_requested).total_seconds()
+            < PREFETCH_REQUESTED_WITHIN
+        ]
+
+    async def get_job_error(self, job_id: str, task_id: int) -> str:
+        """This function retrieves the error task report for the given job and task."""
+        return await self.get_task_report(job_id, task_id, "error")
 
-    async def get_job_warning(self, job_id: str, task_id: int) -> dict:
+    async def get_job_warning(self, job_id: str, task_id: int) -> str:
         """This function retrieves the whole task report for the given job and task."""
+        return await self.get_task_report(job_id, task_id, "all")
+
+    async def get_task_report(self, job_id: str, task_id: int, report_type: str) -> str:
+        """This function retrieves the first report of a task. Reports never change
+        once they're written, so they are cached, and viewers or AI texts asking
+        for the same report at the same time share a single download."""
+        key = (job_id, int(task_id), report_type, 0)
+
+        if key in self.task_reports:
+            self.task_reports.move_to_end(key)
+            increment(
+                "cache_requests_total", {"cache": "task_reports", "result": "hit"}
+            )
+            return self.task_reports[key]
+
+        increment("cache_requests_total", {"cache": "task_reports", "result": "miss"})
+
+        if key not in self.task_report_requests:
+            request = asyncio.create_task(self.get_fresh_task_report(*key))
+            request.add_done_callback(
+                lambda _: self.task_report_requests.pop(key, None)
+            )
+            self.task_report_requests[key] = request
 
         try:
-            return self.deadline_connection.TaskReports.GetAllTaskReportsContents(
-                job_id, task_id
-            )[0]
-        except IndexError:
+            report = await asyncio.shield(self.task_report_requests[key])
+        except WebServiceError:
+            return "Error: Could not reach the Deadline Web Service."
+
+        if report is None:
             return "Error: Could not find any crash reports."
 
+        return report
+
+    async def get_fresh_task_report(
+        self, job_id: str, task_id: int, report_type: str, report_index: int
+    ) -> str | None:
+        """This function downloads only the first report of a task, and at most
+        TASK_REPORT_MAX_LENGTH characters of it, then stores it in the cache.
+        It returns None if the task has no reports (yet)."""
+        if report_type == "error":
+            endpoint = "GetFirstTaskErrorReportContents"
+            function = (
+                self.deadline_connection.TaskReports.GetFirstTaskErrorReportContents
+            )
+        else:
+            endpoint = "GetFirstTaskReportContents"
+            function = self.deadline_connection.TaskReports.GetFirstTaskReportContents
+
+        report, cut_off = await self.call_web_service(
+            endpoint, function, job_id, task_id, TASK_REPORT_MAX_LENGTH
+        )
+
+        if report is None:
+            return None
+
+        if cut_off:
+            report += "\n[The rest of this report was too long and has been left out.]"
+
+        self.task_reports[(job_id, task_id, report_type, report_index)] = report
+        while len(self.task_reports) > TASK_REPORT_CACHE_SIZE:
+            self.task_reports.popitem(last=False)
+
+        return report
+
     async def get_task_image_path(self, job_id: str, task_id: int) -> str:
         """This function retrieves the path to an exr file for a given job and task."""
 
-        task_frame_range = self.deadline_connection.Tasks.GetJobTask(job_id, task_id)[
-            "Frames"
-        ]
-
-        output_path = self.deadline_connection.Jobs.GetJobDetails(job_id)[job_id][
-            "Output Directories"
-        ]["Output Path 1"]
+        task_frame_range = (
+            await self.call_web_service(
+                "GetJobTask", self.deadline_connection.Tasks.GetJobTask, job_id, task_id
+            )
+        )["Frames"]
 
-        file_name = self.deadline_connection.Jobs.GetJobDetails(job_id)[job_id][
-            "Output Filenames"
-        ]["Output File 1"]
+        job_details = await self.job_details_batcher.get(job_id) or {}
+        output_path = job_details["Output Directories"]["Output Path 1"]
+        file_name = job_details["Output Filenames"]["Output File 1"]
 
         return get_constructed_image_path(task_frame_range, output_path, file_name)
 
-    async def get_fresh_active_jobs(self) -> dict:
-        """This function retrieves all active jobs from the Deadline Web Service."""
+    async def get_task_image_paths(self, job_id: str) -> dict:
+        """This function returns the paths to the exr files of all tasks of a job.
+        The tasks come from the same cache as the job details page, so this
+        needs at most two calls to the Web Service no matter how many tasks
+        the job has."""
+        job_details_and_tasks = await self.get_job_details_and_tasks(job_id)
+        if "error" in job_details_and_tasks:
+            raise WebServiceError(job_details_and_tasks["error"])
+
+        tasks = job_details_and_tasks["tasks"]
 
-        active_jobs = self.deadline_connection.Jobs.GetJobsInState("Active")
+        job_details = await self.job_details_batcher.get(job_id) or {}
+        output_path = job_details["Output Directories"]["Output Path 1"]
+        file_name = job_details["Output Filenames"]["Output File 1"]
 
-        cleaned_active_jobs = {}
-        for job in active_jobs:
-            cleaned_date = get_clean_date(job["DateStart"])
-            cleaned_active_jobs[job["_id"]] = get_clean_job_data(job, cleaned_date)
+        return {
+            int(task_id): get_constructed_image_path(frames, output_path, file_name)
+            for task_id, frames in zip(tasks.task_ids, tasks.frames, strict=True)
+        }
 
-        return cleaned_active_jobs
+    async def get_stored_ai_text(self, job_id: str, prompt_type: str) -> str | None:
+        """This function returns the AI text that was written earlier for a job
+        in the given state, or None if there isn't one yet."""
+        return AI_TEXTS.get(job_id, {}).get(prompt_type)
+
+    async def get_signature_ai_text(
+        self, signature: str, prompt_type: str
+    ) -> str | None:
+        """This function returns the AI text that was written earlier for
+        a log with the same error signature, or None if there isn't one."""
+        return get_signature_ai_text(signature, prompt_type)
+
+    async def get_progress_history(self, job_id: str, window: str) -> dict:
+        """This function returns the progress chart of a job, built from
+        the samples taken every time the active jobs were refreshed."""
+        return get_progress_history(job_id, window)
+
+    async def get_jobs(self, data_type: str) -> dict:
+        """This function returns the stored jobs for the given job list."""
+        match data_type:
+            case "active_jobs":
+                return await self.get_active_jobs()
+            case "recent_jobs":
+                return await self.get_recent_jobs()
+            case "older_jobs":
+                return await self.get_older_jobs()
+
+        return {}
+
+    async def get_farm_summary(self) -> dict:
+        """This function returns the totals of every job list."""
+        farm_summary = {}
+
+        for data_type in self.get_job_lists():
+            await self.get_jobs(data_type)
+            farm_summary[data_type] = self.get_stored_data(
+                data_type
+            ).summary.get_summary()
+
+        return farm_summary
+
+    async def get_jobs_page(self, data_type: str, page_query: dict) -> dict:
+        """This function returns a single page of the given job list,
+        filtered and sorted according to the page query."""
+        await self.get_jobs(data_type)
+
+        return self.get_stored_data(data_type).get_index().get_page(page_query)
+
+    async def get_fresh_active_jobs(self) -> dict:
+        """This function retrieves all active jobs from the Deadline Web Service."""
+
+        return await self.call_web_service(
+            "GetJobsInState",
+            lambda: get_clean_jobs(
+                self.deadline_connection.Jobs.StreamJobsInState("Active")
+            ),
+        )
 
     async def get_active_jobs(self) -> dict:
         """This function returns the active jobs stored in memory.
@@ -123,28 +729,128 @@ class deadline_connection:
         fresh information and returns that instead."""
 
         if (datetime.now() - self.active_jobs.last_refresh).total_seconds() > 3:
-            self.active_jobs.last_refresh = datetime.now()
-            self.active_jobs.jobs = await self.get_fresh_active_jobs()
+            increment(
+                "cache_requests_total", {"cache": "active_jobs", "result": "miss"}
+            )
+            await self.refresh_stored_data(
+                self.active_jobs, self.active_jobs.set_jobs, self.get_fresh_active_jobs
+            )
+            queue_ai_texts_for_new_problems(
+                [self.active_jobs.jobs, self.recent_jobs.jobs]
+            )
+            record_job_progress(self.active_jobs.jobs)
 
             return self.active_jobs.jobs
 
         else:
+            increment("cache_requests_total", {"cache": "active_jobs", "result": "hit"})
             return self.active_jobs.jobs
 
-    async def get_fresh_recent_jobs(self) -> dict:
-        """This function returns a fresh list of inactive jobs that occured
-        less than 48 hours ago."""
+    async def get_fresh_inactive_jobs(self) -> tuple[dict, dict]:
+        """This function returns fresh lists of inactive jobs that occured less
+        than 48 hours ago and jobs that occured more than 48 hours ago, but less
+        than 2 weeks ago. Feel free to change according to your definition of old.
+        Inactive jobs hardly ever change, so we only fetch the ones that are new,
+        stopped being active or aren't finished, and fetch all of them once in
+        a while."""
+        if (
+            not hasattr(self, "inactive_jobs")
+            or INACTIVE_RESYNC_INTERVAL <= 0
+            or (datetime.now() - self.last_inactive_resync).total_seconds()
+            > INACTIVE_RESYNC_INTERVAL
+            or not await self.update_inactive_jobs()
+        ):
+            await self.resync_inactive_jobs()
 
-        inactive_jobs = self.deadline_connection.Jobs.GetJobsInStates(
-            ["Suspended", "Completed", "Failed", "Pending"]
-        )
         recent_jobs = {}
+        older_jobs = {}
+
+        for job_id, job in self.inactive_jobs.items():
+            seconds_ago = time() - job["EpochStarted"]
+
+            if seconds_ago < 172800:
+                recent_jobs[job_id] = job
+            elif seconds_ago < 483840:
+                older_jobs[job_id] = job
+
+        return recent_jobs, older_jobs
+
+    async def resync_inactive_jobs(self) -> None:
+        """This function fetches all inactive jobs from the Deadline Web Service.
+        This is the biggest response by far, so the jobs are cleaned one at a
+        time while it's being downloaded."""
+        self.inactive_jobs = await self.call_web_service(
+            "GetJobsInStates",
+            lambda: get_clean_jobs(
+                self.deadline_connection.Jobs.StreamJobsInStates(INACTIVE_STATES)
+            ),
+        )
+        self.ignored_job_ids = set()
+        self.last_inactive_resync = datetime.now()
+
+    async def update_inactive_jobs(self) -> bool:
+        """This function updates the stored inactive jobs using the list of
+        all job IDs, which is a lot smaller than the jobs themselves. Only jobs
+        we don't know yet are fetched, which are new jobs and jobs that stopped
+        being active, together with the unfinished jobs we know, as those can
+        move between inactive states. It returns False if the Web Service
+        didn't cooperate."""
+        job_ids = await self.call_web_service(
+            "GetJobIds", self.deadline_connection.Jobs.GetJobIds
+        )
+
+        if not isinstance(job_ids, list):
+            return False
+
+        job_ids = set(job_ids)
+        active_job_ids = set(await self.get_active_jobs())
+
+        for job_id in list(self.inactive_jobs):
+            if job_id not in job_ids or job_id in active_job_ids:
+                del self.inactive_jobs[job_id]
+
+        self.ignored_job_ids &= job_ids
+        unknown_job_ids = sorted(
+            job_ids - self.inactive_jobs.keys() - active_job_ids - self.ignored_job_ids
+        )
+        # Suspended, failed and pending jobs can change state (like from
+        # suspended to pending) without ever becoming active.
+        unfinished_job_ids = sorted(
+            job_id
+            for job_id, job in self.inactive_jobs.items()
+            if any(job[chunk_type] for chunk_type in UNFINISHED_CHUNK_TYPES)
+        )
+        fetched_job_ids = unknown_job_ids + unfinished_job_ids
+
+        for batch_start in range(0, len(fetched_job_ids), JOB_REQUEST_BATCH_SIZE):
+            batch_job_ids = fetched_job_ids[
+                batch_start : batch_start + JOB_REQUEST_BATCH_SIZE
+            ]
+            sorted_jobs = await self.call_web_service(
+                "GetJobs",
+                lambda job_ids: get_sorted_inactive_jobs(
+                    self.deadline_connection.Jobs.GetJobs(job_ids)
+                ),
+                batch_job_ids,
+            )
+
+            if sorted_jobs is None:
+                return False
+
+            inactive_jobs, ignored_job_ids = sorted_jobs
+            # Known jobs that became active or ignored are dropped.
+            for job_id in batch_job_ids:
+                self.inactive_jobs.pop(job_id, None)
 
-        for job in inactive_jobs:
-            cleaned_date = get_clean_date(job["DateStart"])
-            if (datetime.now() - cleaned_date).total_seconds() < 172800:
-                recent_jobs[job["_id"]] = get_clean_job_data(job, cleaned_date)
+            self.inactive_jobs.update(inactive_jobs)
+            self.ignored_job_ids |= ignored_job_ids
 
+        return True
+
+    async def get_fresh_recent_jobs(self) -> dict:
+        """This function returns a fresh list of inactive jobs that occured
+        less than 48 hours ago."""
+        recent_jobs, _ = await self.get_fresh_inactive_jobs()
         return recent_jobs
 
     async def get_recent_jobs(self) -> dict:
@@ -153,30 +859,26 @@ class deadline_connection:
         fresh information and returns that instead."""
 
         if (datetime.now() - self.recent_jobs.last_refresh).total_seconds() > 60:
-            self.recent_jobs.last_refresh = datetime.now()
-            self.recent_jobs.jobs = await self.get_fresh_recent_jobs()
+            increment(
+                "cache_requests_total", {"cache": "recent_jobs", "result": "miss"}
+            )
+            await self.refresh_stored_data(
+                self.recent_jobs, self.recent_jobs.set_jobs, self.get_fresh_recent_jobs
+            )
+            queue_ai_texts_for_new_problems(
+                [self.active_jobs.jobs, self.recent_jobs.jobs]
+            )
 
             return self.recent_jobs.jobs
 
         else:
+            increment("cache_requests_total", {"cache": "recent_jobs", "result": "hit"})
             return self.recent_jobs.jobs
 
     async def get_fresh_older_jobs(self) -> dict:
-        """This function returns a fresh list of jobs that occured more than 48 hours ago,
-        but less than 2 weeks ago. Feel free to change according to your definition of old.
-        """
-
-        inactive_jobs = self.deadline_connection.Jobs.GetJobsInStates(
-            ["Suspended", "Completed", "Failed", "Pending"]
-        )
-        older_jobs = {}
-
-        for job in inactive_jobs:
-            cleaned_date = get_clean_date(job["DateStart"])
-
-            if 172800 < (datetime.now() - cleaned_date).total_seconds() < 483840:
-                older_jobs[job["_id"]] = get_clean_job_data(job, cleaned_date)
-
+        """This function returns a fresh list of jobs that occured more than
+        48 hours ago, but less than 2 weeks ago."""
+        _, older_jobs = await self.get_fresh_inactive_jobs()
         return older_jobs
 
     async def get_older_jobs(self) -> dict:
@@ -185,12 +887,15 @@ class deadline_connection:
         fresh information and returns that instead."""
 
         if (datetime.now() - self.older_jobs.last_refresh).total_seconds() > 3600:
-            self.older_jobs.last_refresh = datetime.now()
-            self.older_jobs.jobs = await self.get_fresh_older_jobs()
+            increment("cache_requests_total", {"cache": "older_jobs", "result": "miss"})
+            await self.refresh_stored_data(
+                self.older_jobs, self.older_jobs.set_jobs, self.get_fresh_older_jobs
+            )
 
             return self.older_jobs.jobs
 
         else:
+            increment("cache_requests_total", {"cache": "older_jobs", "result": "hit"})
             return self.older_jobs.jobs
 
     async def check_if_job_exists(self, job_id: str) -> bool:
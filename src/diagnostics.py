@@ -0,0 +1,140 @@
+"""
+Diagnostics for the BreakTools Deadline Web App by Mervin van Brakel (2023)
+
+Everything in this backend runs on a single event loop, so one blocking call
+stalls every client. Setting DIAGNOSTICS to true turns on a few tools to find
+out where that happens, without having to redeploy:
+- asyncio's debug mode, which logs every callback slower than SLOW_CALLBACK_SECONDS
+  together with the coroutine it was running.
+- A log line for every client message that took longer than that to handle.
+- A sampling profiler that records the stacks of the event loop thread for
+  PROFILE_SECONDS and writes them to PROFILE_FOLDER in the collapsed stack format
+  flame graph tools read. Start it with SIGUSR1 or a dump_profile message
+  containing ADMIN_TOKEN.
+"""
+
+import asyncio
+import logging
+import signal
+import sys
+import threading
+from collections import Counter
+from datetime import datetime
+from os import getenv
+from pathlib import Path
+from time import monotonic, sleep
+
+from dotenv import load_dotenv
+
+from metrics import describe, observe
+
+load_dotenv()
+
+DIAGNOSTICS = getenv("DIAGNOSTICS", "false").lower() == "true"
+SLOW_CALLBACK_SECONDS = float(getenv("SLOW_CALLBACK_SECONDS", "0.1"))
+PROFILE_SECONDS = float(getenv("PROFILE_SECONDS", "10"))
+PROFILE_INTERVAL = float(getenv("PROFILE_INTERVAL", "0.005"))
+PROFILE_FOLDER = getenv("PROFILE_FOLDER", ".")
+ADMIN_TOKEN = getenv("ADMIN_TOKEN", "")
+
+PROFILER_LOCK = threading.Lock()
+
+
+def enable_diagnostics() -> None:
+    """This function turns on asyncio's slow callback warnings and the
+    profiling signal, if diagnostics are enabled."""
+    if not DIAGNOSTICS:
+        return
+
+    loop = asyncio.get_running_loop()
+    loop.set_debug(True)
+    loop.slow_callback_duration = SLOW_CALLBACK_SECONDS
+    logging.basicConfig(format="[BreakTools] %(name)s: %(message)s")
+    logging.getLogger("asyncio").setLevel(logging.WARNING)
+
+    if hasattr(signal, "SIGUSR1"):
+        loop.add_signal_handler(signal.SIGUSR1, start_profiler)
+
+    print(
+        "[BreakTools] Diagnostics enabled, logging callbacks slower than "
+        f"{SLOW_CALLBACK_SECONDS} seconds."
+    )
+
+
+def record_handler_span(message_type: str, duration: float) -> None:
+    """This function records how long handling a client message took."""
+    observe("message_handling_seconds", duration, {"type": message_type})
+
+    if DIAGNOSTICS and duration > SLOW_CALLBACK_SECONDS:
+        print(
+            f"[BreakTools] Handling a {message_type} message took "
+            f"{duration:.3f} seconds."
+        )
+
+
+def is_admin_message(message: dict) -> bool:
+    """This function checks if a message may use the admin tools."""
+    return DIAGNOSTICS and bool(ADMIN_TOKEN) and message.get("token") == ADMIN_TOKEN
+
+
+def start_profiler() -> bool:
+    """This function starts the sampling profiler in a background thread.
+    It returns False if the profiler is already running."""
+    if not PROFILER_LOCK.acquire(blocking=False):
+        return False
+
+    threading.Thread(
+        target=run_profiler,
+        args=(threading.main_thread().ident,),
+        daemon=True,
+    ).start()
+    return True
+
+
+def run_profiler(thread_id: int) -> None:
+    """This function samples the stack of the given thread for a while,
+    then writes how often every stack was seen to a file."""
+    try:
+        print(f"[BreakTools] Profiling the event loop for {PROFILE_SECONDS} seconds.")
+        stack_counts = Counter()
+        stop_time = monotonic() + PROFILE_SECONDS
+
+        while monotonic() < stop_time:
+            # There is no public way to look at the stack of another thread.
+            frame = sys._current_frames().get(thread_id)  # noqa: SLF001
+            stack = []
+
+            while frame is not None:
+                code = frame.f_code
+                stack.append(
+                    f"{code.co_name} ({Path(code.co_filename).name}:"
+                    f"{frame.f_lineno})"
+                )
+                frame = frame.f_back
+
+            if stack:
+                stack_counts[";".join(reversed(stack))] += 1
+
+            sleep(PROFILE_INTERVAL)
+
+        profile_path = (
+            Path(PROFILE_FOLDER) / f"profile-{datetime.now():%Y%m%d-%H%M%S}.txt"
+        )
+        with profile_path.open("w") as file:
+            for stack, count in stack_counts.most_common():
+                file.write(f"{stack} {count}\n")
+
+        print(f"[BreakTools] Wrote profile to {profile_path}.")
+
+    except OSError as error:
+        print(f"[BreakTools] Could not write profile. Error: {error}")
+
+    finally:
+        PROFILER_LOCK.release()
+
+
+describe(
+    "message_handling_seconds",
+    "histogram",
+    "Time spent handling client messages per message type.",
+)
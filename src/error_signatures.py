@@ -0,0 +1,136 @@
+"""
+Error signatures for the BreakTools Deadline Web App by Mervin van Brakel (2023)
+
+When a broken plugin or a missing texture crashes fifty jobs, their error logs only
+differ in timestamps, paths, frame numbers and the names of the render nodes. So the
+key error lines of a log are cleaned of those and hashed into a signature, and AI
+texts are stored per signature as well as per job. That way a failure we've seen
+before gets its AI text right away, without asking OpenAI about it again.
+"""
+
+import re
+from collections import OrderedDict
+from hashlib import sha1
+from os import getenv
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+SIGNATURE_CACHE_SIZE = int(getenv("SIGNATURE_CACHE_SIZE", "500"))
+SIGNATURE_LINE_COUNT = 20
+
+AI_TEXTS_BY_SIGNATURE = OrderedDict()
+
+KEY_LINE_PATTERN = re.compile(
+    r"error|exception|traceback|fatal|failed|cannot|can't|could not|unable|"
+    r"missing|not found|denied|warning",
+    re.IGNORECASE,
+)
+# Render node names can be anything, like gpu-box, so we look for the names the
+# log gives to a worker or machine and remove them everywhere in the log. Without
+# a "name:" label only names with a digit or dash count, so "worker failed"
+# doesn't make us remove every "failed".
+HOST_NAME_PATTERNS = (
+    re.compile(
+        r"\b(?:worker|slave|machine|computer|host|node)\s*name\s*[:=]\s*"
+        r"['\"]?([a-z][\w.-]*\w)",
+        re.IGNORECASE,
+    ),
+    re.compile(
+        r"\b(?:worker|slave|machine|computer|host|node)\s*[:=]?\s*"
+        r"['\"]?([a-z][\w.]*[-\d][\w.-]*)",
+        re.IGNORECASE,
+    ),
+)
+CLEANING_PATTERNS = (
+    # IP addresses, before their numbers look like a date
+    (re.compile(r"\b\d{1,3}(\.\d{1,3}){3}(:\d+)?\b"), "<host>"),
+    # Dates and times, like 2023-10-18 or 18/10/2023 and 14:03:12.123
+    (re.compile(r"\d{1,4}[-/.]\d{1,2}[-/.]\d{1,4}"), "<date>"),
+    (
+        re.compile(r"\d{1,2}:\d{2}(:\d{2})?([.,]\d+)?\s*(am|pm)?", re.IGNORECASE),
+        "<time>",
+    ),
+    # Windows, UNC and Unix paths
+    (re.compile(r"\b[a-z]:[\\/][^\s'\"<>|]*", re.IGNORECASE), "<path>"),
+    (re.compile(r"\\\\[^\s'\"<>|]+"), "<path>"),
+    (re.compile(r"(?<![\w<])/[^\s'\"<>|]+"), "<path>"),
+    # Host names with a domain
+    (re.compile(r"\b[\w-]+(\.[\w-]+)+\.(com|net|org|local|lan|internal)\b"), "<host>"),
+    # Memory addresses, then every other number, like frames and node numbers
+    (re.compile(r"\b0x[0-9a-f]+\b", re.IGNORECASE), "<address>"),
+    (re.compile(r"\d+"), "#"),
+)
+
+
+def get_error_signature(log: str) -> str:
+    """This function returns the signature of a log. Logs of the same
+    failure on different jobs, frames and render nodes get the same one."""
+    lines = [line for line in log.splitlines() if line.strip()]
+    key_lines = [line for line in lines if KEY_LINE_PATTERN.search(line)]
+
+    # Logs without recognisable error lines usually end with the problem.
+    key_lines = key_lines[:SIGNATURE_LINE_COUNT] or lines[-SIGNATURE_LINE_COUNT:]
+
+    host_name_pattern = get_host_name_pattern(log)
+
+    cleaned_lines = []
+    for line in key_lines:
+        cleaned_line = line
+        if host_name_pattern is not None:
+            cleaned_line = host_name_pattern.sub("<host>", cleaned_line)
+        for pattern, replacement in CLEANING_PATTERNS:
+            cleaned_line = pattern.sub(replacement, cleaned_line)
+
+        cleaned_lines.append(" ".join(cleaned_line.lower().split()))
+
+    return sha1("\n".join(cleaned_lines).encode()).hexdigest()
+
+
+def get_host_name_pattern(log: str) -> re.Pattern | None:
+    """This function returns a pattern that matches the names of the render
+    nodes mentioned in a log, or None if it doesn't mention any."""
+    host_names = {
+        name.lower() for pattern in HOST_NAME_PATTERNS for name in pattern.findall(log)
+    }
+
+    if not host_names:
+        return None
+
+    # Longer names first, so render-01.studio isn't matched as render-01.
+    names = sorted(host_names, key=len, reverse=True)
+    return re.compile(
+        r"(?<![\w.-])(" + "|".join(map(re.escape, names)) + r")(?![\w-])",
+        re.IGNORECASE,
+    )
+
+
+def get_first_key_line(log: str) -> str | None:
+    """This function returns the first line of a log that looks like an error."""
+    for line in log.splitlines():
+        if KEY_LINE_PATTERN.search(line):
+            return line.strip()
+
+    return None
+
+
+def get_signature_ai_text(signature: str, prompt_type: str) -> str | None:
+    """This function returns the AI text written for an earlier log with the
+    same signature and prompt type, or None if there isn't one."""
+    ai_text = AI_TEXTS_BY_SIGNATURE.get((signature, prompt_type))
+
+    if ai_text is not None:
+        AI_TEXTS_BY_SIGNATURE.move_to_end((signature, prompt_type))
+
+    return ai_text
+
+
+def store_signature_ai_text(signature: str, prompt_type: str, ai_text: str) -> None:
+    """This function stores an AI text for a signature. Only the
+    SIGNATURE_CACHE_SIZE most recently used signatures are kept."""
+    AI_TEXTS_BY_SIGNATURE[(signature, prompt_type)] = ai_text
+    AI_TEXTS_BY_SIGNATURE.move_to_end((signature, prompt_type))
+
+    while len(AI_TEXTS_BY_SIGNATURE) > SIGNATURE_CACHE_SIZE:
+        AI_TEXTS_BY_SIGNATURE.popitem(last=False)
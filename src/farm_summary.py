@@ -0,0 +1,79 @@
+"""
+Farm summaries for the BreakTools Deadline Web App by Mervin van Brakel (2023)
+
+Dashboards and wall monitors only want to know how busy the farm is, like how
+many chunks are rendering or failed and how many jobs every user has. Summing
+the whole job list for that on every refresh gets slow on big farms, so every
+job list keeps its totals and only the jobs that changed are subtracted and
+added again. Clients can subscribe to these totals with get_farm_summary,
+which is a few hundred bytes instead of the whole job list.
+"""
+
+SUMMED_FIELDS = (
+    "CompletedChunks",
+    "QueuedChunks",
+    "SuspendedChunks",
+    "RenderingChunks",
+    "FailedChunks",
+    "PendingChunks",
+    "Errs",
+)
+
+
+def get_job_count(job: dict, field: str) -> int:
+    """This function returns a count of a job, or 0 if it's missing."""
+    try:
+        return int(job.get(field) or 0)
+    except (TypeError, ValueError):
+        return 0
+
+
+class job_list_summary:
+    """Class for keeping the totals of a job list up to date."""
+
+    def __init__(self, jobs: dict) -> None:
+        self.job_count = 0
+        self.totals = dict.fromkeys(SUMMED_FIELDS, 0)
+        self.jobs_per_user = {}
+
+        for job in jobs.values():
+            self.add_job(job, 1)
+
+    def add_job(self, job: dict, sign: int) -> None:
+        """This function adds the counts of a job to the totals,
+        or subtracts them when the sign is -1."""
+        self.job_count += sign
+
+        for field in SUMMED_FIELDS:
+            self.totals[field] += sign * get_job_count(job, field)
+
+        user = job.get("User", "")
+        self.jobs_per_user[user] = self.jobs_per_user.get(user, 0) + sign
+        if self.jobs_per_user[user] <= 0:
+            del self.jobs_per_user[user]
+
+    def apply_differences(
+        self, old_jobs: dict, new_jobs: dict, differences: dict
+    ) -> None:
+        """This function updates the totals for the jobs that changed. The
+        differences only contain changed and new jobs, so removed jobs are
+        only looked for when the number of jobs says there are any."""
+        changed_job_ids = list(differences)
+        new_job_count = sum(job_id not in old_jobs for job_id in changed_job_ids)
+
+        if len(old_jobs) + new_job_count != len(new_jobs):
+            changed_job_ids.extend(old_jobs.keys() - new_jobs.keys())
+
+        for job_id in changed_job_ids:
+            if job_id in old_jobs:
+                self.add_job(old_jobs[job_id], -1)
+            if job_id in new_jobs:
+                self.add_job(new_jobs[job_id], 1)
+
+    def get_summary(self) -> dict:
+        """This function returns the totals as they are sent to clients."""
+        return {
+            "jobs": self.job_count,
+            **self.totals,
+            "users": dict(self.jobs_per_user),
+        }
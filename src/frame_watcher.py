@@ -0,0 +1,246 @@
+"""
+Frame watching for the BreakTools Deadline Web App by Mervin van Brakel (2023)
+
+Deadline only tells us a task finished, not when its frame actually shows up on
+the storage, which can take a while on a busy file server. So the output folders
+of the jobs clients are looking at get watched, and clients get a frame_ready
+message as soon as a frame is fully written. A frame counts as fully written when
+its size and modification time stop changing, which also turns a burst of write
+events into a single message. When watchdog is installed the folders are watched
+with inotify (or whatever the OS has), otherwise they are polled.
+"""
+
+import asyncio
+import json
+from functools import cache
+from os import getenv
+from os.path import normpath
+from pathlib import Path
+
+from dotenv import load_dotenv
+from websockets.exceptions import ConnectionClosed
+
+from DeadlineConnect import WebServiceError
+from optional_features import get_optional_module, prewarm_contact_sheet
+
+load_dotenv()
+
+FRAME_WATCHER = getenv("FRAME_WATCHER", "true").lower() == "true"
+FRAME_WATCH_INTERVAL = float(getenv("FRAME_WATCH_INTERVAL", "2"))
+FRAME_SETTLE_SECONDS = float(getenv("FRAME_SETTLE_SECONDS", "1"))
+
+JOB_WATCHERS = {}
+WATCHED_FOLDERS = {}
+PREWARM_TASKS = set()
+
+
+class folder_event_handler:
+    """Class for passing watchdog events from its thread to the event loop.
+    watchdog only needs a dispatch function, so this doesn't subclass anything."""
+
+    def __init__(self, folder: str, loop: asyncio.AbstractEventLoop) -> None:
+        self.folder = folder
+        self.loop = loop
+
+    def dispatch(self, event) -> None:
+        """This function gets called by watchdog for every change in the folder."""
+        self.loop.call_soon_threadsafe(mark_folder_changed, self.folder)
+
+
+class job_watcher:
+    """Class for watching the frames of a single job for the clients looking at it."""
+
+    def __init__(self, job_id: str, image_paths: dict) -> None:
+        self.job_id = job_id
+        self.image_paths = image_paths
+        self.folders = {normpath(Path(path).parent) for path in image_paths.values()}
+        self.subscribers = set()
+        self.ready_versions = {}
+        self.seen_versions = {}
+        self.changed = asyncio.Event()
+        self.uses_events = False
+        self.task = None
+
+    def get_file_versions(self) -> dict:
+        """This function returns the modification time and size of every frame,
+        or None for frames that aren't there (yet)."""
+        file_versions = {}
+
+        for task_id, path in self.image_paths.items():
+            try:
+                file_stats = Path(path).stat()
+                file_versions[task_id] = (file_stats.st_mtime_ns, file_stats.st_size)
+            except OSError:
+                file_versions[task_id] = None
+
+        return file_versions
+
+    async def watch_forever(self) -> None:
+        """This function checks the frames whenever the folder changed, or every
+        FRAME_WATCH_INTERVAL seconds without watchdog, and tells the subscribed
+        clients about frames that are done being written."""
+        try:
+            await start_watching_folders(self)
+
+            # Frames that are already there when we start aren't news.
+            self.ready_versions = await asyncio.to_thread(self.get_file_versions)
+            self.seen_versions = self.ready_versions
+
+            while self.subscribers:
+                if self.uses_events:
+                    await self.changed.wait()
+                    self.changed.clear()
+                    # Waiting a moment turns a burst of events into one check.
+                    await asyncio.sleep(FRAME_SETTLE_SECONDS)
+                else:
+                    await asyncio.sleep(FRAME_WATCH_INTERVAL)
+
+                file_versions = await asyncio.to_thread(self.get_file_versions)
+
+                ready_task_ids = []
+                still_writing = False
+
+                for task_id, version in file_versions.items():
+                    if version is None or version == self.ready_versions.get(task_id):
+                        continue
+
+                    if version == self.seen_versions.get(task_id):
+                        ready_task_ids.append(task_id)
+                        self.ready_versions[task_id] = version
+                    else:
+                        still_writing = True
+
+                self.seen_versions = file_versions
+
+                if still_writing:
+                    # No events come in once writing stops, so check once more.
+                    self.changed.set()
+
+                if ready_task_ids:
+                    await self.send_frame_ready(ready_task_ids)
+
+        finally:
+            stop_watching_folders(self)
+
+            # New clients shouldn't subscribe to a watcher that stopped.
+            if JOB_WATCHERS.get(self.job_id) is self:
+                del JOB_WATCHERS[self.job_id]
+
+    async def send_frame_ready(self, task_ids: list) -> None:
+        """This function tells all subscribed clients which frames are ready
+        and updates the cached contact sheet of the job, if there is one.
+        Clients that are gone or can't keep up are unsubscribed."""
+        message = json.dumps(
+            {"type": "frame_ready", "job_id": self.job_id, "task_ids": task_ids}
+        )
+
+        for outbound in list(self.subscribers):
+            try:
+                await outbound.send(message)
+            except ConnectionClosed:
+                self.subscribers.discard(outbound)
+
+        prewarm_task = asyncio.create_task(
+            prewarm_contact_sheet(self.job_id, self.image_paths)
+        )
+        PREWARM_TASKS.add(prewarm_task)
+        prewarm_task.add_done_callback(PREWARM_TASKS.discard)
+
+
+def mark_folder_changed(folder: str) -> None:
+    """This function wakes up the watchers of all jobs writing to a folder."""
+    for watcher in WATCHED_FOLDERS.get(folder, {}).get("watchers", ()):
+        watcher.changed.set()
+
+
+@cache
+def get_observer(watchdog_observers):
+    """This function starts the watchdog observer the first time it's needed.
+    All folders are watched by the same one."""
+    observer = watchdog_observers.Observer()
+    observer.daemon = True
+    observer.start()
+    return observer
+
+
+async def start_watching_folders(watcher: job_watcher) -> None:
+    """This function watches the output folders of a job with watchdog.
+    Without watchdog the job watcher falls back to polling."""
+    watchdog_observers = await get_optional_module("watchdog.observers")
+    if watchdog_observers is None:
+        return
+
+    observer = get_observer(watchdog_observers)
+
+    for folder in watcher.folders:
+        if folder not in WATCHED_FOLDERS:
+            try:
+                WATCHED_FOLDERS[folder] = {
+                    "watch": observer.schedule(
+                        folder_event_handler(folder, asyncio.get_running_loop()),
+                        folder,
+                    ),
+                    "observer": observer,
+                    "watchers": set(),
+                }
+            except OSError:
+                # The folder doesn't exist yet, so we poll until it does.
+                stop_watching_folders(watcher)
+                return
+
+        WATCHED_FOLDERS[folder]["watchers"].add(watcher)
+
+    watcher.uses_events = True
+
+
+def stop_watching_folders(watcher: job_watcher) -> None:
+    """This function stops watching the folders no other job writes to."""
+    for folder in watcher.folders:
+        if folder not in WATCHED_FOLDERS:
+            continue
+
+        WATCHED_FOLDERS[folder]["watchers"].discard(watcher)
+
+        if not WATCHED_FOLDERS[folder]["watchers"]:
+            watched_folder = WATCHED_FOLDERS.pop(folder)
+            watched_folder["observer"].unschedule(watched_folder["watch"])
+
+
+async def watch_job_frames(outbound, DEADLINE_CONNECTION, job_id: str) -> None:
+    """This function subscribes a client to the frame_ready messages of a job.
+    Cancelling it before it's done doesn't leave a subscription behind."""
+    if not FRAME_WATCHER:
+        return
+
+    if job_id in JOB_WATCHERS:
+        JOB_WATCHERS[job_id].subscribers.add(outbound)
+        return
+
+    try:
+        image_paths = await DEADLINE_CONNECTION.get_task_image_paths(job_id)
+    except (KeyError, TypeError, WebServiceError):
+        return
+
+    # Another client could have started watching while we got the paths.
+    if job_id in JOB_WATCHERS:
+        JOB_WATCHERS[job_id].subscribers.add(outbound)
+        return
+
+    watcher = job_watcher(job_id, image_paths)
+    watcher.subscribers.add(outbound)
+    JOB_WATCHERS[job_id] = watcher
+    watcher.task = asyncio.create_task(watcher.watch_forever())
+
+
+def unwatch_job_frames(outbound, job_id: str) -> None:
+    """This function unsubscribes a client from a job, and stops watching
+    the job when no other client is looking at it."""
+    watcher = JOB_WATCHERS.get(job_id)
+    if watcher is None:
+        return
+
+    watcher.subscribers.discard(outbound)
+
+    if not watcher.subscribers:
+        del JOB_WATCHERS[job_id]
+        watcher.task.cancel()
@@ -7,17 +7,31 @@ Image related functions for the Deadline Web App by Mervin van Brakel (2023)
 import json
 from base64 import b64encode
 from io import BytesIO
+from math import ceil
+from os import getenv
 
+from dotenv import load_dotenv
 from Imath import PixelType
 from numpy import float32, frombuffer, where
 from OpenEXR import InputFile
 from PIL import Image
 
+from DeadlineConnect import WebServiceError
+from image_threads import run_image_work
+from metrics import time_block
+
+load_dotenv()
+
+PREVIEW_THUMBNAIL_WIDTH = int(getenv("PREVIEW_THUMBNAIL_WIDTH", "256"))
+
 
 async def send_image_preview(
     websocket, DEADLINE_CONNECTION, job_id: str, task_id: str
 ) -> None:
-    """This function sends a Base64 JPEG image preview to a client."""
+    """This function sends a Base64 JPEG image preview to a client. A small
+    thumbnail is sent first, so the client has something to show right away,
+    followed by the full image. When the client asks for another preview in the
+    meantime this gets cancelled, so we don't convert images nobody looks at."""
     if not await DEADLINE_CONNECTION.check_if_job_exists(job_id):
         return
 
@@ -38,8 +52,37 @@ async def send_image_preview(
             )
         )
         return
+    except WebServiceError:
+        await websocket.send(
+            json.dumps(
+                {
+                    "type": "image_preview",
+                    "task_id": task_id,
+                    "error": True,
+                    "message": "Error: Could not reach the Deadline Web Service.",
+                }
+            )
+        )
+        return
 
     try:
+        if PREVIEW_THUMBNAIL_WIDTH:
+            base64_image = await get_base64_encoded_jpeg_from_exr(
+                path_to_exr, PREVIEW_THUMBNAIL_WIDTH
+            )
+
+            await websocket.send(
+                json.dumps(
+                    {
+                        "type": "image_preview",
+                        "task_id": task_id,
+                        "error": False,
+                        "image": base64_image,
+                        "stage": "thumbnail",
+                    }
+                )
+            )
+
         base64_image = await get_base64_encoded_jpeg_from_exr(path_to_exr)
 
         await websocket.send(
@@ -49,6 +92,7 @@ async def send_image_preview(
                     "task_id": task_id,
                     "error": False,
                     "image": base64_image,
+                    "stage": "full",
                 }
             )
         )
@@ -78,30 +122,66 @@ async def send_image_preview(
         )
 
 
-async def get_base64_encoded_jpeg_from_exr(path_to_exr: str) -> str:
+async def get_base64_encoded_jpeg_from_exr(
+    path_to_exr: str, max_width: int | None = None
+) -> str:
     """This functions takes an EXR file, then converts it
     to a Base64 encoded JPEG so we can send it easily over the web."""
-    jpeg_data = await convert_exr_to_jpeg(path_to_exr)
+    with time_block("exr_decode_seconds"):
+        jpeg_data = await convert_exr_to_jpeg(path_to_exr, max_width)
+
+    with time_block("jpeg_encode_seconds"):
+        return await run_image_work(encode_jpeg, jpeg_data)
+
+
+def encode_jpeg(jpeg_data: Image.Image) -> str:
+    """This function saves an image as a Base64 encoded JPEG."""
     bytes_buffer = BytesIO()
     jpeg_data.save(bytes_buffer, "JPEG", quality=50)
     return b64encode(bytes_buffer.getvalue()).decode()
 
 
-async def convert_exr_to_jpeg(path_to_exr) -> Image.Image:
+async def convert_exr_to_jpeg(path_to_exr, max_width: int | None = None) -> Image.Image:
+    """This function takes an EXR and converts it to an image we can save as JPEG.
+    Converting happens in an image thread, so other clients don't have to wait for it.
+    """
+    return await run_image_work(read_exr_image, path_to_exr, max_width)
+
+
+def read_exr_image(path_to_exr: str, max_width: int | None = None) -> Image.Image:
     """This function takes an EXR and convert it to a JPEG,
     using 2.4 gamma encoding. Thanks to drakeguan on GitHub
-    for figuring this out and sharing the code."""
+    for figuring this out and sharing the code. With max_width set only
+    every few scanlines are read and every few pixels are converted,
+    which makes thumbnails a lot faster, especially on slow network storage."""
     exr_file = InputFile(path_to_exr.replace("\\", "/"))
     pixel_type = PixelType(PixelType.FLOAT)
     data_window = exr_file.header()["dataWindow"]
-    image_size = (
-        data_window.max.x - data_window.min.x + 1,
-        data_window.max.y - data_window.min.y + 1,
-    )
-    rgb = [
-        frombuffer(exr_file.channel(color, pixel_type), dtype=float32)
-        for color in "RGB"
-    ]
+    width = data_window.max.x - data_window.min.x + 1
+    height = data_window.max.y - data_window.min.y + 1
+    step = 1 if max_width is None else max(1, ceil(width / max_width))
+
+    if step == 1:
+        rgb = [
+            frombuffer(exr_file.channel(color, pixel_type), dtype=float32).reshape(
+                height, width
+            )
+            for color in "RGB"
+        ]
+    else:
+        # Reading single scanlines only decompresses the blocks we need.
+        scanlines = [
+            exr_file.channels("RGB", pixel_type, y, y)
+            for y in range(data_window.min.y, data_window.max.y + 1, step)
+        ]
+        rgb = [
+            frombuffer(
+                b"".join(scanline[i] for scanline in scanlines), dtype=float32
+            ).reshape(len(scanlines), width)[:, ::step]
+            for i in range(3)
+        ]
+
+    image_size = (rgb[0].shape[1], rgb[0].shape[0])
 
     for i in range(3):
         rgb[i] = where(
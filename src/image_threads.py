@@ -0,0 +1,38 @@
+"""
+Image threads for the BreakTools Deadline Web App by Mervin van Brakel (2023)
+
+Decoding EXRs and encoding JPEGs takes long enough that it happens in threads.
+Those used to be the default threads of the event loop, which the calls to the
+Deadline Web Service use as well, so clicking through a bunch of previews could
+keep the Web Service calls waiting. Image work now gets its own IMAGE_THREADS
+threads. A thread can't be stopped halfway, so a cancelled preview only gives
+back its spot once its thread is done, and work that didn't start yet is dropped.
+"""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from os import getenv
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+IMAGE_THREADS = int(getenv("IMAGE_THREADS", "4"))
+
+IMAGE_EXECUTOR = ThreadPoolExecutor(IMAGE_THREADS, thread_name_prefix="image")
+
+
+async def run_image_work(function, *arguments):
+    """This function runs slow image work on one of the image threads and
+    returns its result. When it gets cancelled while the work is running,
+    it waits for the thread to finish before it lets the cancellation through,
+    so whoever limits the image work doesn't start more than there are threads."""
+    work = IMAGE_EXECUTOR.submit(function, *arguments)
+
+    try:
+        return await asyncio.wrap_future(work)
+    except asyncio.CancelledError:
+        # Work that didn't start yet can be dropped, running work can't.
+        if not work.cancel():
+            await asyncio.wait([asyncio.wrap_future(work)])
+        raise
@@ -0,0 +1,103 @@
+"""
+Job list indexes for the BreakTools Deadline Web App by Mervin van Brakel (2023)
+
+The Web App only shows one screen of jobs at a time, so clients can ask for
+a single page of a job list instead of the whole thing. To make that cheap
+the backend keeps presorted orders of every job list, for all jobs and per user.
+Pages are found with a binary search on the cursor, which is the sort value
+and ID of the last job on the previous page.
+"""
+
+from bisect import bisect_left, bisect_right
+
+SORT_KEYS = ("EpochStarted", "Name", "User")
+CURSOR_LENGTH = 2
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+
+def get_page_query(message: dict) -> dict | None:
+    """This function reads the page options from a client message. It returns
+    None if the client wants the whole job list, like older clients do."""
+    if "page_size" not in message:
+        return None
+
+    cursor = message.get("cursor")
+    if not isinstance(cursor, list) or len(cursor) != CURSOR_LENGTH:
+        cursor = None
+
+    user = message.get("user")
+    if not isinstance(user, str) or not user:
+        user = None
+
+    sort_key = message.get("sort")
+    if sort_key not in SORT_KEYS:
+        sort_key = "EpochStarted"
+
+    try:
+        page_size = max(1, min(int(message["page_size"]), MAX_PAGE_SIZE))
+    except (TypeError, ValueError, OverflowError):
+        page_size = DEFAULT_PAGE_SIZE
+
+    return {
+        "page_size": page_size,
+        "cursor": cursor,
+        "user": user,
+        "sort": sort_key,
+        "descending": bool(message.get("descending", True)),
+    }
+
+
+class job_list_index:
+    """Class for storing presorted orders of a job list. Orders are sorted
+    ascending and built the first time somebody asks for them."""
+
+    def __init__(self, jobs: dict) -> None:
+        self.jobs = jobs
+        self.jobs_per_user = {}
+        self.orders = {}
+
+        for job_id, job in jobs.items():
+            self.jobs_per_user.setdefault(job["User"], []).append(job_id)
+
+    def get_order(self, sort_key: str, user: str | None) -> list:
+        """This function returns (sort value, job ID) pairs for all jobs,
+        or for the jobs of a single user, sorted on the sort key."""
+        if (sort_key, user) not in self.orders:
+            job_ids = self.jobs if user is None else self.jobs_per_user.get(user, [])
+            self.orders[(sort_key, user)] = sorted(
+                (self.jobs[job_id][sort_key], job_id) for job_id in job_ids
+            )
+
+        return self.orders[(sort_key, user)]
+
+    def get_page(self, page_query: dict) -> dict:
+        """This function returns a single page of jobs, together with the cursor
+        for the next page and the total number of jobs matching the query."""
+        order = self.get_order(page_query["sort"], page_query["user"])
+        cursor = tuple(page_query["cursor"]) if page_query["cursor"] else None
+        page_size = page_query["page_size"]
+
+        try:
+            if page_query["descending"]:
+                end = len(order) if cursor is None else bisect_left(order, cursor)
+                page = order[max(0, end - page_size) : end][::-1]
+                has_next_page = end - page_size > 0
+            else:
+                start = 0 if cursor is None else bisect_right(order, cursor)
+                page = order[start : start + page_size]
+                has_next_page = start + page_size < len(order)
+        except TypeError:
+            # The cursor doesn't match the sort key, so we start over.
+            page = (
+                order[-page_size:][::-1]
+                if page_query["descending"]
+                else order[:page_size]
+            )
+            has_next_page = len(order) > page_size
+
+        return {
+            "jobs": {job_id: self.jobs[job_id] for _, job_id in page},
+            "next_cursor": list(page[-1]) if page and has_next_page else None,
+            "total": len(order),
+        }
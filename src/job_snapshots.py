@@ -0,0 +1,109 @@
+"""
+Job list snapshots for the BreakTools Deadline Web App by Mervin van Brakel (2023)
+
+Downloading all job lists from the Deadline Web Service can take a long time on
+a big farm, and nobody can connect until it's done. So the job lists are saved
+to SNAPSHOT_PATH every SNAPSHOT_INTERVAL seconds and when the backend is stopped.
+On startup the snapshot is loaded right away and sent to clients while fresh job
+lists are downloaded in the background.
+"""
+
+import asyncio
+import json
+import signal
+from contextlib import suppress
+from os import getenv
+from pathlib import Path
+from time import time
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+SNAPSHOT_PATH = getenv("SNAPSHOT_PATH", "job_snapshot.json")
+SNAPSHOT_INTERVAL = float(getenv("SNAPSHOT_INTERVAL", "60"))
+SNAPSHOT_MAX_AGE = float(getenv("SNAPSHOT_MAX_AGE", "86400"))
+JOB_LIST_TYPES = ("active_jobs", "recent_jobs", "older_jobs")
+
+
+def load_snapshot() -> dict | None:
+    """This function loads the saved job lists. It returns None if
+    snapshots are disabled or there is no usable snapshot, like one
+    older than SNAPSHOT_MAX_AGE seconds."""
+    if not SNAPSHOT_PATH:
+        return None
+
+    try:
+        with Path(SNAPSHOT_PATH).open() as file:
+            snapshot = json.load(file)
+
+    except FileNotFoundError:
+        return None
+
+    except (OSError, ValueError) as error:
+        print(f"[BreakTools] Could not load job snapshot. Error: {error}")
+        return None
+
+    if not isinstance(snapshot, dict) or not all(
+        isinstance(snapshot.get(key), dict) for key in JOB_LIST_TYPES
+    ):
+        print("[BreakTools] Ignoring job snapshot with missing job lists.")
+        return None
+
+    saved = snapshot.get("saved")
+    if not isinstance(saved, (int, float)):
+        print("[BreakTools] Ignoring job snapshot without a save time.")
+        return None
+
+    seconds_ago = time() - saved
+    if SNAPSHOT_MAX_AGE > 0 and seconds_ago > SNAPSHOT_MAX_AGE:
+        print(f"[BreakTools] Ignoring job snapshot from {seconds_ago:.0f} seconds ago.")
+        return None
+
+    print(f"[BreakTools] Loaded job snapshot from {seconds_ago:.0f} seconds ago.")
+    return snapshot
+
+
+def save_snapshot(job_lists: dict) -> None:
+    """This function saves the job lists. It writes to a temporary file first,
+    so a crash halfway never leaves a broken snapshot behind."""
+    temporary_path = Path(f"{SNAPSHOT_PATH}.tmp")
+
+    try:
+        with temporary_path.open("w") as file:
+            json.dump(dict(job_lists, saved=time()), file)
+
+        temporary_path.replace(SNAPSHOT_PATH)
+
+    except OSError as error:
+        print(f"[BreakTools] Could not save job snapshot. Error: {error}")
+
+
+async def save_snapshots_forever(get_job_lists) -> None:
+    """This function saves the job lists every SNAPSHOT_INTERVAL seconds and
+    once more when the backend is stopped."""
+    if not SNAPSHOT_PATH:
+        return
+
+    loop = asyncio.get_running_loop()
+
+    # Windows doesn't support signal handlers, so we only save on Ctrl+C there.
+    with suppress(NotImplementedError):
+        loop.add_signal_handler(signal.SIGTERM, save_snapshot_and_stop, get_job_lists)
+
+    try:
+        while True:
+            await asyncio.sleep(SNAPSHOT_INTERVAL)
+            # The job lists are replaced instead of changed, so they can
+            # safely be written from another thread.
+            await asyncio.to_thread(save_snapshot, get_job_lists())
+
+    finally:
+        save_snapshot(get_job_lists())
+
+
+def save_snapshot_and_stop(get_job_lists) -> None:
+    """This function saves the job lists, then lets SIGTERM stop the process."""
+    save_snapshot(get_job_lists())
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.raise_signal(signal.SIGTERM)
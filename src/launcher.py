@@ -39,17 +39,25 @@ def all_variables_set() -> bool:
         "Your Deadline web server port environment variable is not set. Please set it.",
     ):
         can_run = False
-    if not check_or_ask_for_env(
+
+    # The OpenAI key is optional, without it there are just no AI texts.
+    check_or_ask_for_env(
         "OPENAI_API_KEY",
-        "Your OpenAI key environment variable is not set. Please set it.",
-    ):
-        can_run = False
+        "Your OpenAI key environment variable is not set, AI texts are disabled.",
+    )
 
     return can_run
 
 
 if __name__ == "__main__":
     if all_variables_set():
-        from websocket_handler import start_websocket_server
+        from worker_processes import WORKERS, is_worker_process
+
+        if WORKERS > 1 and not is_worker_process():
+            from worker_processes import start_leader
+
+            asyncio.run(start_leader())
+        else:
+            from websocket_handler import start_websocket_server
 
-        asyncio.run(start_websocket_server())
+            asyncio.run(start_websocket_server())
@@ -0,0 +1,190 @@
+"""
+OpenAI request scheduling for the BreakTools Deadline Web App by Mervin van Brakel (2023)
+
+When half the farm crashes at once, every open job page wants an AI text at the
+same moment, and OpenAI starts refusing our requests. So all requests go through
+a single scheduler. It only lets OPENAI_CONCURRENCY requests run at the same time
+and keeps the tokens we send within OPENAI_TOKENS_PER_MINUTE. Requests for jobs
+someone is looking at go before texts written in the background. Requests that
+fail because of rate limits are retried with a backoff, and when too many requests
+are waiting new ones are refused, so the caller can show something else instead.
+"""
+
+import asyncio
+from collections import deque
+from contextlib import asynccontextmanager
+from itertools import count
+from os import getenv
+from random import uniform
+from time import monotonic
+
+import openai
+from dotenv import load_dotenv
+
+from metrics import increment
+
+load_dotenv()
+
+OPENAI_CONCURRENCY = int(getenv("OPENAI_CONCURRENCY", "4"))
+OPENAI_TOKENS_PER_MINUTE = int(getenv("OPENAI_TOKENS_PER_MINUTE", "200000"))
+OPENAI_QUEUE_SIZE = int(getenv("OPENAI_QUEUE_SIZE", "20"))
+OPENAI_RETRIES = int(getenv("OPENAI_RETRIES", "3"))
+OPENAI_RETRY_DELAY = float(getenv("OPENAI_RETRY_DELAY", "2"))
+
+VIEWED_PRIORITY = 0
+BACKGROUND_PRIORITY = 1
+TOKEN_WINDOW = 60
+
+RETRYABLE_ERRORS = (
+    openai.error.RateLimitError,
+    openai.error.ServiceUnavailableError,
+    openai.error.APIConnectionError,
+    openai.error.Timeout,
+)
+
+
+class SchedulerFullError(Exception):
+    """Too many requests are waiting already, so this one wasn't queued."""
+
+
+class waiting_request:
+    """Class for a request waiting for its turn."""
+
+    def __init__(self, key, priority: int, tokens: int, order: int) -> None:
+        self.key = key
+        self.priority = priority
+        self.tokens = tokens
+        self.order = order
+        self.turn = asyncio.get_running_loop().create_future()
+
+
+class llm_scheduler:
+    """Class for deciding which OpenAI request may be sent next."""
+
+    def __init__(
+        self,
+        concurrency: int = OPENAI_CONCURRENCY,
+        tokens_per_minute: int = OPENAI_TOKENS_PER_MINUTE,
+        queue_size: int = OPENAI_QUEUE_SIZE,
+    ) -> None:
+        self.concurrency = concurrency
+        self.tokens_per_minute = tokens_per_minute
+        self.queue_size = queue_size
+        self.running = 0
+        self.waiting = []
+        self.sent_tokens = deque()
+        self.order = count()
+        self.wake_timer = None
+
+    @asynccontextmanager
+    async def turn(self, key, tokens: int, priority: int):
+        """This function waits until a request may be sent, and
+        keeps its spot taken until the response is done streaming."""
+        if len(self.waiting) >= self.queue_size:
+            increment("openai_requests_total", {"result": "refused"})
+            error_message = "Too many AI texts are being written right now."
+            raise SchedulerFullError(error_message)
+
+        request = waiting_request(key, priority, tokens, next(self.order))
+        self.waiting.append(request)
+        self.start_next_requests()
+
+        try:
+            await request.turn
+        except asyncio.CancelledError:
+            if request in self.waiting:
+                self.waiting.remove(request)
+            elif not request.turn.cancelled():
+                # We got our turn right as we were cancelled, so give it back.
+                self.finish_request()
+            raise
+
+        try:
+            yield
+        finally:
+            self.finish_request()
+
+    def promote(self, key) -> None:
+        """This function moves a waiting background request to the front,
+        because someone just opened the job it's for."""
+        for request in self.waiting:
+            if request.key == key:
+                request.priority = VIEWED_PRIORITY
+
+        self.start_next_requests()
+
+    def get_used_tokens(self) -> int:
+        """This function returns the tokens sent during the last minute."""
+        while self.sent_tokens and monotonic() - self.sent_tokens[0][0] > TOKEN_WINDOW:
+            self.sent_tokens.popleft()
+
+        return sum(tokens for _, tokens in self.sent_tokens)
+
+    def start_next_requests(self) -> None:
+        """This function gives the next requests in line their turn, for as long
+        as there's room for them. If the token budget is the problem, it checks
+        again once the oldest tokens are more than a minute old."""
+        while self.waiting and self.running < self.concurrency:
+            request = min(
+                self.waiting, key=lambda request: (request.priority, request.order)
+            )
+            used_tokens = self.get_used_tokens()
+
+            # A single prompt bigger than the budget still gets its turn eventually.
+            if used_tokens and used_tokens + request.tokens > self.tokens_per_minute:
+                if self.wake_timer is None:
+                    self.wake_timer = asyncio.get_running_loop().call_later(
+                        60 - (monotonic() - self.sent_tokens[0][0]) + 0.1,
+                        self.wake_up,
+                    )
+                return
+
+            self.waiting.remove(request)
+            self.running += 1
+            self.sent_tokens.append((monotonic(), request.tokens))
+            request.turn.set_result(None)
+
+    def wake_up(self) -> None:
+        """This function runs when tokens from a minute ago stop counting."""
+        self.wake_timer = None
+        self.start_next_requests()
+
+    def finish_request(self) -> None:
+        """This function frees the spot of a finished request."""
+        self.running -= 1
+        self.start_next_requests()
+
+
+LLM_SCHEDULER = llm_scheduler()
+
+
+async def create_chat_completion(key, tokens: int, priority: int, **arguments):
+    """This function sends a chat completion request once the scheduler lets it,
+    and retries it with a backoff if OpenAI is busy. It yields the streamed chunks."""
+    async with LLM_SCHEDULER.turn(key, tokens, priority):
+        for attempt in range(OPENAI_RETRIES + 1):
+            try:
+                response = await openai.ChatCompletion.acreate(**arguments)
+                break
+
+            except RETRYABLE_ERRORS as error:
+                if attempt == OPENAI_RETRIES:
+                    increment("openai_requests_total", {"result": "failed"})
+                    raise
+
+                increment("openai_requests_total", {"result": "retried"})
+                await asyncio.sleep(get_retry_delay(error, attempt))
+
+        increment("openai_requests_total", {"result": "sent"})
+
+        async for chunk in response:
+            yield chunk
+
+
+def get_retry_delay(error: Exception, attempt: int) -> float:
+    """This function returns how long to wait before trying again. OpenAI tells
+    us when we hit the rate limit, otherwise the wait doubles every attempt."""
+    try:
+        return float((getattr(error, "headers", None) or {})["retry-after"])
+    except (KeyError, TypeError, ValueError):
+        return OPENAI_RETRY_DELAY * 2**attempt * uniform(0.5, 1.5)
@@ -0,0 +1,235 @@
+"""
+Metrics for the BreakTools Deadline Web App by Mervin van Brakel (2023)
+
+The backend keeps track of how long things take and how much it sends, and
+serves those numbers in the Prometheus text format on a separate HTTP port.
+Set METRICS_PORT to enable it, then point Prometheus (or just curl) at /metrics.
+"""
+
+import asyncio
+from bisect import bisect_left
+from collections.abc import Callable
+from contextlib import contextmanager
+from os import getenv
+from time import perf_counter
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+METRICS_PORT = int(getenv("METRICS_PORT", "0"))
+WORKER_NUMBER = int(getenv("WORKER_NUMBER", "0"))
+METRIC_PREFIX = "deadline_web_app_"
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+BYTES_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+METRIC_DESCRIPTIONS = {}
+COUNTERS = {}
+HISTOGRAMS = {}
+GAUGE_FUNCTIONS = {}
+
+
+def describe(name: str, metric_type: str, description: str) -> None:
+    """This function registers the type and description of a metric."""
+    METRIC_DESCRIPTIONS[name] = (metric_type, description)
+
+
+def increment(name: str, labels: dict | None = None, amount: float = 1) -> None:
+    """This function increases a counter."""
+    key = (name, get_label_key(labels))
+    COUNTERS[key] = COUNTERS.get(key, 0) + amount
+
+
+def observe(
+    name: str,
+    value: float,
+    labels: dict | None = None,
+    buckets: tuple = SECONDS_BUCKETS,
+) -> None:
+    """This function adds a value to a histogram."""
+    key = (name, get_label_key(labels))
+
+    if key not in HISTOGRAMS:
+        HISTOGRAMS[key] = {
+            "buckets": buckets,
+            "counts": [0] * (len(buckets) + 1),
+            "sum": 0.0,
+            "count": 0,
+        }
+
+    histogram = HISTOGRAMS[key]
+    histogram["counts"][bisect_left(histogram["buckets"], value)] += 1
+    histogram["sum"] += value
+    histogram["count"] += 1
+
+
+@contextmanager
+def time_block(name: str, labels: dict | None = None):
+    """This context manager adds the time its block took to a histogram."""
+    started = perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, perf_counter() - started, labels)
+
+
+def register_gauge(name: str, description: str, function: Callable) -> None:
+    """This function registers a gauge. The function is called whenever the
+    metrics are requested, and returns a number or a dictionary of
+    label keys (see get_label_key) to numbers."""
+    describe(name, "gauge", description)
+    GAUGE_FUNCTIONS[name] = function
+
+
+def get_label_key(labels: dict | None) -> tuple:
+    """This function turns labels into something we can use as a key."""
+    if not labels:
+        return ()
+
+    return tuple(sorted(labels.items()))
+
+
+def get_escaped_label_value(value) -> str:
+    """This function escapes a label value like the text format wants it,
+    so a value with quotes or newlines can't break the other lines."""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def get_label_text(label_key: tuple, extra_label: str = "") -> str:
+    """This function formats labels for the text format."""
+    labels = [
+        f'{label}="{get_escaped_label_value(value)}"' for label, value in label_key
+    ]
+
+    if extra_label:
+        labels.append(extra_label)
+
+    if not labels:
+        return ""
+
+    return "{" + ",".join(labels) + "}"
+
+
+def get_metrics_text() -> str:
+    """This function returns all metrics in the Prometheus text format."""
+    lines = []
+    names = sorted(
+        {name for name, _ in COUNTERS}
+        | {name for name, _ in HISTOGRAMS}
+        | set(GAUGE_FUNCTIONS)
+    )
+
+    for name in names:
+        metric_type, description = METRIC_DESCRIPTIONS.get(name, ("untyped", name))
+        lines.append(f"# HELP {METRIC_PREFIX}{name} {description}")
+        lines.append(f"# TYPE {METRIC_PREFIX}{name} {metric_type}")
+
+        for (counter_name, label_key), value in sorted(COUNTERS.items()):
+            if counter_name == name:
+                lines.append(
+                    f"{METRIC_PREFIX}{name}{get_label_text(label_key)} {value}"
+                )
+
+        for (histogram_name, label_key), histogram in sorted(
+            HISTOGRAMS.items(), key=lambda item: item[0]
+        ):
+            if histogram_name != name:
+                continue
+
+            cumulative_count = 0
+            for bucket, count in zip(
+                (*histogram["buckets"], "+Inf"), histogram["counts"], strict=True
+            ):
+                cumulative_count += count
+                bucket_label = get_label_text(label_key, f'le="{bucket}"')
+                lines.append(
+                    f"{METRIC_PREFIX}{name}_bucket{bucket_label} {cumulative_count}"
+                )
+
+            label_text = get_label_text(label_key)
+            lines.append(f"{METRIC_PREFIX}{name}_sum{label_text} {histogram['sum']}")
+            lines.append(
+                f"{METRIC_PREFIX}{name}_count{label_text} {histogram['count']}"
+            )
+
+        if name in GAUGE_FUNCTIONS:
+            try:
+                value = GAUGE_FUNCTIONS[name]()
+            except Exception as error:  # noqa: BLE001
+                # A broken gauge shouldn't take the other metrics down with it.
+                print(f"[BreakTools] Could not read gauge {name}. Error: {error}")
+                continue
+
+            if not isinstance(value, dict):
+                value = {(): value}
+
+            for label_key, gauge_value in value.items():
+                lines.append(
+                    f"{METRIC_PREFIX}{name}{get_label_text(label_key)} {gauge_value}"
+                )
+
+    return "\n".join(lines) + "\n"
+
+
+async def handle_metrics_request(reader, writer) -> None:
+    """This function answers a single HTTP request for the metrics."""
+    try:
+        request_line = await reader.readline()
+        while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+            pass
+
+        if request_line.split(b" ")[1:2] == [b"/metrics"]:
+            body = get_metrics_text().encode()
+            status = "200 OK"
+        else:
+            body = b"Not found, try /metrics\n"
+            status = "404 Not Found"
+
+        writer.write(
+            f"HTTP/1.1 {status}\r\n"
+            "Content-Type: text/plain; version=0.0.4\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            "Connection: close\r\n\r\n".encode() + body
+        )
+        await writer.drain()
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+
+async def start_metrics_server() -> None:
+    """This function starts the metrics HTTP server if a port is configured."""
+    if not METRICS_PORT:
+        return
+
+    # Every worker process has its own metrics, so they each get their own port.
+    port = METRICS_PORT + WORKER_NUMBER
+    await asyncio.start_server(handle_metrics_request, "", port)
+    print(f"[BreakTools] Serving metrics on port {port}.")
+
+
+describe(
+    "web_service_request_seconds",
+    "histogram",
+    "Time spent on Deadline Web Service requests per endpoint.",
+)
+describe(
+    "web_service_errors_total",
+    "counter",
+    "Deadline Web Service requests that failed per endpoint.",
+)
+describe("cache_requests_total", "counter", "Cache lookups per cache and result.")
+describe("update_bytes", "histogram", "Size of update messages sent to clients.")
+describe("exr_decode_seconds", "histogram", "Time spent reading and converting EXRs.")
+describe("jpeg_encode_seconds", "histogram", "Time spent encoding preview JPEGs.")
+describe(
+    "contact_sheet_decode_seconds",
+    "histogram",
+    "Time spent decoding the changed thumbnails of a contact sheet.",
+)
+describe(
+    "openai_requests_total",
+    "counter",
+    "OpenAI requests that were sent, retried, failed or refused because too many were waiting.",
+)
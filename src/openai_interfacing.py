@@ -4,6 +4,7 @@ OpenAI related functions for the Deadline Web App by Mervin van Brakel (2023)
 
 import asyncio
 import json
+from contextlib import aclosing
 from os import getenv, path, sep
 from random import uniform
 
@@ -12,8 +13,25 @@ from dotenv import load_dotenv
 from tiktoken import get_encoding
 from websockets import exceptions
 
+from ai_pregeneration import AI_TEXTS, get_prompt_information
+from error_signatures import (
+    get_error_signature,
+    get_first_key_line,
+    store_signature_ai_text,
+)
+from llm_scheduler import (
+    BACKGROUND_PRIORITY,
+    LLM_SCHEDULER,
+    RETRYABLE_ERRORS,
+    VIEWED_PRIORITY,
+    SchedulerFullError,
+    create_chat_completion,
+)
+
 load_dotenv()
 openai.api_key = getenv("OPENAI_API_KEY")
+# Point this to a local stand-in for the OpenAI API to try things without paying.
+openai.api_base = getenv("OPENAI_API_BASE", openai.api_base)
 
 with open(
     path.join(path.dirname(path.realpath(__file__)).replace(sep, "/"), "prompts.json"),
@@ -21,139 +39,151 @@ with open(
 ) as file:
     prompts = json.load(file)
 
-GENERATED_PROMPTS = {}
+GENERATING = {}
+
+# Room we keep in the token budget for the reply.
+RESPONSE_TOKENS = 500
 
 
 async def create_ai_text(
     job_details: dict, job_id: str, DEADLINE_CONNECTION, websocket
 ) -> None:
     """This function figures out which prompt to send to OpenAI,
-    then it runs the prompt through the send_ai_text function."""
-    prompt_information = {}
+    then it runs the prompt through the send_ai_text function.
+    Without a websocket the text is only written and stored, so
+    it can be sent right away when someone opens the job."""
+    prompt_information = get_prompt_information(job_details.get("job", {}))
+    if prompt_information is None:
+        return
 
-    try:
-        total_chunks = (
-            int(job_details["job"]["Completed"])
-            + int(job_details["job"]["Failed"])
-            + int(job_details["job"]["Pending"])
-            + int(job_details["job"]["Queued"])
-            + int(job_details["job"]["Rendering"])
-            + int(job_details["job"]["Suspended"])
-        )
-    except KeyError:
+    prompt_type = prompt_information["type"]
+    key = (job_id, prompt_type)
+
+    # We first try to send ai generated text from memory. If the text is being
+    # written in the background or for another client we wait for it. When that
+    # didn't work out we look again, somebody else could have started by then.
+    while True:
+        ai_text = await DEADLINE_CONNECTION.get_stored_ai_text(job_id, prompt_type)
+        if ai_text is not None or key not in GENERATING:
+            break
+
+        if websocket is not None:
+            LLM_SCHEDULER.promote(key)
+
+        await GENERATING[key].wait()
+
+    if ai_text is not None:
+        if websocket is not None:
+            await fake_send_ai_text(ai_text, job_id, websocket)
         return
 
-    # Job finished without issues
-    if (
-        total_chunks == int(job_details["job"]["Completed"])
-        and int(job_details["job"]["Errors"]) == 0
-    ):
-        prompt_information["type"] = "finished_successfully"
-        prompt_information["log_type_to_retrieve"] = None
-
-    # Job finished but with warnings
-    elif (
-        total_chunks == int(job_details["job"]["Completed"])
-        and int(job_details["job"]["Errors"]) != 0
-        and int(job_details["job"]["Failed"]) == 0
-        and int(job_details["job"]["Pending"]) == 0
-    ):
-        prompt_information["type"] = "finished_warnings"
-        prompt_information["log_type_to_retrieve"] = "warning"
-
-    # Job partially failed
-    elif total_chunks == (
-        int(job_details["job"]["Completed"])
-        + int(job_details["job"]["Failed"])
-        + int(job_details["job"]["Suspended"])
-    ):
-        prompt_information["type"] = "finished_partially"
-        prompt_information["log_type_to_retrieve"] = "error"
-
-    # Job failed completely
-    elif total_chunks == int(job_details["job"]["Failed"]):
-        prompt_information["type"] = "finished_failed"
-        prompt_information["log_type_to_retrieve"] = "error"
-
-    # Job running without issues
-    elif (
-        total_chunks != int(job_details["job"]["Completed"])
-        and int(job_details["job"]["Errors"]) == 0
-        and int(job_details["job"]["Failed"]) == 0
-    ):
-        prompt_information["type"] = "running_successfully"
-        prompt_information["log_type_to_retrieve"] = None
-
-    # Job running, hasn't finished anything and has only warnings
-    elif (
-        total_chunks != int(job_details["job"]["Completed"])
-        and int(job_details["job"]["Completed"]) == 0
-        and int(job_details["job"]["Errors"]) != 0
-        and int(job_details["job"]["Failed"]) == 0
-    ):
-        prompt_information["type"] = "running_only_warnings"
-        prompt_information["log_type_to_retrieve"] = "warning"
-
-    # Job running but with warnings
-    elif (
-        total_chunks != int(job_details["job"]["Completed"])
-        and int(job_details["job"]["Errors"]) != 0
-        and int(job_details["job"]["Failed"]) == 0
-    ):
-        prompt_information["type"] = "running_warnings"
-        prompt_information["log_type_to_retrieve"] = "warning"
-
-    # Job running but with fails
-    elif (
-        total_chunks != int(job_details["job"]["Completed"])
-        and int(job_details["job"]["Errors"]) != 0
-        and int(job_details["job"]["Failed"]) != 0
-    ):
-        prompt_information["type"] = "running_fails"
-        prompt_information["log_type_to_retrieve"] = "error"
+    # If we have no ai generated text in memory, we generate and store it.
+    generating = GENERATING[key] = asyncio.Event()
 
     try:
-        # We first try to send ai generated text from memory.
-        await fake_send_ai_text(
-            GENERATED_PROMPTS[job_id][prompt_information["type"]], job_id, websocket
+        log = await get_log(
+            job_details, job_id, prompt_information, DEADLINE_CONNECTION
         )
-    except KeyError:
-        # If we have no ai generated text in memory, we generate and store it.
-        match prompt_information["log_type_to_retrieve"]:
-            case None:
-                log = ""
-
-            case "warning":
-                first_error_log_id = await get_first_error_log_id(job_details["tasks"])
-
-                if first_error_log_id is not None:
-                    log = await DEADLINE_CONNECTION.get_job_warning(
-                        job_id, first_error_log_id
-                    )
-                else:
-                    log = "Error! Could not find any warning logs."
+        signature = get_log_signature(log)
 
-            case "error":
-                first_error_log_id = await get_first_error_log_id(job_details["tasks"])
+        if signature is not None:
+            # Other jobs could have crashed the same way before.
+            ai_text = await DEADLINE_CONNECTION.get_signature_ai_text(
+                signature, prompt_type
+            )
 
-                if first_error_log_id is not None:
-                    log = await DEADLINE_CONNECTION.get_job_error(
-                        job_id, first_error_log_id
-                    )
-                else:
-                    log = "Error! Could not find any error logs."
+            if ai_text is not None:
+                AI_TEXTS.setdefault(job_id, {})[prompt_type] = ai_text
+                if websocket is not None:
+                    await fake_send_ai_text(ai_text, job_id, websocket)
+                return
 
         await send_ai_text(
-            prompt_information["type"],
-            prompts[prompt_information["type"]].replace("[LOG]", log),
+            prompt_type,
+            prompts[prompt_type].replace("[LOG]", log),
             job_id,
             websocket,
+            get_fallback_text(log),
         )
 
+        ai_text = AI_TEXTS.get(job_id, {}).get(prompt_type)
+        if signature is not None and ai_text is not None:
+            store_signature_ai_text(signature, prompt_type, ai_text)
+
+    finally:
+        if GENERATING.get(key) is generating:
+            del GENERATING[key]
+        generating.set()
+
+
+async def get_log(
+    job_details: dict, job_id: str, prompt_information: dict, DEADLINE_CONNECTION
+) -> str:
+    """This function gets the log the prompt needs, if it needs one."""
+    match prompt_information["log_type_to_retrieve"]:
+        case None:
+            return ""
+
+        case "warning":
+            first_error_log_id = await get_first_error_log_id(job_details["tasks"])
+
+            if first_error_log_id is None:
+                return "Error! Could not find any warning logs."
+
+            return await DEADLINE_CONNECTION.get_job_warning(job_id, first_error_log_id)
 
-async def send_ai_text(prompt_type: str, prompt: str, job_id: str, websocket) -> None:
+        case "error":
+            first_error_log_id = await get_first_error_log_id(job_details["tasks"])
+
+            if first_error_log_id is None:
+                return "Error! Could not find any error logs."
+
+            return await DEADLINE_CONNECTION.get_job_error(job_id, first_error_log_id)
+
+
+def get_log_signature(log: str) -> str | None:
+    """This function returns the error signature of a log. Prompts without a
+    log and logs we couldn't get don't have a signature."""
+    if not log or log.startswith(("Error: Could not", "Error! Could not")):
+        return None
+
+    return get_error_signature(log)
+
+
+def get_fallback_text(log: str) -> str:
+    """This function returns the text shown when OpenAI is too busy,
+    with the first line of the log that looks like an error."""
+    first_key_line = get_first_key_line(log) if log else None
+
+    if first_key_line is None:
+        return prompts["fallback_text_no_log"]
+
+    return prompts["fallback_text"].replace("[LINE]", first_key_line)
+
+
+class discarded_messages:
+    """Class that takes the place of a websocket when nobody is
+    waiting for the text, like when it's written in the background."""
+
+    async def send(self, message: str) -> None:
+        pass
+
+
+async def send_ai_text(
+    prompt_type: str,
+    prompt: str,
+    job_id: str,
+    websocket,
+    fallback_text: str = prompts["fallback_text_no_log"],
+) -> None:
     """This function takes the prompt and sends it to OpenAI,
-    then it streams the response it receives to the client."""
+    then it streams the response it receives to the client.
+    If OpenAI is too busy the client gets the fallback text instead.
+    Without a websocket the text is written in the background, after
+    the texts people are waiting for."""
+    priority = VIEWED_PRIORITY if websocket is not None else BACKGROUND_PRIORITY
+    if websocket is None:
+        websocket = discarded_messages()
 
     await websocket.send(
         json.dumps(
@@ -170,9 +200,13 @@ async def send_ai_text(prompt_type: str, prompt: str, job_id: str, websocket) ->
     model = "gpt-4o-mini"
     if prompt_length > 128000:
         prompt = prompts["log_too_log"]
+        prompt_length = await get_token_size(prompt)
 
     try:
-        response = await openai.ChatCompletion.acreate(
+        response = create_chat_completion(
+            (job_id, prompt_type),
+            prompt_length + RESPONSE_TOKENS,
+            priority,
             model=model,
             messages=[
                 {
@@ -188,35 +222,35 @@ async def send_ai_text(prompt_type: str, prompt: str, job_id: str, websocket) ->
         )
 
         final_prompt = ""
-        async for chunk in response:
-            try:
-                await websocket.send(
-                    json.dumps(
-                        {
-                            "type": "ai_text",
-                            "job_id": job_id,
-                            "reset": False,
-                            "chunk": chunk.choices[0].delta.content,
-                        }
+        async with aclosing(response):
+            async for chunk in response:
+                try:
+                    await websocket.send(
+                        json.dumps(
+                            {
+                                "type": "ai_text",
+                                "job_id": job_id,
+                                "reset": False,
+                                "chunk": chunk.choices[0].delta.content,
+                            }
+                        )
                     )
-                )
-                final_prompt += chunk.choices[0].delta.content
+                    final_prompt += chunk.choices[0].delta.content
 
-            except exceptions.ConnectionClosed:
-                return
+                except exceptions.ConnectionClosed:
+                    return
 
-            except AttributeError:
-                pass
+                except AttributeError:
+                    pass
 
         try:
-            GENERATED_PROMPTS[job_id][prompt_type] = final_prompt
+            AI_TEXTS[job_id][prompt_type] = final_prompt
         except KeyError:
-            GENERATED_PROMPTS[job_id] = {}
-            GENERATED_PROMPTS[job_id][prompt_type] = final_prompt
-
-    except openai.error.ServiceUnavailableError:
-        response = "Error: OpenAI service couldn't be reached. Try reloading the page."
+            AI_TEXTS[job_id] = {}
+            AI_TEXTS[job_id][prompt_type] = final_prompt
 
+    except (SchedulerFullError, *RETRYABLE_ERRORS):
+        # The fallback isn't stored, so the next visit asks OpenAI again.
         try:
             await websocket.send(
                 json.dumps(
@@ -224,7 +258,7 @@ async def send_ai_text(prompt_type: str, prompt: str, job_id: str, websocket) ->
                         "type": "ai_text",
                         "job_id": job_id,
                         "reset": False,
-                        "chunk": response,
+                        "chunk": fallback_text,
                     }
                 )
             )
@@ -271,12 +305,8 @@ async def get_token_size(prompt: str) -> int:
     return len(encoding.encode(prompt))
 
 
-async def get_first_error_log_id(tasks: list) -> int | None:
+async def get_first_error_log_id(tasks) -> int | None:
     """This function gets the ID for the first task with an error,
     so ChatGPT can parse it. It returns None if no errors are found,
     which weirdly enough happens sometimes."""
-    for task in tasks:
-        if task["Errs"] >= 1:
-            return task["TaskID"]
-
-    return None
+    return tasks.get_first_task_id_with_errors()
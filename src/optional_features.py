@@ -0,0 +1,114 @@
+"""
+Optional features for the BreakTools Deadline Web App by Mervin van Brakel (2023)
+
+Image previews and contact sheets need OpenEXR and Pillow, and the AI texts need
+openai and tiktoken. Loading those takes a while and a lot of memory, so they are
+only imported the first time a client needs them. Both features can also be turned off completely
+with IMAGE_PREVIEWS and AI_TEXT. AI texts are off when there is no OpenAI key.
+"""
+
+import asyncio
+import json
+from importlib import import_module
+from os import getenv
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+IMAGE_PREVIEWS = getenv("IMAGE_PREVIEWS", "true").lower() == "true"
+AI_TEXT = getenv("AI_TEXT", "true").lower() == "true" and bool(getenv("OPENAI_API_KEY"))
+
+LOADED_MODULES = {}
+MODULE_LOCK = asyncio.Lock()
+
+
+async def get_optional_module(module_name: str):
+    """This function imports a module the first time it's needed. Importing
+    happens in a thread, so other clients don't have to wait for it.
+    It returns None if the module or its dependencies can't be imported."""
+    async with MODULE_LOCK:
+        if module_name not in LOADED_MODULES:
+            try:
+                LOADED_MODULES[module_name] = await asyncio.to_thread(
+                    import_module, module_name
+                )
+            except ImportError as error:
+                print(f"[BreakTools] Could not load {module_name}. Error: {error}")
+                LOADED_MODULES[module_name] = None
+
+    return LOADED_MODULES[module_name]
+
+
+async def send_image_preview(
+    websocket, DEADLINE_CONNECTION, job_id: str, task_id: str
+) -> None:
+    """This function sends an image preview to a client, or tells
+    the client that image previews aren't available."""
+    image_handling = (
+        await get_optional_module("image_handling") if IMAGE_PREVIEWS else None
+    )
+
+    if image_handling is None:
+        await websocket.send(
+            json.dumps(
+                {
+                    "type": "image_preview",
+                    "task_id": task_id,
+                    "error": True,
+                    "message": "Error: Image previews are not available on this server.",
+                }
+            )
+        )
+        return
+
+    await image_handling.send_image_preview(
+        websocket, DEADLINE_CONNECTION, job_id, task_id
+    )
+
+
+async def send_contact_sheet(websocket, DEADLINE_CONNECTION, job_id: str) -> None:
+    """This function sends a contact sheet of a job to a client, or tells
+    the client that image previews aren't available."""
+    contact_sheets = (
+        await get_optional_module("contact_sheets") if IMAGE_PREVIEWS else None
+    )
+
+    if contact_sheets is None:
+        await websocket.send(
+            json.dumps(
+                {
+                    "type": "contact_sheet",
+                    "job_id": job_id,
+                    "error": True,
+                    "message": "Error: Image previews are not available on this server.",
+                }
+            )
+        )
+        return
+
+    await contact_sheets.send_contact_sheet(websocket, DEADLINE_CONNECTION, job_id)
+
+
+async def prewarm_contact_sheet(job_id: str, image_paths: dict) -> None:
+    """This function adds new frames to the cached contact sheet of a job, so
+    the next request is instant. It does nothing if contact sheets weren't used."""
+    contact_sheets = LOADED_MODULES.get("contact_sheets")
+
+    if contact_sheets is not None:
+        await contact_sheets.prewarm_contact_sheet(job_id, image_paths)
+
+
+async def create_ai_text(
+    job_details: dict, job_id: str, DEADLINE_CONNECTION, websocket
+) -> None:
+    """This function creates an AI text for a job, if AI texts are enabled."""
+    if not AI_TEXT:
+        return
+
+    openai_interfacing = await get_optional_module("openai_interfacing")
+
+    if openai_interfacing is not None:
+        await openai_interfacing.create_ai_text(
+            job_details, job_id, DEADLINE_CONNECTION, websocket
+        )
@@ -0,0 +1,128 @@
+"""
+Outbound message queueing for the BreakTools Deadline Web App by Mervin van Brakel (2023)
+
+Messages aren't sent to clients directly. Every connection gets its own queue
+and a writer task that empties it, so one artist on a bad VPN can't slow down
+the updates for everyone else. When a client falls too far behind, pending
+updates get replaced by a single fresh snapshot, and clients that stop
+reading altogether get disconnected so their memory use stays bounded.
+"""
+
+import asyncio
+from collections import deque
+from collections.abc import Callable
+from os import getenv
+from time import monotonic
+
+from dotenv import load_dotenv
+from websockets.exceptions import ConnectionClosed, ConnectionClosedError
+
+load_dotenv()
+
+OUTBOUND_HIGH_WATERMARK = int(getenv("OUTBOUND_HIGH_WATERMARK", "1048576"))
+OUTBOUND_LOW_WATERMARK = int(getenv("OUTBOUND_LOW_WATERMARK", "262144"))
+OUTBOUND_MAX_SIZE = int(getenv("OUTBOUND_MAX_SIZE", "8388608"))
+OUTBOUND_STALL_TIMEOUT = float(getenv("OUTBOUND_STALL_TIMEOUT", "30"))
+
+
+class outbound_queue:
+    """Class for queueing messages to a single client. It has the same send
+    function as a websocket, so it can be passed anywhere a websocket is used."""
+
+    def __init__(self, websocket) -> None:
+        self.websocket = websocket
+        self.messages = deque()
+        self.queued_bytes = 0
+        self.slow = False
+        self.closed = False
+        self.has_messages = asyncio.Event()
+        self.writer = asyncio.create_task(self.write_messages())
+
+    async def send(self, message: str) -> None:
+        """This function queues a message that has to arrive no matter what,
+        like AI text chunks and image previews."""
+        self.add_messages(None, [message])
+
+    def send_update(
+        self, key: str, messages: list, snapshot: Callable[[], list]
+    ) -> None:
+        """This function queues the update messages of a single tick. If the
+        client is too slow, all pending updates with the same key are thrown
+        away and replaced by a snapshot, which contains the latest state."""
+        if self.queued_bytes > OUTBOUND_HIGH_WATERMARK:
+            self.slow = True
+
+        if self.slow:
+            self.remove_messages(key)
+            messages = snapshot()
+
+        self.add_messages(key, messages)
+
+    def add_messages(self, key: str | None, messages: list) -> None:
+        """This function adds messages to the queue and wakes up the writer."""
+        if self.closed:
+            raise ConnectionClosedError(None, None)
+
+        for message in messages:
+            self.messages.append((key, message))
+            self.queued_bytes += len(message)
+
+        if self.queued_bytes > OUTBOUND_MAX_SIZE:
+            print("[BreakTools] Dropping client because its outbound queue is full.")
+            self.close()
+            raise ConnectionClosedError(None, None)
+
+        self.has_messages.set()
+
+    def remove_messages(self, key: str) -> None:
+        """This function removes all pending messages with the given key."""
+        kept_messages = deque()
+
+        for message_key, message in self.messages:
+            if message_key == key:
+                self.queued_bytes -= len(message)
+            else:
+                kept_messages.append((message_key, message))
+
+        self.messages = kept_messages
+
+    async def write_messages(self) -> None:
+        """This function sends the queued messages one by one. If a single
+        message takes longer than the stall timeout, the client is dropped."""
+        while not self.closed:
+            await self.has_messages.wait()
+
+            while self.messages:
+                _, message = self.messages.popleft()
+                self.queued_bytes -= len(message)
+
+                if self.queued_bytes <= OUTBOUND_LOW_WATERMARK:
+                    self.slow = False
+
+                started_sending = monotonic()
+                try:
+                    await asyncio.wait_for(
+                        self.websocket.send(message), OUTBOUND_STALL_TIMEOUT
+                    )
+                except asyncio.TimeoutError:
+                    print(
+                        "[BreakTools] Dropping client that stalled for "
+                        f"{monotonic() - started_sending:.1f} seconds."
+                    )
+                    self.close()
+                    await self.websocket.close(1008, "Client too slow")
+                    return
+                except ConnectionClosed:
+                    self.close()
+                    return
+
+            self.has_messages.clear()
+
+    def close(self) -> None:
+        """This function stops the queue and frees all pending messages."""
+        self.closed = True
+        self.messages.clear()
+        self.queued_bytes = 0
+
+        if self.writer is not asyncio.current_task():
+            self.writer.cancel()
@@ -0,0 +1,215 @@
+"""
+Job progress history for the BreakTools Deadline Web App by Mervin van Brakel (2023)
+
+Deadline only tells us the estimated time remaining and the average task time of
+a job, so every browser tab that wanted a progress chart had to build its own
+history by asking for job details every second. Now the active job list, which is
+refreshed for everyone at once anyway, is sampled every PROGRESS_SAMPLE_INTERVAL
+seconds, and refreshed every BACKGROUND_POLL_INTERVAL seconds when no client is
+connected. Every job keeps its last PROGRESS_HISTORY_SIZE samples in NumPy ring
+buffers, so memory use doesn't grow with how long a job runs. Clients ask for a
+chart with get_progress_history and get a fixed number of points, together with
+the throughput and ETA we calculated from the samples.
+"""
+
+from os import getenv
+from time import time
+
+from dotenv import load_dotenv
+from numpy import concatenate, diff, flatnonzero, float64, int32, int64, polyfit, zeros
+
+load_dotenv()
+
+PROGRESS_SAMPLE_INTERVAL = float(getenv("PROGRESS_SAMPLE_INTERVAL", "10"))
+PROGRESS_HISTORY_SIZE = int(getenv("PROGRESS_HISTORY_SIZE", "1080"))
+PROGRESS_RATE_WINDOW = float(getenv("PROGRESS_RATE_WINDOW", "600"))
+CHART_POINTS = 120
+RATE_MIN_SAMPLES = 2
+CHART_WINDOWS = {"15m": 900, "1h": 3600, "3h": 10800}
+
+PROGRESS_HISTORIES = {}
+CHARTS = {}
+
+
+class progress_ring:
+    """Class for storing the progress samples of a single job. When it's full
+    the oldest sample is overwritten."""
+
+    def __init__(self, size: int = PROGRESS_HISTORY_SIZE) -> None:
+        self.times = zeros(size, dtype=float64)
+        self.completed = zeros(size, dtype=int32)
+        self.rendering = zeros(size, dtype=int32)
+        self.failed = zeros(size, dtype=int32)
+        self.total = 0
+        self.next_index = 0
+        self.sample_count = 0
+
+    def add_sample(
+        self, sample_time: float, completed: int, rendering: int, failed: int
+    ) -> None:
+        """This function stores a sample in place of the oldest one."""
+        self.times[self.next_index] = sample_time
+        self.completed[self.next_index] = completed
+        self.rendering[self.next_index] = rendering
+        self.failed[self.next_index] = failed
+        self.next_index = (self.next_index + 1) % len(self.times)
+        self.sample_count += 1
+
+    def get_last_time(self) -> float:
+        """This function returns when the newest sample was taken."""
+        return float(self.times[self.next_index - 1]) if self.sample_count else 0.0
+
+    def get_samples(self, since: float) -> tuple:
+        """This function returns the times, completed, rendering and failed
+        columns of the samples taken after the given time, oldest first."""
+        columns = (self.times, self.completed, self.rendering, self.failed)
+
+        if self.sample_count < len(self.times):
+            columns = [column[: self.sample_count] for column in columns]
+        else:
+            columns = [
+                concatenate((column[self.next_index :], column[: self.next_index]))
+                for column in columns
+            ]
+
+        first_index = int(columns[0].searchsorted(since, side="right"))
+        return tuple(column[first_index:] for column in columns)
+
+
+def get_job_counts(job: dict) -> tuple[int, int, int, int]:
+    """This function returns the completed, rendering, failed and
+    total number of tasks of a job from the job lists."""
+    counts = {
+        field: int(job.get(field) or 0)
+        for field in (
+            "CompletedChunks",
+            "QueuedChunks",
+            "SuspendedChunks",
+            "RenderingChunks",
+            "FailedChunks",
+            "PendingChunks",
+        )
+    }
+
+    return (
+        counts["CompletedChunks"],
+        counts["RenderingChunks"],
+        counts["FailedChunks"],
+        sum(counts.values()),
+    )
+
+
+def record_job_progress(active_jobs: dict) -> None:
+    """This function stores a progress sample of every active job, at most once
+    every PROGRESS_SAMPLE_INTERVAL seconds. Histories of jobs that stopped being
+    active are kept until all of their samples would have been overwritten."""
+    now = time()
+
+    for job_id, job in active_jobs.items():
+        history = PROGRESS_HISTORIES.get(job_id)
+        if history is None:
+            history = PROGRESS_HISTORIES[job_id] = progress_ring()
+
+        if now - history.get_last_time() < PROGRESS_SAMPLE_INTERVAL:
+            continue
+
+        try:
+            completed, rendering, failed, total = get_job_counts(job)
+        except (TypeError, ValueError):
+            continue
+
+        history.add_sample(now, completed, rendering, failed)
+        history.total = total
+
+    for job_id, history in list(PROGRESS_HISTORIES.items()):
+        if (
+            job_id not in active_jobs
+            and now - history.get_last_time()
+            > PROGRESS_SAMPLE_INTERVAL * PROGRESS_HISTORY_SIZE
+        ):
+            del PROGRESS_HISTORIES[job_id]
+            CHARTS.pop(job_id, None)
+
+
+def get_progress_history(job_id: str, window: str) -> dict:
+    """This function returns the progress chart of a job over the given window,
+    with at most CHART_POINTS points. Charts are cached until the next sample,
+    so everyone looking at the same job only costs one calculation."""
+    if window not in CHART_WINDOWS:
+        window = "1h"
+
+    history = PROGRESS_HISTORIES.get(job_id)
+    if history is None:
+        return get_chart_message(job_id, window, None)
+
+    cached_chart = CHARTS.get(job_id, {}).get(window)
+    if cached_chart is not None and cached_chart[0] == history.sample_count:
+        return cached_chart[1]
+
+    chart = get_chart_message(job_id, window, history)
+    CHARTS.setdefault(job_id, {})[window] = (history.sample_count, chart)
+
+    return chart
+
+
+def get_chart_message(job_id: str, window: str, history: progress_ring | None) -> dict:
+    """This function downsamples the samples of a window to the chart points.
+    Progress only goes one way most of the time, so each point is the last
+    sample that falls within it."""
+    message = {
+        "type": "progress_history",
+        "job_id": job_id,
+        "window": window,
+        "times": [],
+        "completed": [],
+        "rendering": [],
+        "failed": [],
+        "total": 0,
+        "tasks_per_minute": None,
+        "eta_seconds": None,
+    }
+
+    if history is None or not history.sample_count:
+        return message
+
+    window_end = history.get_last_time()
+    window_start = window_end - CHART_WINDOWS[window]
+    times, completed, rendering, failed = history.get_samples(window_start)
+
+    points = (
+        ((times - window_start) * (CHART_POINTS / CHART_WINDOWS[window]))
+        .astype(int64)
+        .clip(0, CHART_POINTS - 1)
+    )
+    last_samples = flatnonzero(diff(points, append=CHART_POINTS))
+
+    message["times"] = times[last_samples].round().astype(int64).tolist()
+    message["completed"] = completed[last_samples].tolist()
+    message["rendering"] = rendering[last_samples].tolist()
+    message["failed"] = failed[last_samples].tolist()
+    message["total"] = history.total
+    message.update(get_estimates(history))
+
+    return message
+
+
+def get_estimates(history: progress_ring) -> dict:
+    """This function fits a straight line through the completed tasks of the last
+    PROGRESS_RATE_WINDOW seconds. Its slope is the throughput, and the remaining
+    tasks divided by it the ETA. Without progress there is no ETA."""
+    times, completed, _, _ = history.get_samples(
+        history.get_last_time() - PROGRESS_RATE_WINDOW
+    )
+
+    if len(times) < RATE_MIN_SAMPLES or times[-1] == times[0]:
+        return {"tasks_per_minute": None, "eta_seconds": None}
+
+    tasks_per_second = float(polyfit(times - times[0], completed, 1)[0])
+    remaining_tasks = history.total - int(completed[-1])
+
+    return {
+        "tasks_per_minute": round(max(tasks_per_second, 0.0) * 60, 3),
+        "eta_seconds": (
+            round(remaining_tasks / tasks_per_second) if tasks_per_second > 0 else None
+        ),
+    }
@@ -0,0 +1,85 @@
+"""
+Request batching for the BreakTools Deadline Web App by Mervin van Brakel (2023)
+
+Some Deadline Web Service calls accept a whole list of IDs. This file has a class
+that collects the requests made within a short window and sends them as a single
+call. It can also add keys that weren't requested yet, but will be soon. Their
+results are kept for a moment, so those requests don't need a call of their own.
+"""
+
+import asyncio
+from collections.abc import Awaitable, Callable
+from time import monotonic
+
+
+class request_batcher:
+    """Class for combining requests for different keys into a single request."""
+
+    def __init__(
+        self,
+        fetch_function: Callable[[list], Awaitable[dict]],
+        window: float,
+        get_upcoming_keys: Callable[[], list] = list,
+        prefetch_lifetime: float = 1,
+    ) -> None:
+        self.fetch_function = fetch_function
+        self.window = window
+        self.get_upcoming_keys = get_upcoming_keys
+        self.prefetch_lifetime = prefetch_lifetime
+        self.pending_requests = {}
+        self.prefetched_results = {}
+        self.flush_task = None
+
+    async def get(self, key):
+        """This function returns the result for a key. It waits for the window
+        to close, unless the result was fetched together with another key."""
+        prefetched = self.prefetched_results.pop(key, None)
+        if (
+            prefetched is not None
+            and monotonic() - prefetched[0] < self.prefetch_lifetime
+        ):
+            return prefetched[1]
+
+        if key not in self.pending_requests:
+            self.pending_requests[key] = asyncio.get_running_loop().create_future()
+
+        if self.flush_task is None:
+            self.flush_task = asyncio.create_task(self.flush())
+
+        # Other requests for the same key wait for this future too,
+        # so one of them getting cancelled shouldn't cancel it.
+        return await asyncio.shield(self.pending_requests[key])
+
+    async def flush(self) -> None:
+        """This function sends all requests collected during the window."""
+        await asyncio.sleep(self.window)
+
+        pending_requests = self.pending_requests
+        self.pending_requests = {}
+        self.flush_task = None
+
+        upcoming_keys = [
+            key for key in self.get_upcoming_keys() if key not in pending_requests
+        ]
+
+        try:
+            results = await self.fetch_function(list(pending_requests) + upcoming_keys)
+        except Exception as error:  # noqa: BLE001
+            # Whatever went wrong is raised for everyone that was waiting.
+            for future in pending_requests.values():
+                future.set_exception(error)
+            return
+
+        for key, future in pending_requests.items():
+            future.set_result(results.get(key))
+
+        fetched = monotonic()
+        self.prefetched_results = {
+            key: prefetched
+            for key, prefetched in self.prefetched_results.items()
+            if fetched - prefetched[0] < self.prefetch_lifetime
+        }
+
+        for key in upcoming_keys:
+            if key in results:
+                self.prefetched_results[key] = (fetched, results[key])
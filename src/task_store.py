@@ -0,0 +1,108 @@
+"""
+Columnar task storage for the BreakTools Deadline Web App by Mervin van Brakel (2023)
+
+Big jobs can have thousands of tasks. Instead of keeping those as a list of
+dictionaries and comparing the whole list every poll, the tasks of a job
+are stored as NumPy columns. Finding the tasks that changed between two polls
+is then a single vectorized comparison, and only those rows get sent.
+"""
+
+from sys import intern
+
+from numpy import array, flatnonzero, float32, int32, int64, ndarray
+
+
+def get_progress_value(progress) -> float:
+    """This function turns Deadline's task progress (like "45 %") into
+    a number we can compare quickly."""
+    try:
+        return float(str(progress).rstrip("% "))
+    except ValueError:
+        return 0.0
+
+
+class job_task_table:
+    """Class for storing the tasks of a single job as columns."""
+
+    def __init__(
+        self,
+        task_ids: ndarray,
+        frames: ndarray,
+        errors: ndarray,
+        progress: ndarray,
+        progress_labels: list,
+    ) -> None:
+        self.task_ids = task_ids
+        self.frames = frames
+        self.errors = errors
+        self.progress = progress
+        self.progress_labels = progress_labels
+
+    @classmethod
+    def from_tasks(cls, job_tasks: dict) -> "job_task_table":
+        """This function builds a task table from a GetJobTasks response.
+        Frame ranges are interned, most jobs reuse the same few strings."""
+        tasks = job_tasks["Tasks"]
+
+        return cls(
+            array([task["TaskID"] for task in tasks], dtype=int64),
+            array([intern(str(task["Frames"])) for task in tasks], dtype=object),
+            array([task["Errs"] for task in tasks], dtype=int32),
+            array([get_progress_value(task["Prog"]) for task in tasks], dtype=float32),
+            [task["Prog"] for task in tasks],
+        )
+
+    def __len__(self) -> int:
+        return len(self.task_ids)
+
+    def get_row(self, index: int) -> dict:
+        """This function returns a single task in the format the Web App expects."""
+        return {
+            "TaskID": int(self.task_ids[index]),
+            "Frames": self.frames[index],
+            "Errs": int(self.errors[index]),
+            "Prog": self.progress_labels[index],
+        }
+
+    def to_list(self) -> list:
+        """This function returns all tasks in the format the Web App expects."""
+        return [self.get_row(index) for index in range(len(self))]
+
+    def get_changed_indices(self, previous_table: "job_task_table") -> ndarray | None:
+        """This function returns the indices of the tasks that changed since
+        the previous table. If the tasks themselves changed (because the job
+        got resubmitted, for example) there is nothing to compare, so it
+        returns None."""
+        if (
+            len(self) != len(previous_table)
+            or (self.task_ids != previous_table.task_ids).any()
+        ):
+            return None
+
+        changed_tasks = (
+            (self.errors != previous_table.errors)
+            | (self.progress != previous_table.progress)
+            | (self.frames != previous_table.frames)
+        )
+
+        return flatnonzero(changed_tasks)
+
+    def get_changed_rows(self, previous_table: "job_task_table") -> dict | list:
+        """This function returns only the rows that changed, keyed by their
+        index in the task list. If the tasks can't be compared it returns the
+        whole task list so the client replaces it."""
+        changed_indices = self.get_changed_indices(previous_table)
+
+        if changed_indices is None:
+            return self.to_list()
+
+        return {str(index): self.get_row(index) for index in changed_indices}
+
+    def get_first_task_id_with_errors(self) -> int | None:
+        """This function returns the ID of the first task that has errors."""
+        tasks_with_errors = flatnonzero(self.errors >= 1)
+
+        if len(tasks_with_errors) == 0:
+            return None
+
+        return int(self.task_ids[tasks_with_errors[0]])
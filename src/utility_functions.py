@@ -5,6 +5,8 @@ Utility functions for the BreakTools Deadline Web App by Mervin van Brakel (2023
 from datetime import datetime
 from os import path
 
+from task_store import job_task_table
+
 
 def get_clean_job_data(job: dict, date: datetime) -> dict:
     """This function extracts only the job information we need for
@@ -33,6 +35,16 @@ def get_clean_job_data(job: dict, date: datetime) -> dict:
     return cleaned_job_data
 
 
+def get_clean_jobs(jobs) -> dict:
+    """This function cleans jobs one at a time, so when they come from a
+    stream only a single raw job has to be in memory."""
+
+    return {
+        job["_id"]: get_clean_job_data(job, get_clean_date(job["DateStart"]))
+        for job in jobs
+    }
+
+
 def get_clean_job_detail_data(job_id: str, job_details: dict) -> dict:
     """This function extracts only the job detail information we need
     for the Web App to function."""
@@ -62,21 +74,12 @@ def get_clean_job_detail_data(job_id: str, job_details: dict) -> dict:
     return cleaned_job_detail_data
 
 
-def get_clean_task_data(job_tasks: dict) -> list:
+def get_clean_task_data(job_tasks: dict) -> job_task_table:
     """This function extracts only the task information we need
-    for the Web App to function."""
-
-    cleaned_task_data = [
-        {
-            "TaskID": task["TaskID"],
-            "Frames": task["Frames"],
-            "Errs": task["Errs"],
-            "Prog": task["Prog"],
-        }
-        for task in job_tasks["Tasks"]
-    ]
+    for the Web App to function. Tasks are stored in columns,
+    see task_store.py for why."""
 
-    return cleaned_task_data
+    return job_task_table.from_tasks(job_tasks)
 
 
 def get_clean_date(dirty_date: str) -> datetime:
@@ -112,6 +115,86 @@ def get_dict_differences(dictionary_1: dict, dictionary_2: dict) -> dict:
     return dictionary_3
 
 
+def get_job_details_differences(job_details_1: dict, job_details_2: dict) -> dict:
+    """This function compares two job details and returns only the data
+    that has changed. The job info is compared like any other dictionary,
+    the tasks are compared column by column so we only send the changed rows."""
+
+    differences = get_dict_differences(
+        job_details_1.get("job", {}), job_details_2.get("job", {})
+    )
+    job_details_differences = {"job": differences} if differences else {}
+
+    if "tasks" in job_details_2:
+        if "tasks" in job_details_1:
+            changed_tasks = job_details_2["tasks"].get_changed_rows(
+                job_details_1["tasks"]
+            )
+        else:
+            changed_tasks = job_details_2["tasks"].to_list()
+
+        if changed_tasks:
+            job_details_differences["tasks"] = changed_tasks
+
+    return job_details_differences
+
+
+def merge_dict_differences(differences_1: dict, differences_2: dict) -> dict:
+    """This function merges two sets of differences into one, as if they
+    were sent one after the other. Neither of the inputs is changed."""
+
+    merged_differences = dict(differences_1)
+    for key, value in differences_2.items():
+        if isinstance(value, dict) and isinstance(merged_differences.get(key), dict):
+            merged_differences[key] = merge_dict_differences(
+                merged_differences[key], value
+            )
+        else:
+            merged_differences[key] = value
+
+    return merged_differences
+
+
+def merge_job_details_differences(differences_1: dict, differences_2: dict) -> dict:
+    """This function merges two sets of job details differences into one.
+    Changed tasks are either a full task list or rows keyed by index,
+    so those need a bit of extra care."""
+
+    merged_differences = merge_dict_differences(
+        {"job": differences_1.get("job", {})}, {"job": differences_2.get("job", {})}
+    )
+    if not merged_differences["job"]:
+        del merged_differences["job"]
+
+    tasks_1 = differences_1.get("tasks")
+    tasks_2 = differences_2.get("tasks")
+
+    if tasks_2 is None or isinstance(tasks_2, list):
+        merged_tasks = tasks_2 if tasks_2 is not None else tasks_1
+    elif isinstance(tasks_1, list):
+        merged_tasks = list(tasks_1)
+        for index, task in tasks_2.items():
+            if int(index) < len(merged_tasks):
+                merged_tasks[int(index)] = task
+    else:
+        merged_tasks = {**(tasks_1 or {}), **tasks_2}
+
+    if merged_tasks is not None:
+        merged_differences["tasks"] = merged_tasks
+
+    return merged_differences
+
+
+def get_json_serializable(data):
+    """This function is passed to json.dumps so it knows how to
+    send our task tables to the client."""
+    if isinstance(data, job_task_table):
+        return data.to_list()
+
+    error_message = f"Object of type {type(data).__name__} is not JSON serializable"
+    raise TypeError(error_message)
+
+
 def get_constructed_image_path(
     frame_range: str, output_path: str, file_name: str
 ) -> str:
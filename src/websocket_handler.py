@@ -1,28 +1,89 @@
 """
 WebSocket related functions for the Deadline Web App by Mervin van Brakel (2023)
 
-This backend only fecthes information whenever a user is using the Web App.
-Update speed depends on which page the user is looking at.
+The active and recent jobs are also fetched every BACKGROUND_POLL_INTERVAL
+seconds when nobody is using the Web App, everything else only while a user
+is looking at it. Update speed depends on which page the user is looking at.
 The homepage will be updated every 3 seconds, only sending the needed changes.
 The render job specific page will get an update every second, 
 only sending the needed changes.
+Every message carries a version number. Clients that reconnect send it
+back, so they only get what changed while they were gone.
 """
 
 import asyncio
 import json
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from os import getenv
+from time import perf_counter
 
 import websockets
 from dotenv import load_dotenv
+from websockets.extensions.permessage_deflate import ServerPerMessageDeflateFactory
 
 import deadline_interfacing
-from image_handling import send_image_preview
-from openai_interfacing import create_ai_text
-from utility_functions import get_dict_differences
+from diagnostics import (
+    enable_diagnostics,
+    is_admin_message,
+    record_handler_span,
+    start_profiler,
+)
+from frame_watcher import unwatch_job_frames, watch_job_frames
+from job_index import get_page_query
+from metrics import (
+    BYTES_BUCKETS,
+    get_label_key,
+    observe,
+    register_gauge,
+    start_metrics_server,
+)
+from optional_features import (
+    create_ai_text,
+    send_contact_sheet,
+    send_image_preview,
+)
+from outbound_queue import outbound_queue
+from utility_functions import get_dict_differences, get_json_serializable
+from worker_processes import is_worker_process, shared_deadline_connection
 
 load_dotenv()
-DEADLINE_CONNECTION = deadline_interfacing.deadline_connection()
+if is_worker_process():
+    DEADLINE_CONNECTION = shared_deadline_connection()
+else:
+    DEADLINE_CONNECTION = deadline_interfacing.deadline_connection()
+
+WEBSOCKET_PORT = int(getenv("WEBSOCKET_PORT", "80"))
+WEBSOCKET_COMPRESSION_LEVEL = int(getenv("WEBSOCKET_COMPRESSION_LEVEL", "6"))
+WEBSOCKET_MAX_MESSAGE_SIZE = int(getenv("WEBSOCKET_MAX_MESSAGE_SIZE", "1048576"))
+WEBSOCKET_WRITE_LIMIT = int(getenv("WEBSOCKET_WRITE_LIMIT", "65536"))
+WEBSOCKET_PING_INTERVAL = float(getenv("WEBSOCKET_PING_INTERVAL", "20"))
+WEBSOCKET_PING_TIMEOUT = float(getenv("WEBSOCKET_PING_TIMEOUT", "20"))
+BATCH_UPDATES = getenv("BATCH_UPDATES", "false").lower() == "true"
+
+MAX_PREVIEW_TASKS = int(getenv("MAX_PREVIEW_TASKS", "8"))
+MAX_AI_TEXT_TASKS = int(getenv("MAX_AI_TEXT_TASKS", "16"))
+
+# The messages clients can send. Anything else is counted as unknown in the
+# metrics, so clients can't create new metric labels.
+MESSAGE_TYPES = (
+    "get_active_jobs",
+    "get_recent_jobs",
+    "get_older_jobs",
+    "get_farm_summary",
+    "get_job_details",
+    "get_image_preview",
+    "get_contact_sheet",
+    "get_progress_history",
+    "dump_profile",
+)
+
+CONNECTED_CLIENTS = {}
+PREVIEW_TASK_LIMIT = asyncio.Semaphore(MAX_PREVIEW_TASKS)
+CLIENT_TASK_LIMITS = {
+    "image_preview": PREVIEW_TASK_LIMIT,
+    "contact_sheet": PREVIEW_TASK_LIMIT,
+    "ai_text": asyncio.Semaphore(MAX_AI_TEXT_TASKS),
+}
 
 
 @dataclass
@@ -36,10 +97,19 @@ class websocket_connection:
     last_sent_data: dict
     data_type_to_send: str
     data_to_send: dict
+    sent_versions: dict = field(default_factory=dict)
+    page_queries: dict = field(default_factory=dict)
+    sent_pages: dict = field(default_factory=dict)
+    sent_stale: dict = field(default_factory=dict)
+    client_tasks: dict = field(default_factory=dict)
+    watched_job_id: str = ""
+    frame_watch_task: asyncio.Task | None = None
+    update_task: asyncio.Task | None = None
+    row_updates: bool = False
 
 
 async def update_client_information(
-    connection_data: websocket_connection, websocket
+    connection_data: websocket_connection, outbound: outbound_queue
 ) -> None:
     """This function updates the client every 3 seconds on the homepage and every
     1 second on the job detail page. It only sends the differences, because student
@@ -47,33 +117,25 @@ async def update_client_information(
 
     while connection_data.connected:
         if connection_data.looking_at_job:
-            if "error" not in connection_data.last_sent_data["job_details"]:
+            # The first job details can still be on their way, which takes
+            # a little longer when they come from the leader process.
+            if "error" not in connection_data.last_sent_data.get(
+                "job_details", {"error": "not_sent_yet"}
+            ):
                 connection_data.data_to_send["job_details"] = (
                     await DEADLINE_CONNECTION.get_job_details_and_tasks(
                         connection_data.job_id
                     )
                 )
 
-                differences_to_send = get_dict_differences(
-                    connection_data.last_sent_data["job_details"],
+                message_to_send = get_versioned_message(
+                    "job_details",
                     connection_data.data_to_send["job_details"],
+                    connection_data.sent_versions.get("job_details"),
+                    connection_data.job_id,
+                    connection_data.row_updates,
                 )
 
-                if differences_to_send != {}:
-                    try:
-                        await websocket.send(
-                            json.dumps(
-                                {
-                                    "type": "job_details",
-                                    "data": differences_to_send,
-                                    "update": True,
-                                }
-                            )
-                        )
-                    except websockets.exceptions.ConnectionClosed:
-                        connection_data.connected = False
-                        return
-
                 # If error appears, rewrite AI text
                 if (
                     int(connection_data.last_sent_data["job_details"]["job"]["Errors"])
@@ -83,13 +145,15 @@ async def update_client_information(
                     )
                     != 0
                 ):
-                    asyncio.create_task(
+                    start_client_task(
+                        connection_data,
+                        "ai_text",
                         create_ai_text(
                             connection_data.data_to_send["job_details"],
                             connection_data.job_id,
                             DEADLINE_CONNECTION,
-                            websocket,
-                        )
+                            outbound,
+                        ),
                     )
 
                 # If task fails, rewrite AI text
@@ -101,179 +165,643 @@ async def update_client_information(
                     )
                     != 0
                 ):
-                    asyncio.create_task(
+                    start_client_task(
+                        connection_data,
+                        "ai_text",
                         create_ai_text(
                             connection_data.data_to_send["job_details"],
                             connection_data.job_id,
                             DEADLINE_CONNECTION,
-                            websocket,
-                        )
+                            outbound,
+                        ),
                     )
 
                 connection_data.last_sent_data["job_details"] = (
                     connection_data.data_to_send["job_details"]
                 )
+                connection_data.sent_versions["job_details"] = message_to_send[
+                    "version"
+                ]
 
-            await asyncio.sleep(1)
+                stale_changed = get_stale_changed(connection_data, message_to_send)
 
-        else:
-            for data_type_to_send in connection_data.subscribed_updates:
-                match data_type_to_send:
-                    case "active_jobs":
-                        connection_data.data_to_send[data_type_to_send] = (
-                            await DEADLINE_CONNECTION.get_active_jobs()
-                        )
-                    case "recent_jobs":
-                        connection_data.data_to_send[data_type_to_send] = (
-                            await DEADLINE_CONNECTION.get_recent_jobs()
-                        )
-                    case "older_jobs":
-                        connection_data.data_to_send[data_type_to_send] = (
-                            await DEADLINE_CONNECTION.get_older_jobs()
-                        )
-
-                differences_to_send = get_dict_differences(
-                    connection_data.last_sent_data[data_type_to_send],
-                    connection_data.data_to_send[data_type_to_send],
-                )
-
-                if differences_to_send != {}:
+                if message_to_send["data"] != {} or stale_changed:
                     try:
-                        await websocket.send(
-                            json.dumps(
-                                {
-                                    "type": data_type_to_send,
-                                    "data": differences_to_send,
-                                    "update": True,
-                                }
-                            )
+                        outbound.send_update(
+                            "job_details",
+                            get_update_frames([message_to_send]),
+                            lambda: get_update_frames(
+                                get_snapshot_messages(connection_data, ["job_details"])
+                            ),
                         )
                     except websockets.exceptions.ConnectionClosed:
                         connection_data.connected = False
                         return
 
-                connection_data.last_sent_data[data_type_to_send] = (
-                    connection_data.data_to_send[data_type_to_send]
+            await asyncio.sleep(1)
+
+        else:
+            messages_to_send = []
+
+            for data_type_to_send in connection_data.subscribed_updates:
+                message_to_send = await get_subscription_update(
+                    connection_data, data_type_to_send
                 )
+                if message_to_send is not None:
+                    messages_to_send.append(message_to_send)
+
+            if messages_to_send:
+                try:
+                    outbound.send_update(
+                        "updates",
+                        get_update_frames(messages_to_send),
+                        lambda: get_update_frames(
+                            get_snapshot_messages(
+                                connection_data, connection_data.subscribed_updates
+                            )
+                        ),
+                    )
+                except websockets.exceptions.ConnectionClosed:
+                    connection_data.connected = False
+                    return
 
             await asyncio.sleep(3)
 
 
+async def get_subscription_update(
+    connection_data: websocket_connection, data_type: str
+) -> dict | None:
+    """This function returns the message with the changes to a type of data the
+    client is subscribed to, or None if nothing changed since the last one."""
+    if data_type == "farm_summary":
+        return await get_farm_summary_message(connection_data)
+
+    if connection_data.page_queries.get(data_type):
+        return await get_page_message(connection_data, data_type)
+
+    connection_data.data_to_send[data_type] = await DEADLINE_CONNECTION.get_jobs(
+        data_type
+    )
+
+    message_to_send = get_versioned_message(
+        data_type,
+        connection_data.data_to_send[data_type],
+        connection_data.sent_versions.get(data_type),
+    )
+
+    stale_changed = get_stale_changed(connection_data, message_to_send)
+
+    connection_data.last_sent_data[data_type] = connection_data.data_to_send[data_type]
+    connection_data.sent_versions[data_type] = message_to_send["version"]
+
+    if message_to_send["data"] != {} or stale_changed:
+        return message_to_send
+
+    return None
+
+
+def get_versioned_message(
+    data_type: str,
+    data: dict,
+    client_version: int | None,
+    job_id: str = "",
+    row_updates: bool = True,
+) -> dict:
+    """This function returns the message that brings a client from the version
+    it has to our latest version. If we still remember the changes since the
+    client's version we only send those, otherwise we send all data. Clients
+    without row updates get the whole task list whenever a task changed."""
+    differences = DEADLINE_CONNECTION.get_differences_since_version(
+        data_type, client_version, job_id
+    )
+
+    if (
+        differences is not None
+        and not row_updates
+        and isinstance(differences.get("tasks"), dict)
+    ):
+        differences = {**differences, "tasks": data["tasks"]}
+
+    message = {
+        "type": data_type,
+        "data": data if differences is None else differences,
+        "update": differences is not None,
+        "version": DEADLINE_CONNECTION.get_version(data_type, job_id),
+    }
+
+    if DEADLINE_CONNECTION.is_stale(data_type, job_id):
+        message["stale"] = True
+
+    return message
+
+
+def get_stale_changed(connection_data: websocket_connection, message: dict) -> bool:
+    """This function checks if a message tells the client something new about
+    the data being stale, because the Web Service is unavailable. Messages
+    without the stale flag contain fresh data."""
+    stale = message.get("stale", False)
+    changed = connection_data.sent_stale.get(message["type"], False) != stale
+    connection_data.sent_stale[message["type"]] = stale
+
+    return changed
+
+
+async def get_page_message(
+    connection_data: websocket_connection, data_type: str
+) -> dict | None:
+    """This function returns the message for a client that only looks at a
+    single page of a job list. If the same jobs are still on the page we only
+    send what changed, otherwise we send the whole page. It returns None if
+    nothing changed at all."""
+    page = await DEADLINE_CONNECTION.get_jobs_page(
+        data_type, connection_data.page_queries[data_type]
+    )
+    page_information = {"next_cursor": page["next_cursor"], "total": page["total"]}
+    last_sent_page = connection_data.last_sent_data.get(data_type)
+    stale = DEADLINE_CONNECTION.is_stale(data_type)
+
+    if (
+        data_type in connection_data.sent_pages
+        and last_sent_page.keys() == page["jobs"].keys()
+    ):
+        differences = get_dict_differences(last_sent_page, page["jobs"])
+        if (
+            not differences
+            and connection_data.sent_pages[data_type] == page_information
+            and connection_data.sent_stale.get(data_type, False) == stale
+        ):
+            return None
+
+        message = {"type": data_type, "data": differences, "update": True}
+    else:
+        message = {"type": data_type, "data": page["jobs"], "update": False}
+
+    message["page"] = page_information
+    if stale:
+        message["stale"] = True
+
+    connection_data.last_sent_data[data_type] = page["jobs"]
+    connection_data.sent_pages[data_type] = page_information
+    connection_data.sent_stale[data_type] = stale
+
+    return message
+
+
+async def get_farm_summary_message(
+    connection_data: websocket_connection,
+) -> dict | None:
+    """This function returns the message with the totals of every job list.
+    It's small enough to always send whole, so it returns None if nothing
+    changed since the last one we sent."""
+    farm_summary = await DEADLINE_CONNECTION.get_farm_summary()
+    stale = any(DEADLINE_CONNECTION.is_stale(data_type) for data_type in farm_summary)
+
+    if (
+        connection_data.last_sent_data.get("farm_summary") == farm_summary
+        and connection_data.sent_stale.get("farm_summary", False) == stale
+    ):
+        return None
+
+    message = {"type": "farm_summary", "data": farm_summary, "update": False}
+    if stale:
+        message["stale"] = True
+
+    connection_data.last_sent_data["farm_summary"] = farm_summary
+    connection_data.sent_stale["farm_summary"] = stale
+
+    return message
+
+
+def get_update_frames(messages: list) -> list:
+    """This function turns the messages of a single update tick into frames.
+    With batching enabled they go out as one frame containing an array of typed
+    messages, which saves a lot of frames and compression overhead on mobile links.
+    """
+    if BATCH_UPDATES:
+        frames = [
+            json.dumps(
+                {"type": "batch", "messages": messages}, default=get_json_serializable
+            )
+        ]
+    else:
+        frames = [
+            json.dumps(message, default=get_json_serializable) for message in messages
+        ]
+
+    for frame in frames:
+        observe("update_bytes", len(frame), buckets=BYTES_BUCKETS)
+
+    return frames
+
+
+def get_snapshot_messages(
+    connection_data: websocket_connection, data_types: list
+) -> list:
+    """This function returns full messages with the latest data we sent for
+    the given data types. Slow clients get these instead of piled up updates."""
+    snapshot_messages = []
+
+    for data_type in dict.fromkeys(data_types):
+        if data_type not in connection_data.last_sent_data:
+            continue
+
+        snapshot_message = {
+            "type": data_type,
+            "data": connection_data.last_sent_data[data_type],
+            "update": False,
+        }
+
+        if data_type in connection_data.sent_pages:
+            snapshot_message["page"] = connection_data.sent_pages[data_type]
+        elif data_type != "farm_summary":
+            snapshot_message["version"] = connection_data.sent_versions.get(data_type)
+
+        if connection_data.sent_stale.get(data_type):
+            snapshot_message["stale"] = True
+
+        snapshot_messages.append(snapshot_message)
+
+    return snapshot_messages
+
+
+def set_watched_job(
+    connection_data: websocket_connection,
+    outbound: outbound_queue,
+    job_id: str,
+) -> None:
+    """This function moves the frame_ready subscription of a client to the job
+    it's looking at. An empty job ID stops the subscription."""
+    if job_id == connection_data.watched_job_id:
+        return
+
+    if connection_data.frame_watch_task is not None:
+        connection_data.frame_watch_task.cancel()
+
+    unwatch_job_frames(outbound, connection_data.watched_job_id)
+    connection_data.watched_job_id = job_id
+    connection_data.frame_watch_task = (
+        asyncio.create_task(watch_job_frames(outbound, DEADLINE_CONNECTION, job_id))
+        if job_id
+        else None
+    )
+
+
+def start_client_task(
+    connection_data: websocket_connection, task_type: str, coroutine
+) -> None:
+    """This function runs slow work for a client, like an image preview, in the
+    background. A client has at most one task of each type: a new one replaces
+    the old one, because the client moved on and doesn't need it anymore."""
+    old_task = connection_data.client_tasks.get(task_type)
+    if old_task is not None:
+        old_task.cancel()
+
+    task = asyncio.create_task(run_limited_task(task_type, coroutine))
+    # A task cancelled before it got to run never started its coroutine.
+    task.add_done_callback(lambda _: coroutine.close())
+    connection_data.client_tasks[task_type] = task
+
+
+async def run_limited_task(task_type: str, coroutine) -> None:
+    """This function waits until fewer than the maximum number of tasks
+    of this type are running for all clients together, then runs the task."""
+    async with CLIENT_TASK_LIMITS[task_type]:
+        await coroutine
+
+
+def close_connection(
+    connection_data: websocket_connection, outbound: outbound_queue
+) -> None:
+    """This function cleans up after a client disconnected, so nothing
+    keeps working for it."""
+    connection_data.connected = False
+    set_watched_job(connection_data, outbound, "")
+
+    for task in connection_data.client_tasks.values():
+        task.cancel()
+
+    if connection_data.update_task is not None:
+        connection_data.update_task.cancel()
+
+    outbound.close()
+
+
+def get_message_type(message) -> str:
+    """This function returns the type of a client message for the metrics,
+    or "unknown" if it's not a message we handle."""
+    if isinstance(message, dict) and message.get("body") in MESSAGE_TYPES:
+        return message["body"]
+
+    return "unknown"
+
+
 async def websocket_connection_handler(websocket):
     """This function handles WebSocket connection and sends
     information based on the requests it receives. It also spawns
-    a seperate process that handles updating the information."""
+    a seperate process that handles updating the information.
+    Everything we send goes through the outbound queue of the connection."""
 
     connection_data = websocket_connection(False, False, [], "", {}, None, {})
+    outbound = outbound_queue(websocket)
+    CONNECTED_CLIENTS[outbound] = connection_data
+
+    try:
+        await handle_client_messages(websocket, connection_data, outbound)
+    finally:
+        # Whatever ended the connection, nothing should keep working for it,
+        # and it shouldn't be counted in the metrics anymore.
+        CONNECTED_CLIENTS.pop(outbound, None)
+        close_connection(connection_data, outbound)
+
 
+async def handle_client_messages(
+    websocket, connection_data: websocket_connection, outbound: outbound_queue
+) -> None:
+    """This function handles the messages of a client until it disconnects.
+    A message we can't handle is skipped, the connection stays open."""
     while True:
         try:
             message = await websocket.recv()
         except websockets.exceptions.ConnectionClosed:
-            connection_data.connected = False
             return
 
+        started_handling = perf_counter()
+        message_type = "unknown"
+
         try:
             parsed_message = json.loads(message)
+            message_type = get_message_type(parsed_message)
+            await handle_client_message(connection_data, outbound, parsed_message)
 
-            match parsed_message["body"]:
-                case "get_active_jobs":
-                    connection_data.looking_at_job = False
-                    connection_data.subscribed_updates.append("active_jobs")
-                    connection_data.data_type_to_send = "active_jobs"
-                    connection_data.data_to_send["active_jobs"] = (
-                        await DEADLINE_CONNECTION.get_active_jobs()
-                    )
+        except Exception as error:
+            print(f"[BreakTools] Parsing client data failed. Error: {error}")
+            connection_data.data_to_send = None
 
-                case "get_recent_jobs":
-                    connection_data.looking_at_job = False
-                    connection_data.subscribed_updates.append("recent_jobs")
-                    connection_data.data_type_to_send = "recent_jobs"
-                    connection_data.data_to_send["recent_jobs"] = (
-                        await DEADLINE_CONNECTION.get_recent_jobs()
-                    )
+        if connection_data.data_to_send:
+            try:
+                await send_requested_data(connection_data, outbound, parsed_message)
 
-                case "get_older_jobs":
-                    connection_data.looking_at_job = False
-                    connection_data.subscribed_updates.append("older_jobs")
-                    connection_data.data_type_to_send = "older_jobs"
-                    connection_data.data_to_send["older_jobs"] = (
-                        await DEADLINE_CONNECTION.get_older_jobs()
-                    )
+            except websockets.exceptions.ConnectionClosed:
+                return
 
-                case "get_job_details":
-                    connection_data.looking_at_job = True
-                    connection_data.subscribed_updates = []
+        connection_data.data_to_send = {}
 
-                    if parsed_message["jobId"] != "undefined":
-                        connection_data.job_id = parsed_message["jobId"]
-                        connection_data.data_type_to_send = "job_details"
-                        connection_data.data_to_send["job_details"] = (
-                            await DEADLINE_CONNECTION.get_job_details_and_tasks(
-                                parsed_message["jobId"]
-                            )
-                        )
+        if not connection_data.connected:
+            connection_data.update_task = asyncio.create_task(
+                update_client_information(connection_data, outbound)
+            )
+            connection_data.connected = True
 
-                case "get_image_preview":
-                    asyncio.create_task(
-                        send_image_preview(
-                            websocket,
-                            DEADLINE_CONNECTION,
-                            parsed_message["jobId"],
-                            parsed_message["taskId"],
-                        )
-                    )
+        record_handler_span(message_type, perf_counter() - started_handling)
 
-                    connection_data.data_to_send = None
 
-        except Exception as error:
-            print(f"[BreakTools] Parsing client data failed. Error: {error}")
+async def handle_client_message(
+    connection_data: websocket_connection, outbound: outbound_queue, parsed_message
+) -> None:
+    """This function handles a single client message. Data that is sent the
+    same way for every type of message is put in data_to_send, messages
+    that send something else themselves set it to None."""
+    if "version" in parsed_message:
+        # Clients that know about versions also know about changed task rows.
+        connection_data.row_updates = True
+
+    match parsed_message["body"]:
+        case "get_active_jobs" | "get_recent_jobs" | "get_older_jobs":
+            await request_job_list(
+                connection_data,
+                outbound,
+                parsed_message["body"].removeprefix("get_"),
+                parsed_message,
+            )
 
-        if connection_data.data_to_send is not None:
-            try:
-                await websocket.send(
-                    json.dumps(
-                        {
-                            "type": connection_data.data_type_to_send,
-                            "data": connection_data.data_to_send[
-                                connection_data.data_type_to_send
-                            ],
-                            "update": False,
-                        }
+        case "get_farm_summary":
+            connection_data.looking_at_job = False
+            set_watched_job(connection_data, outbound, "")
+            if "farm_summary" not in connection_data.subscribed_updates:
+                connection_data.subscribed_updates.append("farm_summary")
+
+            connection_data.last_sent_data.pop("farm_summary", None)
+            await outbound.send(
+                json.dumps(await get_farm_summary_message(connection_data))
+            )
+            connection_data.data_to_send = None
+
+        case "get_job_details":
+            connection_data.looking_at_job = True
+            connection_data.subscribed_updates = []
+
+            if parsed_message["jobId"] != "undefined":
+                connection_data.job_id = parsed_message["jobId"]
+                set_watched_job(connection_data, outbound, parsed_message["jobId"])
+                connection_data.data_type_to_send = "job_details"
+                connection_data.data_to_send["job_details"] = (
+                    await DEADLINE_CONNECTION.get_job_details_and_tasks(
+                        parsed_message["jobId"]
                     )
                 )
 
-            except websockets.exceptions.ConnectionClosed:
-                connection_data.connected = False
-                return
+        case "get_image_preview":
+            start_client_task(
+                connection_data,
+                "image_preview",
+                send_image_preview(
+                    outbound,
+                    DEADLINE_CONNECTION,
+                    parsed_message["jobId"],
+                    parsed_message["taskId"],
+                ),
+            )
 
-            connection_data.last_sent_data[connection_data.data_type_to_send] = (
-                connection_data.data_to_send[connection_data.data_type_to_send]
+            connection_data.data_to_send = None
+
+        case "get_contact_sheet":
+            start_client_task(
+                connection_data,
+                "contact_sheet",
+                send_contact_sheet(
+                    outbound,
+                    DEADLINE_CONNECTION,
+                    parsed_message["jobId"],
+                ),
             )
 
-            if connection_data.data_type_to_send == "job_details":
-                asyncio.create_task(
-                    create_ai_text(
-                        connection_data.last_sent_data["job_details"],
+            connection_data.data_to_send = None
+
+        case "get_progress_history":
+            await outbound.send(
+                json.dumps(
+                    await DEADLINE_CONNECTION.get_progress_history(
                         parsed_message["jobId"],
-                        DEADLINE_CONNECTION,
-                        websocket,
+                        parsed_message.get("window", "1h"),
                     )
                 )
+            )
 
-        connection_data.data_to_send = {}
+            connection_data.data_to_send = None
 
-        if not connection_data.connected:
-            asyncio.create_task(update_client_information(connection_data, websocket))
-            connection_data.connected = True
+        case "dump_profile":
+            if is_admin_message(parsed_message):
+                await outbound.send(
+                    json.dumps({"type": "dump_profile", "started": start_profiler()})
+                )
+
+            connection_data.data_to_send = None
+
+
+async def request_job_list(
+    connection_data: websocket_connection,
+    outbound: outbound_queue,
+    data_type: str,
+    parsed_message: dict,
+) -> None:
+    """This function subscribes a client to a job list. Clients that ask
+    for pages get their page right away, others the whole list."""
+    connection_data.looking_at_job = False
+    set_watched_job(connection_data, outbound, "")
+    if data_type not in connection_data.subscribed_updates:
+        connection_data.subscribed_updates.append(data_type)
+
+    connection_data.page_queries[data_type] = get_page_query(parsed_message)
+    connection_data.sent_pages.pop(data_type, None)
+
+    if connection_data.page_queries[data_type]:
+        await outbound.send(
+            json.dumps(await get_page_message(connection_data, data_type))
+        )
+        connection_data.data_to_send = None
+    else:
+        connection_data.data_type_to_send = data_type
+        connection_data.data_to_send[data_type] = await DEADLINE_CONNECTION.get_jobs(
+            data_type
+        )
+
+
+async def send_requested_data(
+    connection_data: websocket_connection, outbound: outbound_queue, parsed_message
+) -> None:
+    """This function sends the data a client asked for, or only what changed
+    since the version the client already has. Job details come with an AI text."""
+    data_type = connection_data.data_type_to_send
+    message_to_send = get_versioned_message(
+        data_type,
+        connection_data.data_to_send[data_type],
+        parsed_message.get("version"),
+        connection_data.job_id,
+        connection_data.row_updates,
+    )
+
+    await outbound.send(json.dumps(message_to_send, default=get_json_serializable))
+
+    connection_data.last_sent_data[data_type] = connection_data.data_to_send[data_type]
+    connection_data.sent_versions[data_type] = message_to_send["version"]
+    get_stale_changed(connection_data, message_to_send)
+
+    if data_type == "job_details":
+        start_client_task(
+            connection_data,
+            "ai_text",
+            create_ai_text(
+                connection_data.last_sent_data["job_details"],
+                parsed_message["jobId"],
+                DEADLINE_CONNECTION,
+                outbound,
+            ),
+        )
+
+
+def get_subscription_counts() -> dict:
+    """This function counts how many clients are subscribed to each type of data."""
+    subscription_counts = {}
+
+    for connection_data in CONNECTED_CLIENTS.values():
+        data_types = (
+            ["job_details"]
+            if connection_data.looking_at_job
+            else connection_data.subscribed_updates
+        )
+        for data_type in data_types:
+            label_key = get_label_key({"type": data_type})
+            subscription_counts[label_key] = subscription_counts.get(label_key, 0) + 1
+
+    return subscription_counts
+
+
+register_gauge(
+    "connected_clients", "Clients connected right now.", lambda: len(CONNECTED_CLIENTS)
+)
+register_gauge(
+    "subscriptions", "Clients subscribed per type of data.", get_subscription_counts
+)
+register_gauge(
+    "client_tasks",
+    "Image previews, contact sheets and AI texts being made for clients.",
+    lambda: sum(
+        not task.done()
+        for connection_data in CONNECTED_CLIENTS.values()
+        for task in connection_data.client_tasks.values()
+    ),
+)
+register_gauge(
+    "outbound_queue_bytes",
+    "Bytes waiting in the outbound queues of all clients.",
+    lambda: sum(outbound.queued_bytes for outbound in CONNECTED_CLIENTS),
+)
+register_gauge(
+    "outbound_queue_messages",
+    "Messages waiting in the outbound queues of all clients.",
+    lambda: sum(len(outbound.messages) for outbound in CONNECTED_CLIENTS),
+)
+
+
+def get_websocket_server_settings() -> dict:
+    """This function returns the settings for the WebSocket server,
+    so compression and buffer sizes can be tuned per deployment."""
+    settings = {
+        "max_size": WEBSOCKET_MAX_MESSAGE_SIZE,
+        "write_limit": WEBSOCKET_WRITE_LIMIT,
+        "ping_interval": WEBSOCKET_PING_INTERVAL or None,
+        "ping_timeout": WEBSOCKET_PING_TIMEOUT or None,
+    }
+
+    # Worker processes all listen on the same port, the kernel spreads the clients.
+    if is_worker_process():
+        settings["reuse_port"] = True
+
+    if WEBSOCKET_COMPRESSION_LEVEL == 0:
+        settings["compression"] = None
+    else:
+        settings["extensions"] = [
+            ServerPerMessageDeflateFactory(
+                server_max_window_bits=12,
+                compress_settings={
+                    "memLevel": 5,
+                    "level": WEBSOCKET_COMPRESSION_LEVEL,
+                },
+            )
+        ]
+
+    return settings
 
 
 async def start_websocket_server() -> None:
     """This function starts the WebSocket server asynchronously,
     so multiple people can use the web app at the same time."""
 
+    enable_diagnostics()
+    await start_metrics_server()
     await DEADLINE_CONNECTION.set_initial_data()
 
-    async with websockets.serve(websocket_connection_handler, "", 80):
+    if not is_worker_process():
+        # Workers get their job lists from the leader, which polls for them.
+        DEADLINE_CONNECTION.background_tasks.append(
+            asyncio.create_task(DEADLINE_CONNECTION.poll_job_lists_forever())
+        )
+
+    async with websockets.serve(
+        websocket_connection_handler,
+        "",
+        WEBSOCKET_PORT,
+        **get_websocket_server_settings(),
+    ):
         print("[BreakTools] Started WebSocket server.")
         await asyncio.Future()
@@ -0,0 +1,440 @@
+"""
+Multi-process support for the BreakTools Deadline Web App by Mervin van Brakel (2023)
+
+A single Python process can only use a single CPU core. With WORKERS set to more
+than 1, the launcher starts a leader process instead of a WebSocket server.
+The leader is the only process that talks to the Deadline Web Service. It starts
+the worker processes, which all listen on the same port (using SO_REUSEPORT) and
+only handle the WebSocket clients. The leader sends the workers every change to
+the job lists over a Unix socket and answers their questions about single jobs,
+so the load on the Web Service stays the same no matter how many workers there are.
+"""
+
+import asyncio
+import os
+import pickle
+import sys
+from collections import deque
+from contextlib import suppress
+from datetime import datetime
+from itertools import count
+from os import getenv
+from pathlib import Path
+from struct import pack, unpack
+
+from dotenv import load_dotenv
+
+from deadline_interfacing import (
+    VERSION_HISTORY_SIZE,
+    deadline_connection,
+    job_details_data,
+    jobs_data,
+    version_history,
+)
+from diagnostics import enable_diagnostics
+from metrics import start_metrics_server
+
+load_dotenv()
+
+WORKERS = int(getenv("WORKERS", "1"))
+IPC_SOCKET_PATH = getenv("IPC_SOCKET_PATH", "/tmp/deadline-web-app.sock")
+JOB_LIST_TYPES = ("active_jobs", "recent_jobs", "older_jobs")
+
+
+def is_worker_process() -> bool:
+    """This function checks if this process was started by a leader process."""
+    return getenv("WORKER_ROLE") == "worker"
+
+
+async def send_frame(writer, message, lock: asyncio.Lock) -> None:
+    """This function sends a message over the Unix socket. Messages are pickled,
+    which is fine because only our own processes can reach the socket."""
+    data = pickle.dumps(message, protocol=pickle.HIGHEST_PROTOCOL)
+
+    async with lock:
+        writer.write(pack(">I", len(data)) + data)
+        await writer.drain()
+
+
+async def read_frame(reader):
+    """This function reads a single message from the Unix socket."""
+    (length,) = unpack(">I", await reader.readexactly(4))
+    return pickle.loads(await reader.readexactly(length))
+
+
+def get_history_copy(version: int, changes: list) -> version_history:
+    """This function creates a version history with the version and
+    changes of the leader."""
+    return version_history(version, deque(changes, maxlen=VERSION_HISTORY_SIZE))
+
+
+class leader_process:
+    """This class polls the Deadline Web Service, publishes the job lists
+    to the worker processes and answers their questions."""
+
+    def __init__(self) -> None:
+        self.deadline_connection = deadline_connection()
+        self.workers = {}
+        self.published_versions = {}
+        self.worker_supervisors = []
+        self.methods = {
+            "get_job_details": self.get_job_details_for_worker,
+            "get_job_error": self.deadline_connection.get_job_error,
+            "get_job_warning": self.deadline_connection.get_job_warning,
+            "get_task_image_path": self.deadline_connection.get_task_image_path,
+            "get_task_image_paths": self.deadline_connection.get_task_image_paths,
+            "get_stored_ai_text": self.deadline_connection.get_stored_ai_text,
+            "get_signature_ai_text": self.deadline_connection.get_signature_ai_text,
+            "get_progress_history": self.deadline_connection.get_progress_history,
+        }
+
+    async def start(self) -> None:
+        """This function starts the leader and its workers, then keeps polling."""
+        enable_diagnostics()
+        await start_metrics_server()
+        await self.deadline_connection.set_initial_data()
+
+        Path(IPC_SOCKET_PATH).unlink(missing_ok=True)
+
+        await asyncio.start_unix_server(self.handle_worker, IPC_SOCKET_PATH)
+        print(f"[BreakTools] Started leader process with {WORKERS} workers.")
+
+        self.worker_supervisors = [
+            asyncio.create_task(self.supervise_worker(worker_number))
+            for worker_number in range(1, WORKERS + 1)
+        ]
+
+        await self.poll_forever()
+
+    async def poll_forever(self) -> None:
+        """This function refreshes the job lists (which only actually happens
+        when they are old enough) and publishes them when they changed."""
+        while True:
+            for data_type in JOB_LIST_TYPES:
+                await self.deadline_connection.get_jobs(data_type)
+
+                if (
+                    self.deadline_connection.get_version(data_type),
+                    self.deadline_connection.is_stale(data_type),
+                ) != self.published_versions.get(data_type):
+                    await self.publish_jobs(data_type)
+
+            await asyncio.sleep(1)
+
+    async def publish_jobs(self, data_type: str) -> None:
+        """This function sends a job list and its latest changes to all workers."""
+        published_version, _ = self.published_versions.get(data_type, (None, False))
+        message = self.get_jobs_message(data_type, published_version)
+        self.published_versions[data_type] = (message["version"], message["stale"])
+
+        for writer, lock in list(self.workers.items()):
+            try:
+                await send_frame(writer, message, lock)
+            except ConnectionError:
+                self.workers.pop(writer, None)
+
+    def get_jobs_message(self, data_type: str, since_version: int | None) -> dict:
+        """This function returns the message containing a job list and the
+        changes to it since the given version."""
+        stored_data = self.deadline_connection.get_stored_data(data_type)
+
+        return {
+            "kind": "jobs",
+            "data_type": data_type,
+            "jobs": stored_data.jobs,
+            "version": stored_data.history.version,
+            "changes": stored_data.history.get_changes_since(since_version),
+            "stale": stored_data.stale,
+            "summary": stored_data.summary,
+        }
+
+    async def get_job_details_for_worker(
+        self, job_id: str, since_version: int | None
+    ) -> dict:
+        """This function returns the details of a job together with the changes
+        the worker doesn't have yet."""
+        job_details = await self.deadline_connection.get_job_details_and_tasks(job_id)
+        watched_job = self.deadline_connection.watched_jobs.get(job_id)
+
+        if watched_job is None:
+            return {"job_details": job_details, "version": None, "changes": []}
+
+        return {
+            "job_details": job_details,
+            "version": watched_job.history.version,
+            "changes": watched_job.history.get_changes_since(since_version),
+            "stale": watched_job.stale,
+        }
+
+    async def handle_worker(self, reader, writer) -> None:
+        """This function sends a new worker all job lists, then answers
+        its questions until it disconnects."""
+        lock = asyncio.Lock()
+        answers = set()
+
+        try:
+            for data_type in JOB_LIST_TYPES:
+                await send_frame(writer, self.get_jobs_message(data_type, None), lock)
+
+            self.workers[writer] = lock
+
+            while True:
+                message = await read_frame(reader)
+                answer = asyncio.create_task(self.answer_call(writer, lock, message))
+                answers.add(answer)
+                answer.add_done_callback(answers.discard)
+
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+
+        finally:
+            self.workers.pop(writer, None)
+            writer.close()
+
+    async def answer_call(self, writer, lock: asyncio.Lock, message: dict) -> None:
+        """This function runs a function for a worker and sends back the result.
+        Exceptions are sent back too, so the worker can raise them."""
+        reply = {"kind": "reply", "id": message["id"]}
+
+        try:
+            reply["result"] = await self.methods[message["method"]](
+                *message["arguments"]
+            )
+        except Exception as error:  # noqa: BLE001
+            reply["error"] = error
+
+        with suppress(ConnectionError):
+            await send_frame(writer, reply, lock)
+
+    async def supervise_worker(self, worker_number: int) -> None:
+        """This function starts a worker process and restarts it if it stops."""
+        while True:
+            worker = await asyncio.create_subprocess_exec(
+                sys.executable,
+                str(Path(__file__).resolve().parent / "launcher.py"),
+                env=dict(
+                    os.environ, WORKER_ROLE="worker", WORKER_NUMBER=str(worker_number)
+                ),
+            )
+            return_code = await worker.wait()
+
+            print(
+                f"[BreakTools] Worker {worker_number} stopped with code "
+                f"{return_code}, restarting it."
+            )
+            await asyncio.sleep(1)
+
+
+class shared_deadline_connection(deadline_connection):
+    """This class works like deadline_connection, but gets its data from
+    the leader process instead of the Deadline Web Service."""
+
+    async def set_initial_data(self) -> None:
+        """This function connects to the leader and waits for the job lists."""
+        self.watched_jobs = {}
+        self.pending_calls = {}
+        self.call_ids = count()
+        self.received_job_lists = set()
+        self.received_all_job_lists = asyncio.Event()
+        self.write_lock = asyncio.Lock()
+        self.reader, self.writer = await asyncio.open_unix_connection(IPC_SOCKET_PATH)
+
+        self.leader_reader = asyncio.create_task(self.read_from_leader())
+        await self.received_all_job_lists.wait()
+        print("[BreakTools] Successfully received initial data from the leader")
+
+    async def read_from_leader(self) -> None:
+        """This function handles the messages from the leader. Workers can't
+        do anything without their leader, so they stop when it's gone."""
+        try:
+            while True:
+                message = await read_frame(self.reader)
+
+                try:
+                    self.handle_leader_message(message)
+                except Exception as error:  # noqa: BLE001
+                    # One bad message shouldn't stop the worker from reading the rest.
+                    print(
+                        "[BreakTools] Could not handle a message from the "
+                        f"leader process. Error: {error}"
+                    )
+
+        except (asyncio.IncompleteReadError, ConnectionError):
+            print("[BreakTools] Lost the connection to the leader process.")
+            os._exit(1)
+
+    def handle_leader_message(self, message: dict) -> None:
+        """This function stores a job list or hands a reply to its caller.
+        Callers that were cancelled while the leader was busy don't get one."""
+        match message["kind"]:
+            case "jobs":
+                self.copy_jobs(message)
+
+            case "reply":
+                future = self.pending_calls.pop(message["id"], None)
+                if future is None or future.done():
+                    return
+
+                if "error" in message:
+                    future.set_exception(message["error"])
+                else:
+                    future.set_result(message["result"])
+
+    def copy_jobs(self, message: dict) -> None:
+        """This function stores a job list sent by the leader."""
+        data_type = message["data_type"]
+
+        if data_type not in self.received_job_lists:
+            setattr(
+                self,
+                data_type,
+                jobs_data(
+                    datetime.now(),
+                    message["jobs"],
+                    get_history_copy(message["version"], message["changes"]),
+                    stale=message["stale"],
+                ),
+            )
+            self.received_job_lists.add(data_type)
+
+            if self.received_job_lists.issuperset(JOB_LIST_TYPES):
+                self.received_all_job_lists.set()
+            return
+
+        stored_data = self.get_stored_data(data_type)
+        stored_data.last_refresh = datetime.now()
+        stored_data.jobs = message["jobs"]
+        stored_data.index = None
+        # The leader already added up the changed jobs, so we take its totals.
+        stored_data.summary = message["summary"]
+        stored_data.stale = message["stale"]
+        stored_data.history.copy_changes(message["version"], message["changes"])
+
+    async def call_leader(self, method: str, *arguments):
+        """This function runs a function in the leader process and returns its result."""
+        call_id = next(self.call_ids)
+        future = asyncio.get_running_loop().create_future()
+        self.pending_calls[call_id] = future
+
+        try:
+            await send_frame(
+                self.writer,
+                {
+                    "kind": "call",
+                    "id": call_id,
+                    "method": method,
+                    "arguments": arguments,
+                },
+                self.write_lock,
+            )
+
+            return await future
+
+        finally:
+            self.pending_calls.pop(call_id, None)
+
+    async def get_active_jobs(self) -> dict:
+        """This function returns the active jobs we got from the leader."""
+        return self.active_jobs.jobs
+
+    async def get_recent_jobs(self) -> dict:
+        """This function returns the recent jobs we got from the leader."""
+        return self.recent_jobs.jobs
+
+    async def get_older_jobs(self) -> dict:
+        """This function returns the older jobs we got from the leader."""
+        return self.older_jobs.jobs
+
+    async def get_job_details_and_tasks(self, job_id: str) -> dict:
+        """This function returns the details of a job from the leader. Like in
+        the leader, they are shared between everyone looking at the job and
+        refreshed at most once every second."""
+        if not await self.check_if_job_exists(job_id):
+            return {"type": "error", "error": "invalid_jobId"}
+
+        watched_job = self.watched_jobs.get(job_id)
+
+        if (
+            watched_job is None
+            or (datetime.now() - watched_job.last_refresh).total_seconds() > 1
+        ):
+            leader_reply = await self.call_leader(
+                "get_job_details",
+                job_id,
+                None if watched_job is None else watched_job.history.version,
+            )
+
+            if leader_reply["version"] is None:
+                return leader_reply["job_details"]
+
+            if watched_job is None:
+                watched_job = job_details_data(
+                    datetime.now(),
+                    datetime.now(),
+                    leader_reply["job_details"],
+                    get_history_copy(leader_reply["version"], leader_reply["changes"]),
+                    stale=leader_reply["stale"],
+                )
+                self.watched_jobs[job_id] = watched_job
+            else:
+                watched_job.last_refresh = datetime.now()
+                watched_job.job_details = leader_reply["job_details"]
+                watched_job.stale = leader_reply["stale"]
+                watched_job.history.copy_changes(
+                    leader_reply["version"], leader_reply["changes"]
+                )
+
+        watched_job.last_requested = datetime.now()
+        self.remove_unwatched_jobs()
+
+        return watched_job.job_details
+
+    async def get_job_error(self, job_id: str, task_id: int) -> str:
+        """This function asks the leader for the error report of a task."""
+        return await self.call_leader("get_job_error", job_id, task_id)
+
+    async def get_job_warning(self, job_id: str, task_id: int) -> str:
+        """This function asks the leader for the report of a task."""
+        return await self.call_leader("get_job_warning", job_id, task_id)
+
+    async def get_task_image_path(self, job_id: str, task_id: int) -> str:
+        """This function asks the leader for the image path of a task."""
+        return await self.call_leader("get_task_image_path", job_id, task_id)
+
+    async def get_task_image_paths(self, job_id: str) -> dict:
+        """This function asks the leader for the image paths of all tasks of a job."""
+        return await self.call_leader("get_task_image_paths", job_id)
+
+    async def get_stored_ai_text(self, job_id: str, prompt_type: str) -> str | None:
+        """This function returns an AI text written by this worker, or else
+        one the leader wrote in the background."""
+        ai_text = await super().get_stored_ai_text(job_id, prompt_type)
+
+        if ai_text is None:
+            ai_text = await self.call_leader("get_stored_ai_text", job_id, prompt_type)
+
+        return ai_text
+
+    async def get_signature_ai_text(
+        self, signature: str, prompt_type: str
+    ) -> str | None:
+        """This function returns an AI text this worker or the leader
+        wrote for a log with the same error signature."""
+        ai_text = await super().get_signature_ai_text(signature, prompt_type)
+
+        if ai_text is None:
+            ai_text = await self.call_leader(
+                "get_signature_ai_text", signature, prompt_type
+            )
+
+        return ai_text
+
+    async def get_progress_history(self, job_id: str, window: str) -> dict:
+        """This function asks the leader for the progress chart of a job,
+        because only the leader samples the active jobs."""
+        return await self.call_leader("get_progress_history", job_id, window)
+
+
+async def start_leader() -> None:
+    """This function starts the leader process."""
+    await leader_process().start()
@@ -0,0 +1,17 @@
+"""
+Test setup for the BreakTools Deadline Web App backend.
+
+The backend modules import each other by name, like they do when launcher.py
+runs them from the src folder, so that folder is put on the path here. The
+Web Service address only has to be set, nothing connects to it.
+"""
+
+import sys
+from os import environ
+from pathlib import Path
+
+environ.setdefault("WEB_SERVICE_IP", "127.0.0.1")
+environ.setdefault("WEB_SERVICE_PORT", "8081")
+environ.setdefault("SNAPSHOT_PATH", "")
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
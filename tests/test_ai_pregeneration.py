@@ -0,0 +1,150 @@
+"""Tests for writing AI texts in the background."""
+
+import asyncio
+from types import SimpleNamespace
+
+import openai
+import pytest
+
+import ai_pregeneration
+import openai_interfacing
+from ai_pregeneration import (
+    AI_TEXTS,
+    pregenerate_ai_texts_forever,
+    queue_ai_texts_for_new_problems,
+)
+from task_store import job_task_table
+
+AI_TEXT_CHUNKS = ["The texture ", "is missing."]
+
+
+def get_listed_job(errors: int, failed: int = 0) -> dict:
+    """This function returns a running job like the job lists have it."""
+    return {
+        "CompletedChunks": 2,
+        "QueuedChunks": 3,
+        "RenderingChunks": 1,
+        "FailedChunks": failed,
+        "PendingChunks": 0,
+        "SuspendedChunks": 0,
+        "Errs": errors,
+    }
+
+
+@pytest.fixture(autouse=True)
+def pregeneration(monkeypatch):
+    """Turns pregeneration on with an empty queue of two jobs."""
+    monkeypatch.setattr(ai_pregeneration, "AI_TEXT", True)
+    monkeypatch.setattr(ai_pregeneration, "AI_PREGENERATE", True)
+    monkeypatch.setattr(ai_pregeneration, "AI_PREGENERATE_INTERVAL", 0)
+    monkeypatch.setattr(ai_pregeneration, "PROMPT_TYPES", {})
+    monkeypatch.setattr(ai_pregeneration, "QUEUED_JOB_IDS", set())
+    monkeypatch.setattr(ai_pregeneration, "PREGENERATE_QUEUE", asyncio.Queue(2))
+
+
+def get_queued_job_ids() -> list:
+    """This function empties the queue and returns what was in it."""
+    queue = ai_pregeneration.PREGENERATE_QUEUE
+    return [queue.get_nowait() for _ in range(queue.qsize())]
+
+
+def test_jobs_seen_for_the_first_time_are_not_queued():
+    queue_ai_texts_for_new_problems([{"broken": get_listed_job(errors=3, failed=1)}])
+
+    assert get_queued_job_ids() == []
+    assert ai_pregeneration.PROMPT_TYPES == {"broken": "running_fails"}
+
+
+@pytest.mark.parametrize(
+    ("errors", "failed", "queued"),
+    [(0, 0, False), (3, 0, True), (3, 1, True)],
+)
+def test_jobs_are_queued_when_they_start_having_problems(errors, failed, queued):
+    queue_ai_texts_for_new_problems([{"job": get_listed_job(errors=0)}])
+    queue_ai_texts_for_new_problems([{"job": get_listed_job(errors, failed)}])
+
+    assert get_queued_job_ids() == (["job"] if queued else [])
+
+
+def test_jobs_are_skipped_when_the_queue_is_full():
+    job_ids = ["job1", "job2", "job3"]
+    queue_ai_texts_for_new_problems(
+        [{job_id: get_listed_job(errors=0) for job_id in job_ids}]
+    )
+    queue_ai_texts_for_new_problems(
+        [{job_id: get_listed_job(errors=3) for job_id in job_ids}]
+    )
+
+    assert get_queued_job_ids() == ["job1", "job2"]
+    assert ai_pregeneration.QUEUED_JOB_IDS == {"job1", "job2"}
+
+
+class stub_deadline_connection:
+    """Class that knows a single job with a warning on its second task."""
+
+    async def get_job_details_and_tasks(self, job_id: str) -> dict:
+        tasks = [
+            {"TaskID": task_id, "Frames": str(task_id), "Errs": errors, "Prog": "0 %"}
+            for task_id, errors in enumerate([0, 2])
+        ]
+        return {
+            "job": {
+                "Completed": 2,
+                "Failed": 0,
+                "Pending": 0,
+                "Queued": 3,
+                "Rendering": 1,
+                "Suspended": 0,
+                "Errors": 2,
+            },
+            "tasks": job_task_table.from_tasks({"Tasks": tasks}),
+        }
+
+    async def get_job_warning(self, job_id: str, task_id: int) -> str:
+        return f"Warning: Could not open texture for task {task_id}."
+
+    async def get_stored_ai_text(self, job_id: str, prompt_type: str) -> str | None:
+        return AI_TEXTS.get(job_id, {}).get(prompt_type)
+
+    async def get_signature_ai_text(self, signature: str, prompt_type: str) -> None:
+        return None
+
+
+def test_queued_ai_texts_are_written_through_openai(monkeypatch):
+    prompts = []
+
+    async def get_token_size(prompt: str) -> int:
+        return len(prompt) // 4
+
+    async def create_completion(**arguments):
+        prompts.append(arguments["messages"][-1]["content"])
+
+        async def stream():
+            for chunk in AI_TEXT_CHUNKS:
+                yield SimpleNamespace(
+                    choices=[SimpleNamespace(delta=SimpleNamespace(content=chunk))]
+                )
+
+        return stream()
+
+    monkeypatch.setattr(openai_interfacing, "get_token_size", get_token_size)
+    monkeypatch.setattr(openai.ChatCompletion, "acreate", create_completion)
+    monkeypatch.setitem(AI_TEXTS, "job", {})
+
+    async def run():
+        worker = asyncio.create_task(
+            pregenerate_ai_texts_forever(stub_deadline_connection())
+        )
+        ai_pregeneration.PREGENERATE_QUEUE.put_nowait("job")
+
+        for _ in range(100):
+            if AI_TEXTS["job"]:
+                break
+            await asyncio.sleep(0.01)
+
+        worker.cancel()
+
+    asyncio.run(run())
+
+    assert AI_TEXTS["job"] == {"running_warnings": "".join(AI_TEXT_CHUNKS)}
+    assert "Could not open texture for task 1" in prompts[0]
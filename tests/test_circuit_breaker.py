@@ -0,0 +1,175 @@
+"""Tests for the circuit breaker in front of the Deadline Web Service."""
+
+import asyncio
+import threading
+from datetime import datetime
+
+import pytest
+
+from circuit_breaker import (
+    CLOSED,
+    HALF_OPEN,
+    OPEN,
+    WebServiceUnavailableError,
+    circuit_breaker,
+)
+from deadline_interfacing import deadline_connection, jobs_data
+from DeadlineConnect import WebServiceConnectionError, WebServiceResponseError
+
+
+def test_breaker_opens_after_threshold_and_refuses_requests():
+    breaker = circuit_breaker(failure_threshold=3, cooldown=60)
+
+    for _ in range(2):
+        breaker.record_failure()
+    assert breaker.state == CLOSED
+    assert breaker.check() is False
+
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    with pytest.raises(WebServiceUnavailableError):
+        breaker.check()
+
+
+def test_breaker_lets_a_single_probe_through_after_cooldown():
+    breaker = circuit_breaker(failure_threshold=1, cooldown=0)
+    breaker.record_failure()
+
+    assert breaker.check() is True
+    assert breaker.state == HALF_OPEN
+    with pytest.raises(WebServiceUnavailableError):
+        breaker.check()
+
+    breaker.record_success()
+    assert breaker.state == CLOSED
+    assert breaker.failures == 0
+
+
+def test_failed_probe_opens_breaker_again():
+    breaker = circuit_breaker(failure_threshold=5, cooldown=0)
+    for _ in range(5):
+        breaker.record_failure()
+
+    assert breaker.check() is True
+    breaker.record_failure()
+    assert breaker.state == OPEN
+
+
+def test_ended_probe_without_answer_opens_breaker_again():
+    breaker = circuit_breaker(failure_threshold=1, cooldown=0)
+    breaker.record_failure()
+    breaker.check()
+
+    breaker.end_probe()
+    assert breaker.state == OPEN
+    # The cooldown already passed, so the next request tests the water again.
+    assert breaker.check() is True
+
+
+def get_connection_with_open_breaker() -> deadline_connection:
+    """This function returns a connection whose breaker lets the next request probe."""
+    connection = deadline_connection()
+    connection.circuit_breaker = circuit_breaker(failure_threshold=1, cooldown=0)
+    connection.circuit_breaker.record_failure()
+    return connection
+
+
+def test_cancelled_probe_does_not_leave_breaker_half_open():
+    async def run():
+        connection = get_connection_with_open_breaker()
+        started = threading.Event()
+        release = threading.Event()
+
+        def slow_request():
+            started.set()
+            release.wait(5)
+            return "too late"
+
+        probe = asyncio.create_task(connection.call_web_service("Test", slow_request))
+        await asyncio.to_thread(started.wait, 5)
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+        release.set()
+
+        assert connection.circuit_breaker.state == OPEN
+        assert await connection.call_web_service("Test", lambda: "back") == "back"
+        assert connection.circuit_breaker.state == CLOSED
+
+    asyncio.run(run())
+
+
+def test_crashed_probe_does_not_leave_breaker_half_open():
+    async def run():
+        connection = get_connection_with_open_breaker()
+
+        def broken_request():
+            error_message = "Bug in our own code"
+            raise RuntimeError(error_message)
+
+        with pytest.raises(RuntimeError, match="Bug"):
+            await connection.call_web_service("Test", broken_request)
+
+        assert connection.circuit_breaker.state == OPEN
+        assert await connection.call_web_service("Test", lambda: "back") == "back"
+
+    asyncio.run(run())
+
+
+def test_unreachable_web_service_keeps_breaker_open(monkeypatch):
+    monkeypatch.setattr("deadline_interfacing.WEB_SERVICE_RETRIES", 0)
+
+    async def run():
+        connection = get_connection_with_open_breaker()
+
+        def unreachable_request():
+            error_message = "Connection refused"
+            raise WebServiceConnectionError(error_message)
+
+        with pytest.raises(WebServiceConnectionError):
+            await connection.call_web_service("Test", unreachable_request)
+
+        assert connection.circuit_breaker.state == OPEN
+
+    asyncio.run(run())
+
+
+def test_responses_the_cleaners_cannot_read_count_as_failures(monkeypatch):
+    monkeypatch.setattr("deadline_interfacing.WEB_SERVICE_RETRIES", 2)
+    monkeypatch.setattr("deadline_interfacing.WEB_SERVICE_RETRY_DELAY", 0)
+    connection = deadline_connection()
+    connection.circuit_breaker = circuit_breaker(failure_threshold=1, cooldown=60)
+    attempts = []
+
+    def malformed_request():
+        attempts.append("GetJobs")
+        return {"Jobs": "not a list"}["Stat"]
+
+    async def run():
+        with pytest.raises(WebServiceResponseError, match="can't use"):
+            await connection.call_web_service("Test", malformed_request)
+
+    asyncio.run(run())
+
+    assert len(attempts) == 3
+    assert connection.circuit_breaker.state == OPEN
+
+
+def test_malformed_job_list_falls_back_to_stale_data(monkeypatch):
+    monkeypatch.setattr("deadline_interfacing.WEB_SERVICE_RETRIES", 0)
+    connection = deadline_connection()
+    connection.active_jobs = jobs_data(datetime(2000, 1, 1), {"job": {"Stat": 1}})
+    connection.recent_jobs = jobs_data(datetime.now(), {})
+
+    def malformed_jobs(_state):
+        yield {"_id": "job"}
+
+    monkeypatch.setattr(
+        connection.deadline_connection.Jobs, "StreamJobsInState", malformed_jobs
+    )
+
+    async def run():
+        return await connection.get_active_jobs()
+
+    assert asyncio.run(run()) == {"job": {"Stat": 1}}
+    assert connection.is_stale("active_jobs")
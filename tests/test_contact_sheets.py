@@ -0,0 +1,73 @@
+"""Tests for building contact sheets."""
+
+import asyncio
+import threading
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("OpenEXR")
+
+from PIL import Image
+
+import contact_sheets
+
+
+@pytest.fixture
+def frames(tmp_path, monkeypatch):
+    """Fakes reading EXRs, and returns the paths of three frames of which
+    the last one isn't rendered yet."""
+    decoded_paths = []
+
+    def read_exr_image(path_to_exr: str, width: int) -> Image.Image:
+        decoded_paths.append(path_to_exr)
+        return Image.new("RGB", (width, width // 2), (255, 0, 0))
+
+    monkeypatch.setattr(contact_sheets, "read_exr_image", read_exr_image)
+
+    image_paths = {task_id: str(tmp_path / f"{task_id}.exr") for task_id in range(3)}
+    for task_id in (0, 1):
+        (tmp_path / f"{task_id}.exr").write_bytes(b"exr")
+
+    return image_paths, decoded_paths
+
+
+def test_only_changed_frames_are_decoded(frames):
+    image_paths, decoded_paths = frames
+    sheet = contact_sheets.contact_sheet()
+
+    assert asyncio.run(contact_sheets.get_updated_contact_sheet(image_paths, sheet))
+    message = sheet.get_message("job")
+    assert message["tiles"] == {"0": 0, "1": 1}
+    assert message["tile_height"] == contact_sheets.CONTACT_SHEET_TILE_WIDTH // 2
+    assert sorted(decoded_paths) == [image_paths[0], image_paths[1]]
+
+    decoded_paths.clear()
+    assert not asyncio.run(contact_sheets.get_updated_contact_sheet(image_paths, sheet))
+    assert decoded_paths == []
+
+    Path(image_paths[2]).write_bytes(b"exr")
+
+    assert asyncio.run(contact_sheets.get_updated_contact_sheet(image_paths, sheet))
+    assert decoded_paths == [image_paths[2]]
+    assert sheet.get_message("job")["tiles"] == {"0": 0, "1": 1, "2": 2}
+
+
+def test_mosaic_is_built_off_the_event_loop(frames, monkeypatch):
+    image_paths, _ = frames
+    sheet = contact_sheets.contact_sheet()
+    thread_names = []
+
+    for method_name in ("paste_thumbnails", "encode_mosaic"):
+        method = getattr(sheet, method_name)
+
+        def record_thread(*arguments, method=method):
+            thread_names.append(threading.current_thread().name)
+            return method(*arguments)
+
+        monkeypatch.setattr(sheet, method_name, record_thread)
+
+    asyncio.run(contact_sheets.get_updated_contact_sheet(image_paths, sheet))
+
+    assert [name.startswith("image") for name in thread_names] == [True, True]
+    assert sheet.encoded_mosaic
@@ -0,0 +1,91 @@
+"""Tests for reading JSON arrays while they download from the Web Service."""
+
+import io
+import json
+
+import pytest
+
+from DeadlineConnect import readFirstJsonArrayString, streamJsonArray
+
+JOB_LIST = (
+    '[ {"_id": "a", "Props": {"Name": "shot, [v2]\n\\"final\\""}, "Errs": 12},\n'
+    '12345, -0.5e3, "café ☕", [1, [2]], true, null ,{"Stat": 1}]'
+)
+
+TASK_REPORTS = ' [ "Error: \\"café\\" ☕\\nat line 2" ,"second report", "third"]'
+LONG_REPORT = "0123456789" * 20 + "\\u00e9\\n" + "0123456789" * 20
+
+
+@pytest.mark.parametrize("chunk_size", range(1, len(JOB_LIST.encode()) + 1))
+def test_streamed_items_dont_depend_on_chunk_boundaries(chunk_size):
+    response = io.BytesIO(JOB_LIST.encode())
+
+    items = list(streamJsonArray(response, chunk_size))
+
+    assert items == json.loads(JOB_LIST.replace("\n", " "))
+    assert response.closed
+
+
+def test_empty_array_is_streamed():
+    assert list(streamJsonArray(io.BytesIO(b" [ ] "), 1)) == []
+
+
+@pytest.mark.parametrize(
+    ("body", "error"),
+    [
+        (b'{"Stat": 1}', "not a JSON array"),
+        (b"[1 2]", "is invalid"),
+        (b'[1, "a', "Unterminated string"),
+        (b"[1, ", "was cut off"),
+    ],
+)
+def test_invalid_arrays_are_refused(body, error):
+    with pytest.raises(ValueError, match=error):
+        list(streamJsonArray(io.BytesIO(body), 2))
+
+
+@pytest.mark.parametrize("chunk_size", range(1, len(TASK_REPORTS.encode()) + 1))
+def test_first_report_doesnt_depend_on_chunk_boundaries(chunk_size):
+    response = io.BytesIO(TASK_REPORTS.encode())
+
+    report = readFirstJsonArrayString(response, 1000, chunk_size)
+
+    assert report == (json.loads(TASK_REPORTS)[0], False)
+    assert response.closed
+
+
+def test_only_the_first_report_is_downloaded():
+    reports = json.dumps(["first", "x" * 100000]).encode()
+    response = io.BytesIO(reports)
+    read_sizes = []
+    read = response.read
+
+    def record_read(size):
+        read_sizes.append(size)
+        return read(size)
+
+    response.read = record_read
+
+    assert readFirstJsonArrayString(response, 1000, 16) == ("first", False)
+    assert len(read_sizes) == 1
+
+
+@pytest.mark.parametrize("max_length", range(195, 215))
+def test_long_reports_are_cut_off_between_escape_sequences(max_length):
+    full_report = json.loads(f'"{LONG_REPORT}"')
+    response = io.BytesIO(f'["{LONG_REPORT}", "second"]'.encode())
+
+    report, cut_off = readFirstJsonArrayString(response, max_length, 7)
+
+    assert cut_off
+    assert 0 < len(report) <= max_length
+    assert full_report.startswith(report)
+
+
+def test_empty_report_list_has_no_report():
+    assert readFirstJsonArrayString(io.BytesIO(b" [\n ] "), 10, 1) == (None, False)
+
+
+def test_report_list_without_strings_is_refused():
+    with pytest.raises(ValueError, match="JSON string array"):
+        readFirstJsonArrayString(io.BytesIO(b"[1, 2]"), 10, 1)
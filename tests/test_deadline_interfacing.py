@@ -0,0 +1,199 @@
+"""Tests for the stored data of the Deadline Web Service connection."""
+
+import asyncio
+from collections import deque
+from datetime import datetime
+
+import deadline_interfacing
+from deadline_interfacing import deadline_connection, jobs_data, version_history
+from DeadlineConnect import WebServiceConnectionError
+from utility_functions import merge_dict_differences
+
+RING_SIZE = 3
+
+
+def get_filled_history() -> version_history:
+    """This function returns a history at version 5 that only kept
+    the changes of the last three versions."""
+    history = version_history(version=0, changes=deque(maxlen=RING_SIZE))
+    for version in range(1, 6):
+        history.add_version({"job": {"Stat": version}, f"job{version}": {}})
+
+    return history
+
+
+def test_old_changes_roll_out_of_the_history():
+    history = get_filled_history()
+
+    assert [version for version, _ in history.changes] == [3, 4, 5]
+    assert history.get_differences_since(2, merge_dict_differences) == {
+        "job": {"Stat": 5},
+        "job3": {},
+        "job4": {},
+        "job5": {},
+    }
+    assert history.get_differences_since(5, merge_dict_differences) == {}
+    assert history.get_differences_since(1, merge_dict_differences) is None
+
+
+def test_unknown_versions_need_all_data():
+    history = get_filled_history()
+
+    for version in (6, None, "4", 4.0):
+        assert history.get_differences_since(version, merge_dict_differences) is None
+
+
+def test_merged_changes_are_cached_until_the_next_version():
+    history = get_filled_history()
+    merged_differences = history.get_differences_since(3, merge_dict_differences)
+
+    assert history.get_differences_since(3, merge_dict_differences) is (
+        merged_differences
+    )
+
+    history.add_version({"job": {"Stat": 6}})
+
+    assert history.get_differences_since(3, merge_dict_differences) == {
+        "job": {"Stat": 6},
+        "job4": {},
+        "job5": {},
+    }
+
+
+def test_reconnecting_client_catches_up_with_the_differences():
+    old_jobs = {"a": {"Stat": 1, "Props": {"Pri": 50}}, "b": {"Stat": 1}}
+    stored_jobs = jobs_data(datetime.now(), old_jobs)
+    client_version = stored_jobs.history.version
+
+    stored_jobs.set_jobs({**old_jobs, "a": {"Stat": 1, "Props": {"Pri": 80}}})
+    stored_jobs.set_jobs({**stored_jobs.jobs, "c": {"Stat": 6}})
+    stored_jobs.set_jobs({**stored_jobs.jobs, "b": {"Stat": 3}})
+
+    differences = stored_jobs.history.get_differences_since(
+        client_version, merge_dict_differences
+    )
+
+    assert stored_jobs.history.version == client_version + 3
+    assert merge_dict_differences(old_jobs, differences) == stored_jobs.jobs
+
+
+def test_workers_copy_the_versions_of_the_leader():
+    leader_history = get_filled_history()
+    worker_history = version_history(version=4, changes=deque(maxlen=RING_SIZE))
+
+    worker_history.copy_changes(5, leader_history.get_changes_since(4))
+
+    assert worker_history.version == leader_history.version
+    assert list(worker_history.changes) == list(leader_history.changes)[-1:]
+
+    leader_history.add_version({"job": {"Stat": 6}})
+    leader_history.add_version({"job": {"Stat": 7}})
+    worker_history.copy_changes(7, leader_history.get_changes_since(6))
+
+    # Version 6 was missed, so the older changes can't be merged anymore.
+    assert [version for version, _ in worker_history.changes] == [7]
+    assert worker_history.get_differences_since(5, merge_dict_differences) is None
+    assert worker_history.get_differences_since(6, merge_dict_differences) == {
+        "job": {"Stat": 7}
+    }
+
+
+class polled_connection(deadline_connection):
+    """Class that counts the job list refreshes instead of doing them.
+    The first refresh of the active jobs fails."""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.refreshed = []
+
+    async def get_active_jobs(self) -> dict:
+        self.refreshed.append("active_jobs")
+        if len(self.refreshed) == 1:
+            error_message = "Connection refused"
+            raise WebServiceConnectionError(error_message)
+
+        return {}
+
+    async def get_recent_jobs(self) -> dict:
+        self.refreshed.append("recent_jobs")
+        return {}
+
+
+def test_job_lists_are_polled_without_clients(monkeypatch):
+    monkeypatch.setattr(deadline_interfacing, "BACKGROUND_POLL_INTERVAL", 0.01)
+    connection = polled_connection()
+
+    async def run():
+        poller = asyncio.create_task(connection.poll_job_lists_forever())
+        await asyncio.sleep(0.1)
+        poller.cancel()
+
+    asyncio.run(run())
+
+    # The failed refresh didn't stop the polling.
+    assert connection.refreshed[:3] == ["active_jobs", "active_jobs", "recent_jobs"]
+
+
+def test_background_polling_can_be_turned_off(monkeypatch):
+    monkeypatch.setattr(deadline_interfacing, "BACKGROUND_POLL_INTERVAL", 0)
+    connection = polled_connection()
+
+    asyncio.run(asyncio.wait_for(connection.poll_job_lists_forever(), 1))
+
+    assert connection.refreshed == []
+
+
+def get_raw_job(job_id: str, status: int, **chunks) -> dict:
+    """This function returns a job like the Web Service sends it."""
+    raw_job = {"_id": job_id, "Stat": status, "Props": {"Name": job_id, "User": "a"}}
+    raw_job["DateStart"] = "2024-01-01T00:00:00.000Z"
+    raw_job["Errs"] = 0
+    for chunk_type in deadline_interfacing.UNFINISHED_CHUNK_TYPES:
+        raw_job[chunk_type] = chunks.get(chunk_type, 0)
+    raw_job["CompletedChunks"] = chunks.get("CompletedChunks", 0)
+
+    return raw_job
+
+
+class farm_jobs:
+    """Class that stands in for the jobs part of the Web Service."""
+
+    def __init__(self, jobs: list) -> None:
+        self.jobs = {job["_id"]: job for job in jobs}
+        self.requested_job_ids = []
+
+    def GetJobIds(self) -> list:
+        return list(self.jobs)
+
+    def GetJobs(self, job_ids: list) -> list:
+        self.requested_job_ids.extend(job_ids)
+        return [self.jobs[job_id] for job_id in job_ids]
+
+
+def test_unfinished_inactive_jobs_are_fetched_again(monkeypatch):
+    jobs = farm_jobs(
+        [
+            get_raw_job("done", 3, CompletedChunks=10),
+            get_raw_job("paused", 2, SuspendedChunks=10),
+            get_raw_job("new", 4, FailedChunks=1),
+        ]
+    )
+    connection = deadline_connection()
+    monkeypatch.setattr(connection.deadline_connection, "Jobs", jobs)
+    connection.inactive_jobs, connection.ignored_job_ids = (
+        deadline_interfacing.get_sorted_inactive_jobs(
+            [jobs.jobs["done"], jobs.jobs["paused"]]
+        )
+    )
+
+    async def get_active_jobs() -> dict:
+        return {}
+
+    monkeypatch.setattr(connection, "get_active_jobs", get_active_jobs)
+    jobs.jobs["paused"] = get_raw_job("paused", 6, PendingChunks=10)
+
+    assert asyncio.run(connection.update_inactive_jobs()) is True
+
+    assert sorted(jobs.requested_job_ids) == ["new", "paused"]
+    assert connection.inactive_jobs["paused"]["PendingChunks"] == 10
+    assert set(connection.inactive_jobs) == {"done", "paused", "new"}
@@ -0,0 +1,68 @@
+"""Tests for recognising logs of the same failure."""
+
+import pytest
+
+from error_signatures import get_error_signature, get_first_key_line
+
+MISSING_TEXTURE_LOG = """\
+=======================================================
+Error
+=======================================================
+Error: Renderer failed on {host}: Could not open texture {path} for frame {frame}.
+   at Deadline.Plugins.PluginWrapper.RenderTasks() on {time}
+=======================================================
+Worker Name: {host}
+Date: {date}
+"""
+
+
+def get_missing_texture_log(**values) -> str:
+    """This function returns a missing texture log with the given details."""
+    details = {
+        "host": "RENDER07",
+        "path": "P:/shows/abc/tex/wood_v001.exr",
+        "frame": 1001,
+        "time": "14:03:12.123",
+        "date": "2023-10-18",
+    } | values
+    return MISSING_TEXTURE_LOG.format(**details)
+
+
+@pytest.mark.parametrize(
+    "values",
+    [
+        {"host": "gpu-box"},
+        {"host": "render-11"},
+        {"host": "10.0.4.21"},
+        {"host": "node04.studio.local"},
+        {"path": "/mnt/shows/xyz/tex/stone_v012.exr", "frame": 7},
+        {"time": "9:41 PM", "date": "18/10/2023"},
+    ],
+)
+def test_logs_of_the_same_failure_share_a_signature(values):
+    assert get_error_signature(get_missing_texture_log(**values)) == (
+        get_error_signature(get_missing_texture_log())
+    )
+
+
+def test_logs_of_different_failures_get_different_signatures():
+    plugin_crash_log = get_missing_texture_log().replace(
+        "Could not open texture", "Access violation while loading plugin"
+    )
+
+    assert get_error_signature(plugin_crash_log) != (
+        get_error_signature(get_missing_texture_log())
+    )
+
+
+def test_unlabelled_words_after_worker_are_kept():
+    assert get_error_signature("Error: worker failed to load scene") != (
+        get_error_signature("Error: worker crashed to load scene")
+    )
+
+
+def test_log_without_error_lines_uses_its_last_lines():
+    log = "Loading scene\nRendering frame 1\nRendering frame 2\nProcess exit code 3"
+
+    assert get_first_key_line(log) is None
+    assert get_error_signature(log) == get_error_signature(log.replace("3", "139"))
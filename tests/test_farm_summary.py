@@ -0,0 +1,43 @@
+"""Tests for the farm-wide job list totals."""
+
+import pytest
+
+from farm_summary import job_list_summary
+from utility_functions import get_dict_differences
+
+
+def get_job(user: str, rendering: int, failed: int = 0) -> dict:
+    """This function returns a job like the job lists have it."""
+    return {"User": user, "RenderingChunks": rendering, "FailedChunks": failed}
+
+
+@pytest.mark.parametrize(
+    "new_jobs",
+    [
+        {"a": get_job("anna", 3), "b": get_job("bob", 2, 1)},
+        {"a": get_job("anna", 5), "b": get_job("bob", 2), "c": get_job("bob", 1)},
+        {"b": get_job("bob", 2), "c": get_job("carl", 4)},
+        {"b": get_job("bob", 2)},
+        {},
+    ],
+)
+def test_updated_totals_match_summing_the_whole_list(new_jobs):
+    old_jobs = {"a": get_job("anna", 3), "b": get_job("bob", 2)}
+    summary = job_list_summary(old_jobs)
+
+    summary.apply_differences(
+        old_jobs, new_jobs, get_dict_differences(old_jobs, new_jobs)
+    )
+
+    assert summary.get_summary() == job_list_summary(new_jobs).get_summary()
+
+
+def test_missing_and_invalid_counts_are_zero():
+    summary = job_list_summary(
+        {"a": {"User": "anna", "RenderingChunks": None, "Errs": "many"}}
+    ).get_summary()
+
+    assert summary["jobs"] == 1
+    assert summary["RenderingChunks"] == 0
+    assert summary["Errs"] == 0
+    assert summary["users"] == {"anna": 1}
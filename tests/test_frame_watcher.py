@@ -0,0 +1,106 @@
+"""Tests for the frame_ready messages of watched jobs."""
+
+import asyncio
+import json
+
+import pytest
+from websockets.exceptions import ConnectionClosedError
+
+import frame_watcher
+
+
+class fake_outbound:
+    """Class that takes the place of the outbound queue of a client."""
+
+    def __init__(self, closed: bool = False) -> None:
+        self.closed = closed
+        self.messages = []
+
+    async def send(self, message: str) -> None:
+        if self.closed:
+            raise ConnectionClosedError(None, None)
+
+        self.messages.append(json.loads(message))
+
+
+class fake_deadline_connection:
+    """Class that knows where the frame of a single task goes."""
+
+    def __init__(self, image_path: str) -> None:
+        self.image_path = image_path
+
+    async def get_task_image_paths(self, job_id: str) -> dict:
+        return {1: self.image_path}
+
+
+async def do_nothing(*arguments) -> None:
+    pass
+
+
+@pytest.fixture
+def polling_watcher(monkeypatch):
+    monkeypatch.setattr(frame_watcher, "FRAME_WATCH_INTERVAL", 0.01)
+    monkeypatch.setattr(frame_watcher, "prewarm_contact_sheet", do_nothing)
+    monkeypatch.setattr(frame_watcher, "get_optional_module", do_nothing)
+    frame_watcher.JOB_WATCHERS.clear()
+    yield
+    for watcher in frame_watcher.JOB_WATCHERS.values():
+        watcher.task.cancel()
+    frame_watcher.JOB_WATCHERS.clear()
+
+
+async def wait_until(condition) -> None:
+    """This function waits at most a second for the condition to be true."""
+    for _ in range(100):
+        if condition():
+            return
+        await asyncio.sleep(0.01)
+
+    pytest.fail("The condition never became true.")
+
+
+def test_closed_client_does_not_stop_the_others(polling_watcher, tmp_path):
+    async def run():
+        connection = fake_deadline_connection(str(tmp_path / "frame_0001.exr"))
+        closed_client = fake_outbound(closed=True)
+        client = fake_outbound()
+
+        await frame_watcher.watch_job_frames(closed_client, connection, "job")
+        await frame_watcher.watch_job_frames(client, connection, "job")
+        watcher = frame_watcher.JOB_WATCHERS["job"]
+        await wait_until(lambda: watcher.seen_versions)
+
+        (tmp_path / "frame_0001.exr").write_bytes(b"frame")
+        await wait_until(lambda: client.messages)
+
+        assert client.messages == [
+            {"type": "frame_ready", "job_id": "job", "task_ids": [1]}
+        ]
+        assert watcher.subscribers == {client}
+        assert not watcher.task.done()
+
+    asyncio.run(run())
+
+
+def test_stopped_watcher_is_replaced_for_new_clients(polling_watcher, tmp_path):
+    async def run():
+        connection = fake_deadline_connection(str(tmp_path / "frame_0001.exr"))
+
+        await frame_watcher.watch_job_frames(fake_outbound(True), connection, "job")
+        first_watcher = frame_watcher.JOB_WATCHERS["job"]
+        await wait_until(lambda: first_watcher.seen_versions)
+
+        (tmp_path / "frame_0001.exr").write_bytes(b"frame")
+        await wait_until(first_watcher.task.done)
+        assert "job" not in frame_watcher.JOB_WATCHERS
+
+        client = fake_outbound()
+        await frame_watcher.watch_job_frames(client, connection, "job")
+        second_watcher = frame_watcher.JOB_WATCHERS["job"]
+        assert second_watcher is not first_watcher
+        await wait_until(lambda: second_watcher.seen_versions)
+
+        (tmp_path / "frame_0001.exr").write_bytes(b"newer frame")
+        await wait_until(lambda: client.messages)
+
+    asyncio.run(run())
@@ -0,0 +1,82 @@
+"""Tests for running image work on its own threads."""
+
+import asyncio
+import threading
+
+import pytest
+
+import image_threads
+from image_threads import run_image_work
+
+
+def test_image_work_returns_its_result():
+    assert asyncio.run(run_image_work(pow, 2, 10)) == pow(2, 10)
+
+
+def test_cancelled_work_holds_its_spot_until_the_thread_is_done():
+    async def run():
+        started = threading.Event()
+        release = threading.Event()
+        finished = threading.Event()
+        limit = asyncio.Semaphore(1)
+
+        def slow_decode():
+            started.set()
+            release.wait(5)
+            finished.set()
+
+        async def limited_preview():
+            async with limit:
+                await run_image_work(slow_decode)
+
+        preview = asyncio.create_task(limited_preview())
+        await asyncio.to_thread(started.wait, 5)
+        preview.cancel()
+        await asyncio.sleep(0.05)
+
+        # The thread is still decoding, so the spot is still taken.
+        assert not preview.done()
+        assert limit.locked()
+
+        release.set()
+        with pytest.raises(asyncio.CancelledError):
+            await preview
+
+        assert finished.is_set()
+        assert not limit.locked()
+
+    asyncio.run(run())
+
+
+def test_cancelled_work_that_did_not_start_is_dropped(monkeypatch):
+    monkeypatch.setattr(
+        image_threads,
+        "IMAGE_EXECUTOR",
+        image_threads.ThreadPoolExecutor(1, thread_name_prefix="test_image"),
+    )
+
+    async def run():
+        release = threading.Event()
+        ran = []
+
+        busy = asyncio.create_task(run_image_work(release.wait, 5))
+        queued = asyncio.create_task(run_image_work(ran.append, "queued"))
+        await asyncio.sleep(0.05)
+
+        queued.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await queued
+
+        release.set()
+        await busy
+        assert ran == []
+
+    asyncio.run(run())
+
+
+def test_image_work_does_not_use_the_default_threads():
+    async def run():
+        thread_name = await run_image_work(lambda: threading.current_thread().name)
+        assert thread_name.startswith("image")
+
+    asyncio.run(run())
@@ -0,0 +1,108 @@
+"""Tests for paging through presorted job lists."""
+
+import pytest
+
+from job_index import (
+    DEFAULT_PAGE_SIZE,
+    MAX_PAGE_SIZE,
+    get_page_query,
+    job_list_index,
+)
+
+
+def get_jobs(job_count: int) -> dict:
+    """This function returns jobs of which a lot share a start time and name."""
+    return {
+        f"job{number:03}": {
+            "EpochStarted": number // 3,
+            "Name": f"shot{number % 4}",
+            "User": ("anna", "bob")[number % 2],
+        }
+        for number in range(job_count)
+    }
+
+
+def read_all_pages(index: job_list_index, message: dict) -> list:
+    """This function follows the cursors until the last page."""
+    job_ids = []
+    page_query = get_page_query(message)
+
+    while True:
+        page = index.get_page(page_query)
+        job_ids.extend(page["jobs"])
+        if page["next_cursor"] is None:
+            return job_ids
+        page_query["cursor"] = page["next_cursor"]
+
+
+@pytest.mark.parametrize("sort_key", ["EpochStarted", "Name", "User"])
+@pytest.mark.parametrize("descending", [True, False])
+@pytest.mark.parametrize("page_size", [1, 4, 7, 50])
+def test_pages_contain_every_job_once_in_order(sort_key, descending, page_size):
+    jobs = get_jobs(25)
+    index = job_list_index(jobs)
+    message = {"page_size": page_size, "sort": sort_key, "descending": descending}
+
+    job_ids = read_all_pages(index, message)
+
+    assert job_ids == sorted(
+        jobs, key=lambda job_id: (jobs[job_id][sort_key], job_id), reverse=descending
+    )
+
+
+def test_pages_of_a_single_user():
+    jobs = get_jobs(25)
+    index = job_list_index(jobs)
+    message = {"page_size": 5, "user": "bob", "sort": "Name"}
+
+    job_ids = read_all_pages(index, message)
+
+    assert sorted(job_ids) == [
+        job_id for job_id in jobs if jobs[job_id]["User"] == "bob"
+    ]
+    assert index.get_page(get_page_query(message))["total"] == len(job_ids)
+
+
+def test_cursor_still_works_after_the_job_list_changed():
+    jobs = get_jobs(10)
+    first_page = job_list_index(jobs).get_page(get_page_query({"page_size": 4}))
+
+    jobs["job100"] = {"EpochStarted": 100, "Name": "new", "User": "anna"}
+    del jobs[next(iter(first_page["jobs"]))]
+    page_query = get_page_query({"page_size": 4, "cursor": first_page["next_cursor"]})
+    next_page = job_list_index(jobs).get_page(page_query)
+
+    assert list(first_page["jobs"]) == ["job009", "job008", "job007", "job006"]
+    assert list(next_page["jobs"]) == ["job005", "job004", "job003", "job002"]
+
+
+def test_cursor_of_another_sort_key_starts_over():
+    index = job_list_index(get_jobs(10))
+    page_query = get_page_query(
+        {"page_size": 3, "sort": "Name", "cursor": [5, "job005"]}
+    )
+
+    assert list(index.get_page(page_query)["jobs"]) == ["job007", "job003", "job006"]
+
+
+def test_page_query_is_cleaned_up():
+    assert get_page_query({}) is None
+
+    page_query = get_page_query(
+        {"page_size": 10**6, "cursor": "job001", "user": "", "sort": "Stat"}
+    )
+
+    assert page_query == {
+        "page_size": MAX_PAGE_SIZE,
+        "cursor": None,
+        "user": None,
+        "sort": "EpochStarted",
+        "descending": True,
+    }
+
+
+@pytest.mark.parametrize("page_size", ["abc", None, [10], float("inf")])
+def test_unreadable_page_size_gets_the_default_size(page_size):
+    page_query = get_page_query({"page_size": page_size})
+
+    assert page_query["page_size"] == DEFAULT_PAGE_SIZE
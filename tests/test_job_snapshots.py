@@ -0,0 +1,81 @@
+"""Tests for the job list snapshots that let a restarted backend start right away."""
+
+import json
+from time import time
+
+import pytest
+
+import job_snapshots
+from job_snapshots import load_snapshot, save_snapshot
+
+JOB_LISTS = {
+    "active_jobs": {"a": {"Name": "shot_010"}},
+    "recent_jobs": {},
+    "older_jobs": {"b": {"Name": "shot_020"}},
+}
+
+
+@pytest.fixture
+def snapshot_path(monkeypatch, tmp_path):
+    """This fixture turns snapshots on, saving them to a temporary folder."""
+    path = tmp_path / "job_snapshot.json"
+    monkeypatch.setattr(job_snapshots, "SNAPSHOT_PATH", str(path))
+    return path
+
+
+def test_saved_snapshot_loads_again(snapshot_path):
+    save_snapshot(JOB_LISTS)
+
+    snapshot = load_snapshot()
+
+    assert {key: snapshot[key] for key in JOB_LISTS} == JOB_LISTS
+    assert time() - snapshot["saved"] < 60
+    assert not snapshot_path.with_name("job_snapshot.json.tmp").exists()
+
+
+def test_failed_save_keeps_the_old_snapshot(monkeypatch, snapshot_path):
+    save_snapshot(JOB_LISTS)
+
+    def crashing_dump(_data, file):
+        file.write('{"active_jobs": {')
+        error_message = "No space left on device"
+        raise OSError(error_message)
+
+    monkeypatch.setattr(job_snapshots.json, "dump", crashing_dump)
+    save_snapshot({**JOB_LISTS, "active_jobs": {}})
+
+    assert load_snapshot()["active_jobs"] == JOB_LISTS["active_jobs"]
+
+
+def test_snapshots_can_be_turned_off(monkeypatch):
+    monkeypatch.setattr(job_snapshots, "SNAPSHOT_PATH", "")
+
+    assert load_snapshot() is None
+
+
+@pytest.mark.parametrize(
+    "contents",
+    [
+        "",
+        '{"active_jobs": {',
+        "[1, 2, 3]",
+        '"job lists"',
+        json.dumps({"active_jobs": {}, "recent_jobs": {}, "saved": time()}),
+        json.dumps({**JOB_LISTS, "saved": "yesterday"}),
+    ],
+)
+def test_unusable_snapshots_are_ignored(snapshot_path, contents):
+    snapshot_path.write_text(contents)
+
+    assert load_snapshot() is None
+
+
+def test_old_snapshots_are_ignored(monkeypatch, snapshot_path):
+    monkeypatch.setattr(job_snapshots, "SNAPSHOT_MAX_AGE", 3600)
+    snapshot_path.write_text(json.dumps({**JOB_LISTS, "saved": time() - 7200}))
+
+    assert load_snapshot() is None
+
+    monkeypatch.setattr(job_snapshots, "SNAPSHOT_MAX_AGE", 0)
+
+    assert load_snapshot()["older_jobs"] == JOB_LISTS["older_jobs"]
@@ -0,0 +1,157 @@
+"""Tests for scheduling OpenAI requests."""
+
+import asyncio
+
+import pytest
+
+import llm_scheduler as llm_scheduler_module
+from llm_scheduler import (
+    BACKGROUND_PRIORITY,
+    TOKEN_WINDOW,
+    VIEWED_PRIORITY,
+    SchedulerFullError,
+    get_retry_delay,
+    llm_scheduler,
+)
+
+
+class held_turn:
+    """Class for a request that keeps its turn until it's released."""
+
+    def __init__(self, scheduler: llm_scheduler, key, tokens=1, priority=0) -> None:
+        self.released = asyncio.Event()
+        self.started = asyncio.Event()
+        self.task = asyncio.create_task(self.hold(scheduler, key, tokens, priority))
+
+    async def hold(self, scheduler, key, tokens, priority) -> None:
+        async with scheduler.turn(key, tokens, priority):
+            self.started.set()
+            await self.released.wait()
+
+
+async def settle() -> None:
+    """This function lets every task that can run, run."""
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_viewed_requests_go_before_background_ones():
+    async def run():
+        scheduler = llm_scheduler(concurrency=1)
+        running = held_turn(scheduler, "running")
+        await settle()
+        started = []
+
+        async def request(key, priority):
+            async with scheduler.turn(key, 1, priority):
+                started.append(key)
+
+        waiting = [
+            asyncio.create_task(request("background", BACKGROUND_PRIORITY)),
+            asyncio.create_task(request("viewed", VIEWED_PRIORITY)),
+            asyncio.create_task(request("promoted", BACKGROUND_PRIORITY)),
+        ]
+        await settle()
+        scheduler.promote("promoted")
+
+        running.released.set()
+        await asyncio.gather(running.task, *waiting)
+
+        assert started == ["viewed", "promoted", "background"]
+        assert scheduler.running == 0
+
+    asyncio.run(run())
+
+
+def test_token_budget_defers_requests_until_the_window_frees_up(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(llm_scheduler_module, "monotonic", lambda: now[0])
+
+    async def run():
+        scheduler = llm_scheduler(concurrency=4, tokens_per_minute=100)
+        first = held_turn(scheduler, "first", tokens=80)
+        second = held_turn(scheduler, "second", tokens=50)
+        await settle()
+
+        assert first.started.is_set()
+        assert not second.started.is_set()
+        assert scheduler.wake_timer is not None
+
+        # The timer would fire a minute later, we don't wait for it.
+        scheduler.wake_timer.cancel()
+        now[0] += TOKEN_WINDOW + 1
+        scheduler.wake_up()
+        await settle()
+
+        assert second.started.is_set()
+        first.released.set()
+        second.released.set()
+        await asyncio.gather(first.task, second.task)
+
+    asyncio.run(run())
+
+
+def test_cancelled_waiter_gives_its_spot_back():
+    async def run():
+        scheduler = llm_scheduler(concurrency=1)
+        running = held_turn(scheduler, "running")
+        waiting = held_turn(scheduler, "waiting")
+        await settle()
+
+        waiting.task.cancel()
+        await settle()
+        assert scheduler.waiting == []
+
+        # This one gets its turn right as it's cancelled.
+        lucky = held_turn(scheduler, "lucky")
+        await settle()
+        running.released.set()
+        await asyncio.sleep(0)
+        lucky.task.cancel()
+        await settle()
+
+        assert running.task.done()
+        assert not lucky.started.is_set()
+        assert scheduler.running == 0
+        later = held_turn(scheduler, "later")
+        await settle()
+        assert later.started.is_set()
+        later.released.set()
+        await later.task
+
+    asyncio.run(run())
+
+
+def test_requests_are_refused_when_the_queue_is_full():
+    async def run():
+        scheduler = llm_scheduler(concurrency=1, queue_size=1)
+        running = held_turn(scheduler, "running")
+        waiting = held_turn(scheduler, "waiting")
+        await settle()
+
+        with pytest.raises(SchedulerFullError):
+            async with scheduler.turn("refused", 1, VIEWED_PRIORITY):
+                pass
+
+        running.released.set()
+        waiting.released.set()
+        await asyncio.gather(running.task, waiting.task)
+
+    asyncio.run(run())
+
+
+class RateLimitError(Exception):
+    """Rate limit error that tells us when to try again."""
+
+    def __init__(self, retry_after: str) -> None:
+        super().__init__()
+        self.headers = {"retry-after": retry_after}
+
+
+def test_retry_delay_follows_retry_after_or_backs_off():
+    assert get_retry_delay(RateLimitError("7"), 0) == float("7")
+
+    base_delay = llm_scheduler_module.OPENAI_RETRY_DELAY
+    for attempt in range(4):
+        delay = get_retry_delay(ValueError(), attempt)
+        assert base_delay * 2**attempt * 0.5 <= delay <= base_delay * 2**attempt * 1.5
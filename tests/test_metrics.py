@@ -0,0 +1,38 @@
+"""Tests for the Prometheus text format metrics."""
+
+from metrics import (
+    METRIC_PREFIX,
+    describe,
+    get_escaped_label_value,
+    get_label_key,
+    get_label_text,
+    get_metrics_text,
+    increment,
+)
+
+
+def test_label_values_are_escaped():
+    assert get_escaped_label_value('a\\b"c\nd') == 'a\\\\b\\"c\\nd'
+    assert get_label_text(get_label_key({"path": 'C:\\"x"'})) == (
+        '{path="C:\\\\\\"x\\""}'
+    )
+
+
+def test_label_without_labels_is_empty():
+    assert get_label_text(()) == ""
+
+
+def test_strange_label_value_stays_on_one_line():
+    describe("test_escaping_total", "counter", "Counter for the escaping test.")
+    increment("test_escaping_total", {"job": 'x"} 1\ninjected_metric 1'})
+
+    lines = [
+        line
+        for line in get_metrics_text().splitlines()
+        if "test_escaping_total" in line or "injected_metric" in line
+    ]
+
+    assert lines[-1] == (
+        f'{METRIC_PREFIX}test_escaping_total{{job="x\\"}} 1\\ninjected_metric 1"}} 1'
+    )
+    assert not any(line.startswith("injected_metric") for line in lines)
@@ -0,0 +1,134 @@
+"""Tests for sharing AI texts between everyone looking at the same job."""
+
+import asyncio
+
+import pytest
+
+import openai_interfacing
+from ai_pregeneration import AI_TEXTS
+
+JOB_DETAILS = {
+    "job": {
+        "Completed": 1,
+        "Failed": 0,
+        "Pending": 0,
+        "Queued": 3,
+        "Rendering": 1,
+        "Suspended": 0,
+        "Errors": 0,
+    }
+}
+
+
+class fake_deadline_connection:
+    """Class that only knows the AI texts stored in this process."""
+
+    async def get_stored_ai_text(self, job_id: str, prompt_type: str) -> str | None:
+        return AI_TEXTS.get(job_id, {}).get(prompt_type)
+
+    async def get_signature_ai_text(self, signature: str, prompt_type: str) -> None:
+        return None
+
+
+class fake_openai:
+    """Class that stands in for send_ai_text and counts the requests."""
+
+    def __init__(self, store_text: bool) -> None:
+        self.store_text = store_text
+        self.requests = 0
+        self.running = 0
+        self.most_running = 0
+
+    async def send_ai_text(self, prompt_type, prompt, job_id, *arguments) -> None:
+        self.requests += 1
+        self.running += 1
+        self.most_running = max(self.most_running, self.running)
+        await asyncio.sleep(0.01)
+        self.running -= 1
+
+        # Without storing, this is like OpenAI being too busy and the
+        # client getting the fallback text.
+        if self.store_text:
+            AI_TEXTS.setdefault(job_id, {})[prompt_type] = "Looking good."
+
+
+class fake_websocket:
+    """Class that takes the place of the outbound queue of a client."""
+
+    async def send(self, message: str) -> None:
+        pass
+
+
+@pytest.fixture
+def clean_ai_texts(monkeypatch):
+    AI_TEXTS.clear()
+    openai_interfacing.GENERATING.clear()
+    monkeypatch.setattr(openai_interfacing, "fake_send_ai_text", fake_send_ai_text)
+    yield
+    AI_TEXTS.clear()
+
+
+async def fake_send_ai_text(ai_text: str, job_id: str, websocket) -> None:
+    pass
+
+
+async def create_ai_texts(viewer_count: int) -> list:
+    """This function lets a few viewers open the same job at the same time."""
+    return await asyncio.gather(
+        *(
+            openai_interfacing.create_ai_text(
+                JOB_DETAILS, "job", fake_deadline_connection(), fake_websocket()
+            )
+            for _ in range(viewer_count)
+        ),
+        return_exceptions=True,
+    )
+
+
+def test_concurrent_viewers_share_a_single_request(clean_ai_texts, monkeypatch):
+    requests = fake_openai(store_text=True)
+    monkeypatch.setattr(openai_interfacing, "send_ai_text", requests.send_ai_text)
+
+    results = asyncio.run(create_ai_texts(3))
+
+    assert results == [None, None, None]
+    assert requests.requests == 1
+    assert openai_interfacing.GENERATING == {}
+
+
+def test_waiters_take_turns_after_a_fallback(clean_ai_texts, monkeypatch):
+    requests = fake_openai(store_text=False)
+    monkeypatch.setattr(openai_interfacing, "send_ai_text", requests.send_ai_text)
+
+    results = asyncio.run(create_ai_texts(3))
+
+    assert results == [None, None, None]
+    assert requests.most_running == 1
+    assert openai_interfacing.GENERATING == {}
+
+
+def test_cancelled_writer_hands_over_to_a_waiter(clean_ai_texts, monkeypatch):
+    requests = fake_openai(store_text=True)
+    monkeypatch.setattr(openai_interfacing, "send_ai_text", requests.send_ai_text)
+
+    async def run():
+        writer = asyncio.create_task(
+            openai_interfacing.create_ai_text(
+                JOB_DETAILS, "job", fake_deadline_connection(), fake_websocket()
+            )
+        )
+        await asyncio.sleep(0)
+        waiter = asyncio.create_task(
+            openai_interfacing.create_ai_text(
+                JOB_DETAILS, "job", fake_deadline_connection(), fake_websocket()
+            )
+        )
+        await asyncio.sleep(0)
+        writer.cancel()
+        await asyncio.gather(writer, return_exceptions=True)
+        await asyncio.wait_for(waiter, 1)
+
+    asyncio.run(run())
+
+    assert AI_TEXTS["job"] == {"running_successfully": "Looking good."}
+    assert openai_interfacing.GENERATING == {}
@@ -0,0 +1,100 @@
+"""Tests for the per-connection outbound queues."""
+
+import asyncio
+
+import pytest
+from websockets.exceptions import ConnectionClosedError
+
+import outbound_queue as outbound_queue_module
+from outbound_queue import outbound_queue
+
+MESSAGE = "x" * 10
+POLICY_VIOLATION = 1008
+
+
+class blocked_websocket:
+    """Class for a websocket that only sends once it's unblocked."""
+
+    def __init__(self) -> None:
+        self.sent_messages = []
+        self.unblocked = asyncio.Event()
+        self.close_code = None
+
+    async def send(self, message: str) -> None:
+        await self.unblocked.wait()
+        self.sent_messages.append(message)
+
+    async def close(self, code: int, reason: str) -> None:
+        self.close_code = code
+
+
+@pytest.fixture(autouse=True)
+def small_watermarks(monkeypatch):
+    monkeypatch.setattr(outbound_queue_module, "OUTBOUND_HIGH_WATERMARK", 35)
+    monkeypatch.setattr(outbound_queue_module, "OUTBOUND_LOW_WATERMARK", 15)
+    monkeypatch.setattr(outbound_queue_module, "OUTBOUND_MAX_SIZE", 100)
+
+
+def test_slow_client_gets_a_snapshot_instead_of_every_update():
+    async def run():
+        websocket = blocked_websocket()
+        queue = outbound_queue(websocket)
+
+        # The writer takes the preview and waits for the client.
+        await queue.send("preview")
+        await asyncio.sleep(0)
+        for tick in range(4):
+            queue.send_update("jobs", [f"update{tick:04}"], lambda: ["snapshot01"])
+        assert not queue.slow
+
+        queue.send_update("jobs", ["update0004"], lambda: ["snapshot02"])
+        assert queue.slow
+        assert [message for _, message in queue.messages] == ["snapshot02"]
+
+        queue.send_update("jobs", ["update0005"], lambda: ["snapshot03"])
+        assert [message for _, message in queue.messages] == ["snapshot03"]
+
+        websocket.unblocked.set()
+        await asyncio.sleep(0.01)
+        assert not queue.slow
+
+        queue.send_update("jobs", ["update0006"], lambda: ["snapshot04"])
+        await asyncio.sleep(0.01)
+        assert websocket.sent_messages == ["preview", "snapshot03", "update0006"]
+        assert queue.queued_bytes == 0
+        queue.close()
+
+    asyncio.run(run())
+
+
+def test_client_is_dropped_when_its_queue_is_full():
+    async def run():
+        queue = outbound_queue(blocked_websocket())
+
+        for _ in range(10):
+            await queue.send(MESSAGE)
+        with pytest.raises(ConnectionClosedError):
+            await queue.send(MESSAGE)
+
+        assert queue.closed
+        assert queue.queued_bytes == 0
+        with pytest.raises(ConnectionClosedError):
+            queue.send_update("jobs", [MESSAGE], lambda: [MESSAGE])
+
+    asyncio.run(run())
+
+
+def test_stalled_client_is_disconnected(monkeypatch):
+    monkeypatch.setattr(outbound_queue_module, "OUTBOUND_STALL_TIMEOUT", 0.01)
+
+    async def run():
+        websocket = blocked_websocket()
+        queue = outbound_queue(websocket)
+
+        await queue.send(MESSAGE)
+        await asyncio.wait_for(queue.writer, 1)
+
+        assert queue.closed
+        assert websocket.close_code == POLICY_VIOLATION
+
+    asyncio.run(run())
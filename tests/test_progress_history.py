@@ -0,0 +1,111 @@
+"""Tests for the progress history of jobs."""
+
+from itertools import pairwise
+
+import pytest
+
+import progress_history
+from progress_history import (
+    CHART_POINTS,
+    get_progress_history,
+    progress_ring,
+    record_job_progress,
+)
+
+JOB_TASKS = 5000
+SAMPLE_INTERVAL = 10
+LAST_COMPLETED = 1079
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Replaces the time of the progress history with one the test sets,
+    and starts without any histories."""
+    now = [1_000_000.0]
+    monkeypatch.setattr(progress_history, "time", lambda: now[0])
+    monkeypatch.setattr(progress_history, "PROGRESS_HISTORIES", {})
+    monkeypatch.setattr(progress_history, "CHARTS", {})
+    return now
+
+
+def get_active_job(completed: int) -> dict:
+    """This function returns a job like the active job list has it."""
+    return {
+        "CompletedChunks": completed,
+        "RenderingChunks": 4,
+        "QueuedChunks": JOB_TASKS - completed - 4,
+        "FailedChunks": 0,
+    }
+
+
+def test_ring_overwrites_the_oldest_samples():
+    ring = progress_ring(size=4)
+    for sample in range(6):
+        ring.add_sample(float(sample), sample, 0, 0)
+
+    times, completed, _, _ = ring.get_samples(since=0.5)
+
+    assert times.tolist() == [2.0, 3.0, 4.0, 5.0]
+    assert completed.tolist() == [2, 3, 4, 5]
+    assert ring.get_samples(since=3.0)[0].tolist() == [4.0, 5.0]
+    assert ring.get_last_time() == times[-1]
+
+
+def test_chart_is_downsampled_to_the_last_sample_per_point(clock):
+    start = clock[0]
+    for sample in range(LAST_COMPLETED + 1):
+        clock[0] = start + sample * SAMPLE_INTERVAL
+        record_job_progress({"job": get_active_job(sample)})
+
+    chart = get_progress_history("job", "3h")
+    point_length = progress_history.CHART_WINDOWS["3h"] // CHART_POINTS
+
+    assert len(chart["times"]) == CHART_POINTS
+    assert chart["times"][-1] == round(clock[0])
+    # The newest sample ends the window, so it's part of the last point.
+    assert {later - earlier for earlier, later in pairwise(chart["times"][:-1])} == {
+        point_length
+    }
+    assert chart["completed"][-1] == LAST_COMPLETED
+    assert chart["total"] == JOB_TASKS
+    assert chart["tasks_per_minute"] == pytest.approx(60 / SAMPLE_INTERVAL)
+    assert chart["eta_seconds"] == (JOB_TASKS - LAST_COMPLETED) * SAMPLE_INTERVAL
+
+
+def test_samples_are_taken_at_most_once_per_interval(clock):
+    record_job_progress({"job": get_active_job(1)})
+    clock[0] += 1
+    record_job_progress({"job": get_active_job(2)})
+
+    chart = get_progress_history("job", "1h")
+
+    assert chart["completed"] == [1]
+    assert chart["eta_seconds"] is None
+
+
+def test_charts_are_cached_until_the_next_sample(clock):
+    record_job_progress({"job": get_active_job(1)})
+    chart = get_progress_history("job", "3h")
+
+    assert get_progress_history("job", "3h") is chart
+
+    clock[0] += 600
+    record_job_progress({"job": get_active_job(2)})
+
+    assert get_progress_history("job", "3h")["completed"] == [1, 2]
+
+
+def test_finished_jobs_are_forgotten_once_their_samples_are_outdated(clock):
+    record_job_progress({"job": get_active_job(1)})
+    clock[0] += 60
+    record_job_progress({})
+
+    assert "job" in progress_history.PROGRESS_HISTORIES
+
+    clock[0] += (
+        progress_history.PROGRESS_SAMPLE_INTERVAL
+        * progress_history.PROGRESS_HISTORY_SIZE
+    )
+    record_job_progress({})
+
+    assert get_progress_history("job", "1h")["times"] == []
@@ -0,0 +1,47 @@
+"""Tests for storing job tasks as columns."""
+
+from task_store import job_task_table
+
+
+def get_job_tasks(progress: list, errors: list | None = None) -> dict:
+    """This function returns a GetJobTasks response with a task per progress."""
+    errors = errors or [0] * len(progress)
+    return {
+        "Tasks": [
+            {
+                "TaskID": task_id,
+                "Frames": f"{task_id}-{task_id}",
+                "Errs": errs,
+                "Prog": prog,
+            }
+            for task_id, (prog, errs) in enumerate(zip(progress, errors, strict=True))
+        ]
+    }
+
+
+def test_tasks_come_back_like_deadline_sent_them():
+    job_tasks = get_job_tasks(["100 %", "45 %", "0 %"])
+
+    assert job_task_table.from_tasks(job_tasks).to_list() == job_tasks["Tasks"]
+
+
+def test_only_changed_rows_are_returned():
+    previous_table = job_task_table.from_tasks(get_job_tasks(["100 %", "45 %", "0 %"]))
+    table = job_task_table.from_tasks(
+        get_job_tasks(["100 %", "60 %", "0 %"], [0, 0, 2])
+    )
+
+    assert table.get_changed_rows(previous_table) == {
+        "1": {"TaskID": 1, "Frames": "1-1", "Errs": 0, "Prog": "60 %"},
+        "2": {"TaskID": 2, "Frames": "2-2", "Errs": 2, "Prog": "0 %"},
+    }
+    assert table.get_changed_rows(table) == {}
+    assert table.get_first_task_id_with_errors() == len(table) - 1
+
+
+def test_resubmitted_tasks_are_sent_whole():
+    previous_table = job_task_table.from_tasks(get_job_tasks(["100 %", "45 %"]))
+    table = job_task_table.from_tasks(get_job_tasks(["0 %", "0 %", "0 %"]))
+
+    assert table.get_changed_rows(previous_table) == table.to_list()
+    assert table.get_first_task_id_with_errors() is None
@@ -0,0 +1,143 @@
+"""Tests for handling client messages."""
+
+import asyncio
+
+import pytest
+from websockets.exceptions import ConnectionClosedOK
+
+import websocket_handler
+from DeadlineConnect import WebServiceConnectionError
+from metrics import GAUGE_FUNCTIONS
+from task_store import job_task_table
+from websocket_handler import (
+    CONNECTED_CLIENTS,
+    MESSAGE_TYPES,
+    get_message_type,
+    get_versioned_message,
+    websocket_connection,
+    websocket_connection_handler,
+)
+
+
+@pytest.mark.parametrize("message_type", MESSAGE_TYPES)
+def test_handled_messages_keep_their_type(message_type):
+    assert get_message_type({"body": message_type}) == message_type
+
+
+@pytest.mark.parametrize(
+    "message",
+    [
+        {"body": 'get_jobs"} 1\nfake_metric 1'},
+        {"body": "get_job_details_0001"},
+        {"body": ["get_active_jobs"]},
+        {"jobId": "job"},
+        ["get_active_jobs"],
+        "get_active_jobs",
+    ],
+)
+def test_other_messages_are_unknown(message):
+    assert get_message_type(message) == "unknown"
+
+
+class scripted_websocket:
+    """Class for a client that sends the given messages and then disconnects,
+    or fails with the given error."""
+
+    def __init__(self, messages: list, error: Exception) -> None:
+        self.messages = list(messages)
+        self.error = error
+        self.sent_messages = []
+
+    async def recv(self) -> str:
+        await asyncio.sleep(0)
+        if not self.messages:
+            raise self.error
+
+        return self.messages.pop(0)
+
+    async def send(self, message: str) -> None:
+        self.sent_messages.append(message)
+
+    async def close(self, code: int, reason: str) -> None:
+        pass
+
+
+def run_handler(websocket: scripted_websocket) -> websocket_connection:
+    """This function runs the connection handler until it's done, and returns
+    the connection data it stored for the client."""
+    stored_connections = []
+
+    async def run():
+        handler = asyncio.create_task(websocket_connection_handler(websocket))
+        await asyncio.sleep(0)
+        stored_connections.extend(CONNECTED_CLIENTS.values())
+        await asyncio.gather(handler, return_exceptions=True)
+        await asyncio.sleep(0)
+
+    asyncio.run(run())
+    return stored_connections[0]
+
+
+@pytest.mark.parametrize(
+    "error", [ConnectionClosedOK(None, None), RuntimeError("receive failed")]
+)
+def test_connection_is_cleaned_up_after_a_bad_message(error):
+    websocket = scripted_websocket(
+        [
+            '{"body": "get_progress_history"}',
+            "not json",
+            '{"body": "get_job_details", "jobId": "undefined"}',
+        ],
+        error,
+    )
+
+    connection_data = run_handler(websocket)
+
+    assert not connection_data.connected
+    assert connection_data.update_task.cancelled()
+    assert CONNECTED_CLIENTS == {}
+    assert websocket.sent_messages == []
+
+
+def test_gauges_drop_clients_whose_handler_failed(monkeypatch):
+    async def get_jobs(data_type: str) -> dict:
+        raise WebServiceConnectionError("The Web Service is down.")
+
+    monkeypatch.setattr(websocket_handler.DEADLINE_CONNECTION, "get_jobs", get_jobs)
+    websocket = scripted_websocket(
+        ['{"body": "get_active_jobs"}'], RuntimeError("receive failed")
+    )
+
+    connection_data = run_handler(websocket)
+
+    assert connection_data.subscribed_updates == ["active_jobs"]
+    assert GAUGE_FUNCTIONS["connected_clients"]() == 0
+    assert GAUGE_FUNCTIONS["subscriptions"]() == {}
+
+
+@pytest.mark.parametrize("row_updates", [True, False])
+def test_only_clients_with_versions_get_changed_task_rows(monkeypatch, row_updates):
+    tasks = job_task_table.from_tasks(
+        {"Tasks": [{"TaskID": 0, "Frames": "1-1", "Errs": 0, "Prog": "100 %"}]}
+    )
+    differences = {"job": {"Stat": 1}, "tasks": {"0": tasks.get_row(0)}}
+    monkeypatch.setattr(
+        websocket_handler.DEADLINE_CONNECTION,
+        "get_differences_since_version",
+        lambda data_type, version, job_id: differences,
+    )
+    monkeypatch.setattr(
+        websocket_handler.DEADLINE_CONNECTION, "get_version", lambda *_: 2
+    )
+    monkeypatch.setattr(
+        websocket_handler.DEADLINE_CONNECTION, "is_stale", lambda *_: False
+    )
+
+    message = get_versioned_message(
+        "job_details", {"job": {}, "tasks": tasks}, 1, "job", row_updates
+    )
+
+    assert message["update"]
+    assert message["data"]["job"] == {"Stat": 1}
+    assert message["data"]["tasks"] == (differences["tasks"] if row_updates else tasks)
+    assert differences["tasks"] == {"0": tasks.get_row(0)}
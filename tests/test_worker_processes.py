@@ -0,0 +1,93 @@
+"""Tests for how worker processes talk to their leader."""
+
+import asyncio
+import pickle
+from itertools import count
+from struct import pack
+
+import pytest
+
+from worker_processes import shared_deadline_connection
+
+
+class fake_writer:
+    """Class that takes the place of the Unix socket writer to the leader."""
+
+    def __init__(self) -> None:
+        self.frames = []
+
+    def write(self, data: bytes) -> None:
+        self.frames.append(pickle.loads(data[4:]))
+
+    async def drain(self) -> None:
+        pass
+
+
+def get_frame(message: dict) -> bytes:
+    """This function packs a message like the leader sends it."""
+    data = pickle.dumps(message)
+    return pack(">I", len(data)) + data
+
+
+def get_worker_connection() -> shared_deadline_connection:
+    """This function returns a worker connection that talks to fakes."""
+    connection = shared_deadline_connection()
+    connection.pending_calls = {}
+    connection.call_ids = count()
+    connection.write_lock = asyncio.Lock()
+    connection.reader = asyncio.StreamReader()
+    connection.writer = fake_writer()
+    return connection
+
+
+def test_reply_for_cancelled_call_does_not_stop_the_reader():
+    async def run():
+        connection = get_worker_connection()
+        reader_task = asyncio.create_task(connection.read_from_leader())
+
+        cancelled_call = asyncio.create_task(
+            connection.call_leader("get_task_image_path", "job", 1)
+        )
+        await asyncio.sleep(0)
+        cancelled_call.cancel()
+        await asyncio.gather(cancelled_call, return_exceptions=True)
+        assert connection.pending_calls == {}
+
+        connection.reader.feed_data(
+            get_frame({"kind": "reply", "id": 0, "result": "too late"})
+        )
+
+        answered_call = asyncio.create_task(
+            connection.call_leader("get_task_image_path", "job", 2)
+        )
+        await asyncio.sleep(0)
+        connection.reader.feed_data(
+            get_frame({"kind": "reply", "id": 1, "result": "frame.exr"})
+        )
+
+        assert await asyncio.wait_for(answered_call, 1) == "frame.exr"
+        assert not reader_task.done()
+        reader_task.cancel()
+
+    asyncio.run(run())
+
+
+def test_bad_message_does_not_stop_the_reader():
+    async def run():
+        connection = get_worker_connection()
+        reader_task = asyncio.create_task(connection.read_from_leader())
+
+        connection.reader.feed_data(get_frame({"kind": "jobs"}))
+        call = asyncio.create_task(connection.call_leader("get_stored_ai_text"))
+        await asyncio.sleep(0)
+        connection.reader.feed_data(
+            get_frame({"kind": "reply", "id": 0, "error": KeyError("job")})
+        )
+
+        with pytest.raises(KeyError):
+            await asyncio.wait_for(call, 1)
+
+        assert not reader_task.done()
+        reader_task.cancel()
+
+    asyncio.run(run())